@@ -0,0 +1,133 @@
+"""
+Micro-benchmark of the peds 'ss' and 'equivalent' cell normalization.
+
+Each identifier in the shipped ped_init_lut.csv gets an 'ss' cell and an
+'equivalent' cell covering the value shapes found in peds workbooks. The
+cells are normalized with the string pattern code the parser used before
+the dispatch tables (legacy) and with mcw_readers.interfaces.normalize.
+
+usage: python benchmarks/bench_normalize.py [--repeat N]
+"""
+
+import re
+import random
+import argparse
+import timeit
+
+from collections import namedtuple
+
+try:
+    import importlib.resources as pkg_resources
+except ImportError:
+    import importlib_resources as pkg_resources
+
+import pandas as pd
+
+from mcw_readers import data
+from mcw_readers.interfaces.normalize import (
+    T_NUMBER_FORMAT, normalize_ss_cell, normalize_equivalent_cell)
+
+cell = namedtuple('cell', 'value data_type number_format')
+
+SS_VALUES = [
+    (104, 'n', 'General'),
+    (12, 'n', 'General'),
+    (45, 'n', T_NUMBER_FORMAT),
+    ('T 45', 's', 'General'),
+    ('T>60', 's', 'General'),
+    ('<5', 's', 'General'),
+    ('> 12', 's', 'General'),
+    ('45 ', 's', T_NUMBER_FORMAT),
+    ('see notes', 's', 'General'),
+]
+
+EQUIVALENT_VALUES = [
+    (7.5, 'n', 'General'),
+    ('<5:0', 's', 'General'),
+    ('5-6', 's', 'General'),
+    ('5:3', 's', 'General'),
+    ('5:3-6:0', 's', 'General'),
+    ('see notes', 's', 'General'),
+]
+
+def legacy_ss(c):
+    value = c.value
+    if c.data_type == 'n':
+        if c.number_format == T_NUMBER_FORMAT:
+            return 't_score', value
+        return 'classify', value
+    elif c.data_type == 's':
+        if c.number_format == T_NUMBER_FORMAT:
+            return 't_score', float(re.sub('[<>]?[ ]*', '', value.strip()))
+        elif re.fullmatch('T[ ]*[>]?\\d+', value):
+            return 't_score', float(re.sub('T[ ]*[>]?', '', value))
+        elif re.fullmatch('[<>][ ]?\\d+', value):
+            return 'classify', float(re.sub('[<>][ ]?', '', value))
+        return 'keep', value
+    return 'none', None
+
+def legacy_equivalent(c):
+    value = c.value
+    if c.data_type == 's':
+        if re.match('[<>]', value):
+            return value, None, None
+        elif re.fullmatch('\\d+-\\d+', value):
+            return value, None, None
+        elif re.fullmatch('\\d+:\\d+', value):
+            m = re.fullmatch('(\\d+):(\\d+)', value)
+            return None, float(m.group(1)) * 12 + float(m.group(2)), None
+        elif re.fullmatch('\\d+:\\d+-\\d+:\\d+', value):
+            m = re.fullmatch('(\\d+):(\\d+)-(\\d+):(\\d+)', value)
+            return (None,
+                    float(m.group(1)) * 12 + float(m.group(2)),
+                    float(m.group(3)) * 12 + float(m.group(4)))
+        return None
+    elif c.data_type == 'n':
+        return None, float(value), None
+    return None
+
+def get_cells(seed=0):
+    """Returns 'ss' and 'equivalent' cells for each ped_init_lut identifier"""
+
+    with pkg_resources.path(data, 'ped_init_lut.csv') as data_file:
+        identifiers = pd.read_csv(data_file.as_posix())['identifier']
+
+    rng = random.Random(seed)
+    ss_cells = [cell(*rng.choice(SS_VALUES)) for _ in identifiers]
+    equivalent_cells = [cell(*rng.choice(EQUIVALENT_VALUES)) for _ in identifiers]
+
+    return ss_cells, equivalent_cells
+
+def run(ss_cells, equivalent_cells, ss, equivalent):
+    for c in ss_cells:
+        ss(c)
+    for c in equivalent_cells:
+        equivalent(c)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='passes over the identifiers per timing')
+    args = parser.parse_args()
+
+    ss_cells, equivalent_cells = get_cells()
+
+    assert [legacy_ss(c) for c in ss_cells] == [normalize_ss_cell(c) for c in ss_cells]
+    assert ([legacy_equivalent(c) for c in equivalent_cells] ==
+            [normalize_equivalent_cell(c) for c in equivalent_cells])
+
+    timings = {}
+    for name, ss, equivalent in [
+            ('legacy', legacy_ss, legacy_equivalent),
+            ('dispatch', normalize_ss_cell, normalize_equivalent_cell)]:
+        timings[name] = min(timeit.repeat(
+            lambda: run(ss_cells, equivalent_cells, ss, equivalent),
+            number=args.repeat, repeat=5))
+
+    n_cells = (len(ss_cells) + len(equivalent_cells)) * args.repeat
+    for name, seconds in timings.items():
+        print(f'{name:>8}: {seconds:.3f} s, {seconds / n_cells * 1e9:.0f} ns/cell')
+    print(f' speedup: {timings["legacy"] / timings["dispatch"]:.2f}x')
+
+if __name__ == '__main__':
+    main()
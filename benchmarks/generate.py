@@ -0,0 +1,297 @@
+"""
+Synthetic Neuroscore workbook generator for the benchmarks.
+
+The Template sheets are laid out from the shipped init_epilepsy_lut.csv and
+ped_init_lut.csv identifiers: each identifier level is an indent, a few rows
+are hidden, '*' footnotes are mixed in, the data columns sit under a 'Raw'
+anchor and some score cells use the T score number format. Epilepsy sheets
+have 1-3 exam column groups. No patient data is involved.
+
+usage: python benchmarks/generate.py OUT_DIR [--epilepsy N] [--peds N]
+                                            [--neuroreader N] [--seed S]
+"""
+
+import os
+import json
+import random
+import argparse
+import datetime
+
+try:
+    import importlib.resources as pkg_resources
+except ImportError:
+    import importlib_resources as pkg_resources
+
+import openpyxl
+import pandas as pd
+
+from openpyxl.styles import Alignment
+
+from generate_neuroreader import make_neuroreader_reports
+
+from mcw_readers import data
+from mcw_readers.interfaces.normalize import T_NUMBER_FORMAT
+
+CORPUS_FILE = 'corpus.json'
+
+EPILEPSY_DATA_COLS = ['raw', 'ss', 'percentile', 'notes']
+PEDS_DATA_COLS = ['raw', 'ss', 'percentile', 'equivalent', 'form', 'notes']
+PEDS_LUT_COLS = [
+    'raw',
+    'ss',
+    'percentile',
+    'sign',
+    'age_equivalent',
+    'high_equivalent',
+    'developmental_quotient',
+    'form',
+    'notes',
+]
+
+def read_init_lut(fname):
+    """Returns the shipped init lut fname as a DataFrame"""
+
+    with pkg_resources.path(data, fname) as data_file:
+        return pd.read_csv(data_file.as_posix())
+
+def _add_line(sh, row, col, identifier, rng, hidden_frac):
+    """Writes the indented last level of identifier at row, col"""
+
+    parts = identifier.split(' | ')
+    cell = sh.cell(row=row, column=col, value=parts[-1])
+    cell.alignment = Alignment(indent=len(parts) - 1)
+
+    if rng.random() < hidden_frac:
+        sh.row_dimensions[row].hidden = True
+
+def _score(rng, col):
+    """Returns a plausible score cell value and number format"""
+
+    if col == 'raw':
+        return rng.randint(0, 80), None
+    elif col == 'ss':
+        kind = rng.random()
+        if kind < 0.15:
+            return rng.randint(20, 80), T_NUMBER_FORMAT
+        elif kind < 0.2:
+            return f'T {rng.randint(20, 80)}', None
+        return rng.choice([rng.randint(1, 19), rng.randint(55, 145)]), None
+    elif col == 'percentile':
+        return rng.choice([1, 2, 5, 9, 16, 25, 37, 50, 63, 75, 84, 91, 95]), None
+    elif col == 'equivalent':
+        return rng.choice([f'{rng.randint(3, 17)}:{rng.randint(0, 11)}',
+                           f'<{rng.randint(3, 6)}:0', 7.5]), None
+
+    return rng.choice(['', 'admin note', 'discontinued']), None
+
+def make_epilepsy_workbook(path, seed=0, n_exams=2, hidden_frac=0.05,
+                           blank_frac=0.3, footnote_frac=0.02):
+    """
+    Writes a synthetic epilepsy Neuroscore workbook to path.
+
+    Parameters
+    ----------
+
+    path : str
+        the output xlsx
+    seed : int
+        the random seed
+    n_exams : int
+        the number of exam column groups (1-3)
+    hidden_frac, blank_frac, footnote_frac : float
+        the fraction of hidden lines, lines without scores and footnotes
+    """
+
+    rng = random.Random(seed)
+    lines = read_init_lut('init_epilepsy_lut.csv')
+
+    wb = openpyxl.Workbook()
+    sh = wb.active
+    sh.title = 'Template'
+    wb.create_sheet('Summary')['A1'] = 'Summary'
+
+    sh['B2'] = 'MRN:'
+    sh['C2'] = 1000000 + seed
+    sh['B4'] = 'Provider:'
+    sh['C4'] = 'Provider'
+    for tp in range(n_exams):
+        sh.cell(row=9, column=5 + 4 * tp,
+                value=datetime.datetime(2015 + tp, rng.randint(1, 12), 1))
+        sh.cell(row=11, column=3 + 4 * tp,
+                value=f'Age: {rng.randint(18, 80)}, Edu: {rng.randint(8, 20)}')
+        for j, name in enumerate(['Raw', 'SS', '%tile', 'Notes']):
+            sh.cell(row=13, column=3 + 4 * tp + j, value=name)
+
+    row = 15
+    for identifier in lines['identifier']:
+        _add_line(sh, row, 2, identifier, rng, hidden_frac)
+        if rng.random() > blank_frac:
+            for tp in range(n_exams):
+                for j, col in enumerate(EPILEPSY_DATA_COLS):
+                    value, number_format = _score(rng, col)
+                    if value == '':
+                        continue
+                    cell = sh.cell(row=row, column=3 + 4 * tp + j, value=value)
+                    if number_format:
+                        cell.number_format = number_format
+        row += 1
+
+        if rng.random() < footnote_frac:
+            sh.cell(row=row, column=2, value='* norms from the manual')
+            row += 1
+
+    wb.save(path)
+
+def make_peds_workbook(path, seed=0, hidden_frac=0.05, blank_frac=0.3,
+                       footnote_frac=0.02):
+    """
+    Writes a synthetic peds Neuroscore workbook to path.
+
+    The parameters are as in make_epilepsy_workbook, peds sheets have a
+    single exam.
+    """
+
+    rng = random.Random(seed)
+    lines = read_init_lut('ped_init_lut.csv')
+
+    wb = openpyxl.Workbook()
+    sh = wb.active
+    sh.title = 'Template'
+
+    header = [
+        ('MRN:', 1000000 + seed),
+        ('DOE:', datetime.datetime(2020, rng.randint(1, 12), 1)),
+        ('DOB:', datetime.datetime(2010, rng.randint(1, 12), 1)),
+        ('Yrs:', rng.randint(4, 17)),
+        ('Mo:', rng.randint(0, 11)),
+        ('D:', rng.randint(0, 28)),
+        ('Gender:', rng.choice(['M', 'F'])),
+        ('Handedness:', rng.choice(['R', 'L'])),
+    ]
+    for n, (label, value) in enumerate(header):
+        sh.cell(row=2 + n // 4, column=2 + 3 * (n % 4), value=label)
+        sh.cell(row=2 + n // 4, column=3 + 3 * (n % 4), value=value)
+
+    for j, name in enumerate(['Raw', 'SS', '%tile', 'Equivalent', 'Form',
+                              'Notes']):
+        sh.cell(row=6, column=4 + j, value=name)
+
+    row = 8
+    for identifier in lines['identifier']:
+        _add_line(sh, row, 3, identifier, rng, hidden_frac)
+        if rng.random() > blank_frac:
+            for j, col in enumerate(PEDS_DATA_COLS):
+                value, number_format = _score(rng, col)
+                if value == '':
+                    continue
+                cell = sh.cell(row=row, column=4 + j, value=value)
+                if number_format:
+                    cell.number_format = number_format
+        row += 1
+
+        if rng.random() < footnote_frac:
+            sh.cell(row=row, column=3, value='* norms from the manual')
+            row += 1
+
+    wb.save(path)
+
+def make_peds_lut(path):
+    """Writes a peds lut csv naming a redcap variable for every line"""
+
+    lines = read_init_lut('ped_init_lut.csv')
+    for col in PEDS_LUT_COLS:
+        lines[col] = [f'v{n}_{col}' for n in range(len(lines))]
+
+    lines.to_csv(path, index=False)
+
+def make_corpus(out_dir, n_epilepsy=4, n_peds=4, seed=0, n_neuroreader=8):
+    """
+    Writes a synthetic corpus to out_dir.
+
+    Returns
+    -------
+
+    corpus : dict
+        params   -> the n_epilepsy, n_peds, n_neuroreader and seed arguments
+        dir      -> out_dir
+        epilepsy -> list of epilepsy workbooks
+        n_exams  -> list of the number of exams in each epilepsy workbook
+        peds     -> list of peds workbooks
+        spec     -> the parse_epilepsy_neuroscore spec for the epilepsy
+                    workbooks, one row for each exam
+        peds_lut -> the peds lut csv
+        neuroreader -> list of neuroreader reports, see
+                       generate_neuroreader.py
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+
+    corpus = {
+        'params': {'epilepsy': n_epilepsy, 'peds': n_peds, 
+                   'neuroreader': n_neuroreader, 'seed': seed},
+        'dir': out_dir,
+        'epilepsy': [],
+        'n_exams': [],
+        'peds': [],
+    }
+    spec = []
+    for n in range(n_epilepsy):
+        path = os.path.join(out_dir, f'epilepsy_{n}.xlsx')
+        n_exams = rng.randint(1, 3)
+        make_epilepsy_workbook(path, seed=seed + n, n_exams=n_exams)
+        corpus['epilepsy'].append(path)
+        corpus['n_exams'].append(n_exams)
+        for tp in range(min(n_exams, 2)):
+            spec.append((100 + n, tp + 1, os.path.abspath(path), 'AB'[tp]))
+
+    for n in range(n_peds):
+        path = os.path.join(out_dir, f'peds_{n}.xlsx')
+        make_peds_workbook(path, seed=seed + n)
+        corpus['peds'].append(path)
+
+    corpus['spec'] = os.path.join(out_dir, 'spec.tsv')
+    pd.DataFrame(spec, columns=['record_id', 'redcap_repeat_instance',
+                                'neuroscore', 'exam']).to_csv(
+        corpus['spec'], sep='\t', index=False)
+
+    corpus['peds_lut'] = os.path.join(out_dir, 'peds_lut.csv')
+    make_peds_lut(corpus['peds_lut'])
+
+    corpus['neuroreader'] = make_neuroreader_reports(
+        os.path.join(out_dir, 'neuroreader'), n_neuroreader, seed=seed)
+
+    with open(os.path.join(out_dir, CORPUS_FILE), 'w') as f:
+        json.dump(corpus, f, indent=2)
+
+    return corpus
+
+def load_corpus(out_dir):
+    """Returns the corpus written to out_dir, None if there is none"""
+
+    try:
+        with open(os.path.join(out_dir, CORPUS_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('out_dir', help='the output directory')
+    parser.add_argument('--epilepsy', type=int, default=4,
+                        help='the number of epilepsy workbooks')
+    parser.add_argument('--peds', type=int, default=4,
+                        help='the number of peds workbooks')
+    parser.add_argument('--neuroreader', type=int, default=8,
+                        help='the number of neuroreader reports')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed')
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.out_dir, args.epilepsy, args.peds, args.seed,
+                         args.neuroreader)
+    print(f'Wrote {len(corpus["epilepsy"])} epilepsy and '
+          f'{len(corpus["peds"])} peds workbooks and '
+          f'{len(corpus["neuroreader"])} neuroreader reports to {args.out_dir}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Synthetic Neuroreader report generator for the benchmarks.
+
+Each report is a minimal PDF laid out the way parse_text reads Neuroreader
+volumetry reports: the header fields, the mTIV sentence, the hippocampal
+asymmetry results and the version on page 1, the volume table on page 2,
+and appendix pages of text that the parser does not need. Every token is
+drawn with its own Tj operator, so PyPDF4 extracts one token per line. No
+patient data is involved.
+
+usage: python benchmarks/generate_neuroreader.py OUT_DIR [--n N]
+                                                 [--appendix-pages N] [--seed S]
+"""
+
+import os
+import random
+import argparse
+
+from mcw_readers.parsers.neuroreader import (
+    NR_HEADER_MAPPER, NR_RESULTS_MAPPER, NR_TABLE_MAPPER)
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace('(', '\\(')
+            .replace(')', '\\)'))
+
+def _content(tokens):
+    lines = ['BT', '/F1 8 Tf', '36 756 Td']
+    for token in tokens:
+        lines.append(f'({_escape(token)}) Tj 0 -12 Td')
+    lines.append('ET')
+
+    return '\n'.join(lines).encode('latin-1')
+
+def write_pdf(path, pages, info=None):
+    """
+    Writes a PDF with one page per token list in pages.
+
+    info is the document information dict, for example
+    {'Producer': 'Neuroreader'}.
+    """
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+
+    kids = []
+    for tokens in pages:
+        content = _content(tokens)
+        objects.append(b'<< /Length %d >>\nstream\n' % len(content) +
+                       content + b'\nendstream')
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+            % (len(objects)))
+        kids.append(len(objects))
+
+    objects[1] = (b'<< /Type /Pages /Kids [%s] /Count %d >>' %
+                  (b' '.join(b'%d 0 R' % x for x in kids), len(kids)))
+
+    info = info or {}
+    objects.append(b'<< ' + b' '.join(
+        b'/%s (%s)' % (key.encode(), _escape(value).encode('latin-1'))
+        for key, value in info.items()) + b' >>')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for n, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % n + obj + b'\nendobj\n'
+
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += (b'trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\n'
+            b'startxref\n%d\n%%%%EOF\n' % (len(objects) + 1, len(objects), xref))
+
+    with open(path, 'wb') as f:
+        f.write(out)
+
+def get_report_pages(rng, appendix_pages=2, appendix_tokens=2000):
+    """Returns the token lists of the pages of a synthetic report"""
+
+    header = {
+        'Image ID': f'NR_2020{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}'
+                    f'{rng.randint(0, 23):02d}3000_{rng.randint(1000, 9999)}',
+        'Group name': 'Epilepsy',
+        'Study ID': str(rng.randint(1000, 9999)),
+        'Clinical Image ID': str(rng.randint(10000, 99999)),
+        'Patient ID': str(rng.randint(1000000, 9999999)),
+        'Gender': rng.choice(['M', 'F']),
+        'Accession Number': str(rng.randint(10000000, 99999999)),
+        'Patient name': rng.choice(['DOE JANE', 'ROE RICHARD A', 'POE ANN M']),
+        'BirthDate': f'{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}-'
+                     f'{rng.randint(1940, 2005)}',
+        'Age': str(rng.randint(18, 80)),
+    }
+    assert set(header) == set(NR_HEADER_MAPPER)
+
+    page_1 = ['Neuroreader Volumetric Report']
+    for field, value in header.items():
+        page_1 += [field, value]
+    page_1.append('Results')
+    page_1.append('The measured total intracranial volume (mTIV) = '
+                  f'{rng.randint(1100, 1800)} ml.')
+    for field in NR_RESULTS_MAPPER:
+        page_1 += [field, 'Normative', 'range', ':',
+                   f'{rng.uniform(-3, 3):.2f}']
+    page_1.append(f'Neuroreader v{rng.randint(2, 4)}.{rng.randint(0, 9)}.0')
+
+    page_2 = ['Structure', 'Volume (ml)', 'Volume/TIV', 'Index', 'Z', '%']
+    for field in NR_TABLE_MAPPER:
+        page_2 += [field,
+                   f'{rng.uniform(1, 1500):.2f}',
+                   f'{rng.uniform(0, 1):.4f}',
+                   f'{rng.uniform(-3, 3):.2f}',
+                   f'{rng.uniform(-3, 3):.2f}',
+                   str(rng.randint(1, 99))]
+
+    appendix = [[f'Appendix {n} segment {i} {rng.random():.6f}'
+                 for i in range(appendix_tokens)]
+                for n in range(appendix_pages)]
+
+    return [page_1, page_2] + appendix
+
+def make_neuroreader_reports(out_dir, n=8, appendix_pages=2, seed=0):
+    """Writes n synthetic reports to out_dir and returns their paths"""
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+
+    paths = []
+    for i in range(n):
+        path = os.path.join(out_dir, f'neuroreader_{i}.pdf')
+        write_pdf(path, get_report_pages(rng, appendix_pages),
+                  info={'Producer': 'Neuroreader', 'Title': 'Report'})
+        paths.append(path)
+
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('out_dir', help='the output directory')
+    parser.add_argument('--n', type=int, default=8,
+                        help='the number of reports')
+    parser.add_argument('--appendix-pages', type=int, default=2,
+                        help='the number of appendix pages in each report')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed')
+    args = parser.parse_args()
+
+    paths = make_neuroreader_reports(args.out_dir, args.n, args.appendix_pages,
+                                     args.seed)
+    print(f'Wrote {len(paths)} neuroreader reports to {args.out_dir}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""
+Benchmark suite over a synthetic Neuroscore corpus.
+
+The corpus is written with benchmarks/generate.py into a temporary directory,
+or into --corpus where it is kept and reused while the corpus parameters are
+unchanged. Each scenario is timed --repeat times and the results are written
+as JSON, so runs against two versions of the package can be compared with
+--compare.
+
+Scenarios
+    load_workbook    openpyxl.load_workbook of each epilepsy workbook
+    load_snapshot    load_workbook and snapshot_worksheet of the Template
+                     sheet of each epilepsy workbook, the openpyxl engine
+    stream_sheet     stream_sheet of each epilepsy workbook, the stream
+                     engine; the benchmark workbooks have a single small
+                     sheet besides Template, so this is not where the
+                     stream engine gains
+    parser           neuroscore_parser of each epilepsy workbook
+    parse_lines      parse_lines of each epilepsy workbook
+    parse_data       parse_data of every exam of each epilepsy workbook
+    peds_parse_data  peds_parser.parse_data of each peds workbook
+    lut_excel        lut construction from epilepsy_lut.xlsx
+    lut_compiled     lut.load_compiled from its compiled artifact
+    cli_jobs_1       parse_epilepsy_neuroscore over the corpus spec
+    cli_jobs_N       parse_epilepsy_neuroscore over the corpus spec, --jobs N
+    slow_read_serial the corpus spec read through throttled_reader, then
+                     parsed, one workbook at a time
+    slow_read_prefetch
+                     slow_read_serial with iter_prefetched_rows, --jobs N
+    nr_parse         tokenize_pdf and parse_text of each neuroreader report
+    nr_batch_jobs_1  parse_neuroreader_batch over the reports
+    nr_batch_jobs_N  parse_neuroreader_batch over the reports, --jobs N
+    nr_cached        parse_neuroreader_batch over the reports, all cached
+    nr_cached_mtime  nr_cached finding the cache keys by mtime and size
+
+usage: python benchmarks/run.py [--out results.json] [--compare old.json]
+                                [--scenarios NAME ...] [--repeat N] [--jobs N]
+                                [--epilepsy N] [--peds N] [--neuroreader N]
+                                [--seed S] [--corpus DIR]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from datetime import datetime
+
+try:
+    import importlib.resources as pkg_resources
+except ImportError:
+    import importlib_resources as pkg_resources
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate import make_corpus, load_corpus
+
+from mcw_readers.cache import content_cache
+from mcw_readers.cli.parse_epilepsy_neuroscore import (
+    group_rows, iter_prefetched_rows, parse_file, read_spec)
+from mcw_readers.interfaces.lut import lut
+from mcw_readers.interfaces.sheet import snapshot_worksheet, stream_sheet
+from mcw_readers.interfaces.trie import identifier_trie
+from mcw_readers.interfaces.wb_parsers import neuroscore_parser, peds_parser
+from mcw_readers.parsers.neuroreader import (
+    tokenize_pdf, parse_text, parse_neuroreader_batch)
+
+RESULTS_VERSION = '1'
+
+# the read rate of the slow_read scenarios, a slow network share
+SLOW_READ_BYTES_PER_SECOND = 256 * 1024
+SLOW_READ_PREFETCH = 4
+
+def _epilepsy_lut_excel():
+    with pkg_resources.path('mcw_readers.data', 'epilepsy_lut.xlsx') as excel:
+        return str(excel)
+
+def _run_cli(spec, jobs):
+    subprocess.run(
+        [sys.executable, '-m', 'mcw_readers.cli.parse_epilepsy_neuroscore',
+         '--spec', spec, '--jobs', str(jobs), '--no-cache'],
+        check=True, stdout=subprocess.DEVNULL)
+
+def throttled_reader(bytes_per_second, chunk_size=64 * 1024):
+    """
+    Returns a read_file like reader limited to bytes_per_second.
+
+    The reader sleeps between chunks like a slow network share, so the
+    prefetching driver can be tried on local files.
+    """
+
+    def reader(fname):
+        chunks = []
+        with open(fname, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                time.sleep(len(chunk) / bytes_per_second)
+                chunks.append(chunk)
+
+        return b''.join(chunks)
+
+    return reader
+
+def get_scenarios(corpus, jobs):
+    """
+    Returns the benchmark scenarios for corpus.
+
+    Parameters
+    ----------
+
+    corpus : dict
+        the corpus written by generate.make_corpus
+    jobs : int
+        the number of processes of the cli_jobs_N scenario
+
+    Returns
+    -------
+
+    scenarios : dict
+        name -> (setup, run), setup() is called once untimed and its result
+        is passed to each timed run
+    """
+
+    excel = _epilepsy_lut_excel()
+    epilepsy = corpus['epilepsy']
+    peds = corpus['peds']
+
+    def epilepsy_parsers():
+        return [neuroscore_parser(x, verbose=False) for x in epilepsy]
+
+    def load_workbook(_):
+        for x in epilepsy:
+            openpyxl.load_workbook(x, data_only=True)
+
+    def load_snapshots(_):
+        for x in epilepsy:
+            wb = openpyxl.load_workbook(x, data_only=True)
+            snapshot_worksheet(wb['Template'])
+
+    def stream_sheets(_):
+        for x in epilepsy:
+            stream_sheet(x, 'Template')
+
+    def parse_lines(parsers):
+        for p in parsers:
+            p.trie = identifier_trie()
+            p.parse_lines(verbose=False)
+
+    def parse_data(setup):
+        epilepsy_lut, parsers = setup
+        for p, n_exams in zip(parsers, corpus['n_exams']):
+            for tp in range(1, n_exams + 1):
+                p.parse_data(epilepsy_lut, tp)
+
+    def peds_parse_data(setup):
+        peds_lut, parsers = setup
+        for p in parsers:
+            p.parse_data(peds_lut)
+
+    def compile_lut():
+        artifact = os.path.join(corpus['dir'], 'epilepsy_lut.lut.pkl')
+        lut('epilepsy', excel).compile(artifact)
+        return artifact
+
+    scenarios = {
+        'load_workbook': (None, load_workbook),
+        'load_snapshot': (None, load_snapshots),
+        'stream_sheet': (None, stream_sheets),
+        'parser': (None, lambda _: epilepsy_parsers()),
+        'parse_lines': (epilepsy_parsers, parse_lines),
+        'parse_data': (
+            lambda: (lut('epilepsy', excel), epilepsy_parsers()),
+            parse_data),
+        'peds_parse_data': (
+            lambda: (lut('peds', corpus['peds_lut']),
+                     [peds_parser(x, verbose=False) for x in peds]),
+            peds_parse_data),
+        'lut_excel': (None, lambda _: lut('epilepsy', excel)),
+        'lut_compiled': (
+            compile_lut,
+            lambda artifact: lut.load_compiled('epilepsy', excel,
+                                               artifact=artifact)),
+        'cli_jobs_1': (None, lambda _: _run_cli(corpus['spec'], 1)),
+    }
+    if jobs > 1:
+        scenarios['cli_jobs_N'] = (
+            None, lambda _: _run_cli(corpus['spec'], jobs))
+
+    slow_reader = throttled_reader(SLOW_READ_BYTES_PER_SECOND)
+
+    def slow_read_setup():
+        return lut('epilepsy', excel), list(read_spec(corpus['spec']))
+
+    def slow_read_serial(setup):
+        epilepsy_lut, rows = setup
+        for neuroscore, _, group in group_rows(rows):
+            parse_file(epilepsy_lut, neuroscore, group, 
+                       source=slow_reader(neuroscore))
+
+    def slow_read_prefetch(setup):
+        epilepsy_lut, rows = setup
+        for _ in iter_prefetched_rows(epilepsy_lut, rows, jobs, 
+                                      SLOW_READ_PREFETCH, reader=slow_reader):
+            pass
+
+    scenarios.update({
+        'slow_read_serial': (slow_read_setup, slow_read_serial),
+        'slow_read_prefetch': (slow_read_setup, slow_read_prefetch),
+    })
+
+    neuroreader = corpus['neuroreader']
+
+    def nr_cache(check_mtime):
+        def setup():
+            cache = content_cache(
+                os.path.join(corpus['dir'], 'neuroreader_cache'))
+            parse_neuroreader_batch(neuroreader, cache=cache,
+                                    check_mtime=check_mtime)
+            return cache
+        return setup
+
+    scenarios.update({
+        'nr_parse': (
+            None, 
+            lambda _: [parse_text(tokenize_pdf(x)[0]) for x in neuroreader]),
+        'nr_batch_jobs_1': (
+            None, lambda _: parse_neuroreader_batch(neuroreader)),
+        'nr_cached': (
+            nr_cache(False), 
+            lambda cache: parse_neuroreader_batch(neuroreader, cache=cache)),
+        'nr_cached_mtime': (
+            nr_cache(True),
+            lambda cache: parse_neuroreader_batch(neuroreader, cache=cache,
+                                                  check_mtime=True)),
+    })
+    if jobs > 1:
+        scenarios['nr_batch_jobs_N'] = (
+            None, lambda _: parse_neuroreader_batch(neuroreader, jobs=jobs))
+
+    return scenarios
+
+def time_scenario(setup, run, repeat):
+    """Returns the wall times in seconds of repeat calls of run"""
+
+    state = setup() if setup is not None else None
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+
+    return times
+
+def get_meta(args, corpus):
+    """Returns the environment and parameters of a run"""
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+
+    return {
+        'version': RESULTS_VERSION,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'jobs': args.jobs,
+        'corpus': corpus['params'],
+    }
+
+def compare(results, old):
+    """Prints the median time of each scenario in results against old"""
+
+    print(f'{"scenario":<16} {"old (s)":>10} {"new (s)":>10} {"ratio":>7}')
+    for name, new in results['scenarios'].items():
+        if name not in old['scenarios']:
+            continue
+        old_median = old['scenarios'][name]['median']
+        ratio = new['median'] / old_median if old_median else float('nan')
+        print(f'{name:<16} {old_median:>10.3f} {new["median"]:>10.3f} '
+              f'{ratio:>6.2f}x')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--out', default='benchmark_results.json',
+                        help='the JSON results file '
+                             '(default: benchmark_results.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare to')
+    parser.add_argument('--scenarios', nargs='+',
+                        help='only run these scenarios')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs per scenario (default: 3)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='processes in the cli_jobs_N scenario '
+                             '(default: the cpu count)')
+    parser.add_argument('--epilepsy', type=int, default=8,
+                        help='the number of epilepsy workbooks (default: 8)')
+    parser.add_argument('--peds', type=int, default=4,
+                        help='the number of peds workbooks (default: 4)')
+    parser.add_argument('--neuroreader', type=int, default=8,
+                        help='the number of neuroreader reports (default: 8)')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed')
+    parser.add_argument('--corpus',
+                        help='keep the corpus in this directory')
+    args = parser.parse_args()
+
+    if args.corpus is None:
+        corpus_dir = tempfile.mkdtemp(prefix='mcw_readers_bench_')
+    else:
+        corpus_dir = args.corpus
+
+    try:
+        params = {'epilepsy': args.epilepsy, 'peds': args.peds,
+                  'neuroreader': args.neuroreader, 'seed': args.seed}
+        corpus = load_corpus(corpus_dir)
+        if corpus is None or corpus['params'] != params:
+            corpus = make_corpus(corpus_dir, args.epilepsy, args.peds,
+                                 args.seed, args.neuroreader)
+
+        scenarios = get_scenarios(corpus, args.jobs)
+        if args.scenarios:
+            unknown = set(args.scenarios) - set(scenarios)
+            if unknown:
+                parser.error(f'unknown scenarios: {sorted(unknown)}')
+            scenarios = {x: scenarios[x] for x in args.scenarios}
+
+        results = {'meta': get_meta(args, corpus), 'scenarios': {}}
+        for name, (setup, run) in scenarios.items():
+            times = time_scenario(setup, run, args.repeat)
+            results['scenarios'][name] = {
+                'times': times,
+                'min': min(times),
+                'median': statistics.median(times),
+            }
+            print(f'{name:<16} {min(times):>8.3f} s min '
+                  f'{statistics.median(times):>8.3f} s median')
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Wrote {args.out}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
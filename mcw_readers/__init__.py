@@ -1 +1,3 @@
+import logging
 
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -0,0 +1,234 @@
+import os
+import pickle
+import hashlib
+import tempfile
+
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME',
+                                        Path.home().joinpath('.cache')),
+                         'mcw_readers')
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+def hash_file(fname, chunk_size=1024 * 1024):
+    """
+    Returns the sha256 hex digest of the bytes in fname.
+
+    fname may also be a BytesIO holding the file bytes.
+    """
+
+    sha = hashlib.sha256()
+    if hasattr(fname, 'getbuffer'):
+        sha.update(fname.getbuffer())
+        return sha.hexdigest()
+
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def atomic_write(path, data):
+    """
+    Writes the bytes data to path atomically.
+
+    data is written to a temporary file in the directory of path, which is
+    then moved into place, so readers never see a partial file. The file
+    gets the permissions of a file created with open, mkstemp alone would
+    leave it readable only by its owner.
+    """
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o666 & ~_umask())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+class content_cache():
+
+    SUFFIX = '.pkl'
+    # eviction frees space down to this fraction of max_bytes, so a full
+    # cache is not scanned again on the next put
+    EVICT_TO = 0.9
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initializes content_cache.
+
+        Parameters
+        ----------
+
+        directory : str
+            the cache directory, created if it does not exist
+        max_bytes : int
+            the size cap for all entries in directory
+
+        Description
+        -----------
+
+        Entries are pickled to directory and keyed by a hash of the source
+        file bytes and a version string, so an entry is reused only while the
+        file contents and the code producing the entry are unchanged. Reading
+        an entry touches it, and the least recently used entries are evicted
+        once the cache grows past max_bytes.
+
+        The size of the entries is scanned once here and then kept as a
+        running total, so the directory is only scanned again when a put
+        takes the total past max_bytes. Entries written by other processes
+        are counted at that scan.
+        """
+
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.size = sum(size for _, size, _ in self._entries())
+
+    def key(self, fname, version, digest=None):
+        """
+        Returns the cache key for the contents of fname and version.
+
+        digest, the sha256 of fname as returned by hash_file, is used
+        instead of reading fname when given.
+        """
+
+        if digest is None:
+            digest = hash_file(fname)
+
+        return hashlib.sha256(f'{digest}:{version}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return self.directory.joinpath(key + self.SUFFIX)
+
+    def get(self, key):
+        """Returns the entry for key, None if it is not cached"""
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            # missing and corrupt entries are both misses
+            return None
+
+        return value
+
+    def put(self, key, value):
+        """Stores value under key and evicts entries over max_bytes"""
+
+        path = self._path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        atomic_write(path, data)
+
+        self.size += len(data) - replaced
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """Returns (mtime, size, path) for each entry in the directory"""
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return entries
+
+    def evict(self):
+        """
+        Removes the least recently used entries once over max_bytes.
+
+        Entries are removed until the cache is under EVICT_TO of max_bytes.
+        """
+
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            self.size = total
+            return
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * self.EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        self.size = total
+
+class stat_index():
+
+    def __init__(self, fname):
+        """
+        Initializes stat_index.
+
+        Parameters
+        ----------
+
+        fname : str
+            the index file, read if it exists
+
+        Description
+        -----------
+
+        The index records the mtime, size and sha256 of each hashed file,
+        so a file whose mtime and size are unchanged is not read again to
+        find its cache key. A missing or corrupt index file is an empty
+        index. The index is only written by save.
+        """
+
+        self.fname = Path(fname)
+        self.entries = {}
+
+        try:
+            with open(self.fname, 'rb') as f:
+                self.entries = pickle.load(f)
+        except Exception:
+            self.entries = {}
+
+    def hash_file(self, fname):
+        """Returns the sha256 of fname, hashing it only if it changed"""
+
+        path = os.path.abspath(fname)
+        stat = os.stat(path)
+        fingerprint = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self.entries.get(path)
+        if entry is not None and entry[:2] == fingerprint:
+            return entry[2]
+
+        digest = hash_file(path)
+        self.entries[path] = fingerprint + (digest,)
+
+        return digest
+
+    def save(self):
+        """Writes the index to its file"""
+
+        self.fname.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.fname, pickle.dumps(self.entries, 
+                                              protocol=pickle.HIGHEST_PROTOCOL))
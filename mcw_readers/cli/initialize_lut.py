@@ -0,0 +1,64 @@
+import pandas as pd
+
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from mcw_readers import log
+from mcw_readers.interfaces.lut import DEPTS, initialize_corpus_lut
+
+logger = log.get_cli_logger('initialize_lut')
+
+def get_parser():
+    """get cli parse"""
+
+    parser_desc = 'build a blank lut from a corpus of neuroscore files'
+    epilog = """
+Each source is a directory (searched for *.xlsm and *.xlsx), a glob pattern
+or a neuroscore file. The output csv has the lut columns test, test_no and
+identifier, plus n_files, the number of files containing each line. Files
+that cannot be parsed are listed in <out>_failed.csv.
+"""
+
+    parser = ArgumentParser(description=parser_desc,
+                            formatter_class=RawDescriptionHelpFormatter,
+                            epilog=epilog)
+    parser.add_argument('sources', nargs='+',
+                        help='directories, glob patterns or neuroscore files')
+    parser.add_argument('--dept', action='store', required=True,
+                        choices=sorted(DEPTS),
+                        help='the department of the neuroscore files')
+    parser.add_argument('--out', action='store', required=True,
+                        help='the output lut csv')
+    parser.add_argument('--jobs', action='store', type=int, default=1,
+                        help='the number of processes extracting lines '
+                             '(default: 1)')
+    parser.add_argument('--log-json', action='store',
+                        help='append every log record to this file as JSON '
+                             'lines')
+
+    return parser
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    log.configure(json_lines=args.log_json)
+
+    output, failed = initialize_corpus_lut(args.sources, args.dept, args.jobs)
+
+    pd.DataFrame(output).to_csv(args.out, index=False)
+    logger.info('Found %d lines.', len(output['identifier']),
+                extra={'lines': len(output['identifier'])})
+
+    if failed:
+        failed_file = args.out[:-4] if args.out.endswith('.csv') else args.out
+        failed_file = f'{failed_file}_failed.csv'
+        pd.DataFrame(failed, columns=['neuroscore', 'error']).to_csv(
+            failed_file, index=False)
+        logger.warning('%d files failed; see %s', len(failed), failed_file,
+                       extra={'failed': len(failed), 
+                              'failed_file': failed_file})
+
+if __name__ == '__main__':
+    main()
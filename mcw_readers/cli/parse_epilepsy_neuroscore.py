@@ -1,16 +1,54 @@
+import io
+import os
+import csv
+import logging
+import asyncio
+import pickle
+import hashlib
+import traceback
+
+import numpy as np
 import pandas as pd
 
+from datetime import datetime
+
 from pathlib import Path
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 
+from mcw_readers import log
+from mcw_readers import instrument
+from mcw_readers.cache import content_cache, hash_file, DEFAULT_CACHE_DIR
 from mcw_readers.interfaces.lut import lut
-from mcw_readers.interfaces.wb_parsers import wb_parser
+from mcw_readers.interfaces.wb_parsers import neuroscore_parser
 
 try:
     import importlib.resources as pkg_resources
 except ImportError:
     import importlib_resources as pkg_resources
 
+spec_row = namedtuple('spec_row', 
+                      'record_id redcap_repeat_instance neuroscore exam exam_num')
+row_failure = namedtuple('row_failure', 'error')
+redcap_row = namedtuple('redcap_row', 
+                        'record_id redcap_repeat_instance values order')
+
+# bump when the parsed rows recorded in the manifest change
+MANIFEST_VERSION = '2'
+
+REDCAP_ID_COLUMNS = [
+    'record_id', 
+    'redcap_repeat_instrument', 
+    'redcap_repeat_instance',
+]
+REDCAP_REPEAT_INSTRUMENT = 'neuropsych_testing'
+
+# the spec exams and their timepoint in the neuroscore
+EXAM_NUMBERS = {'a': 1, 'b': 2, 'c': 3}
+
+logger = log.get_cli_logger('parse_epilepsy_neuroscore')
+
 def get_parser():
     """get cli parse"""
 
@@ -27,6 +65,7 @@ Here are the tsv columns names and the information they represent:
         The full path to the Neuroscore xlsm file.
     exam
         The exam (A, B, or C) matching with the redcap_repeat_instance
+Rows with any other exam are reported as failed and left out of the output.
 """
         
     parser = ArgumentParser(description=parser_desc, 
@@ -34,107 +73,1037 @@ Here are the tsv columns names and the information they represent:
                             epilog=epilog)
     parser.add_argument('--spec', action='store', required=True,
                         help='the tsv specification')
+    parser.add_argument('--jobs', action='store', type=int, default=1,
+                        help='the number of processes used to parse the '
+                             'spec rows (default: 1)')
+    parser.add_argument('--engine', action='store', default='openpyxl',
+                        choices=sorted(neuroscore_parser.ENGINES),
+                        help='how the neuroscore workbooks are loaded; '
+                             'stream reads only the Template sheet in one '
+                             'read only pass, which pays off when the '
+                             'workbooks have other large sheets, such as '
+                             'the macro sheets of xlsm files; on workbooks '
+                             'holding little besides the Template sheet it '
+                             'gains little and can be slower '
+                             '(default: openpyxl)')
+    parser.add_argument('--cache-dir', action='store', 
+                        default=str(DEFAULT_CACHE_DIR),
+                        help='the directory caching parsed neuroscore '
+                             'workbooks by their contents '
+                             '(default: %(default)s)')
+    parser.add_argument('--cache-size', action='store', type=int, 
+                        default=1024,
+                        help='the cache size cap in MB; the least recently '
+                             'used workbooks are evicted past it '
+                             '(default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the parse cache')
+    parser.add_argument('--resume', action='store_true',
+                        help='keep a manifest of finished rows next to the '
+                             'spec and only parse new, changed or failed '
+                             'rows; failed rows are reported instead of '
+                             'stopping the run')
+    parser.add_argument('--prefetch', action='store', type=int, default=0,
+                        help='read up to this many workbooks into memory '
+                             'ahead of parsing, overlapping slow reads with '
+                             'parsing; the --jobs processes parse the read '
+                             'workbooks, so up to prefetch reads and jobs '
+                             'parses are in flight at once; 0 reads each '
+                             'workbook when it is parsed (default: 0)')
+    parser.add_argument('--prefetch-size', action='store', type=int, 
+                        default=256,
+                        help='the cap in MB on workbook bytes read ahead of '
+                             'parsing (default: %(default)s)')
+    parser.add_argument('--stream', action='store_true',
+                        help='append each parsed row to the output files as '
+                             'soon as it is ready; the redcap columns are '
+                             'every variable in the lut')
+    parser.add_argument('--profile-report', action='store',
+                        help='time each stage per neuroscore file, count '
+                             'cells, lines and new and missing lines, and '
+                             'write the report here; a .csv file gets one '
+                             'row per file, any other file gets JSON')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='also report the progress of each row')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='only report failed rows')
+    parser.add_argument('--log-json', action='store',
+                        help='append every log record, including the per '
+                             'row ones, to this file as JSON lines')
 
     return parser
 
-def main():
-    with pkg_resources.path('mcw_readers.data', 
-                            'epilepsy_lut.xlsx') as epilepsy_excel:
-        epilepsy_lut = lut('epilepsy', str(epilepsy_excel))
-        
-    parser = get_parser()
-    args = parser.parse_args()
+def format_parsed_data(row, results, new_lines, missing_lines):
+    """
+    Formats the parse_data output for one spec row.
+
+    Parameters
+    ----------
+
+    row : spec_row
+        The spec row that was parsed.
+    results : plan_row
+    new_lines, missing_lines : dict
+        The output of neuroscore_parser.parse_plan for row.
+
+    Returns
+    -------
+
+    results : redcap_row
+        the redcap row for the spec row, the values follow the lut
+        column_plan
+    new_lines : DataFrame
+        the new lines found in the neuroscore
+    missing_lines : DataFrame
+        the missing lines found in the neuroscore
+    """
+
+    # adjust results
+    results = redcap_row(row.record_id, row.redcap_repeat_instance, 
+                         results.values, results.order)
+
+    # adjust new lines
+    if new_lines:
+        new_lines = pd.DataFrame(new_lines)
+
+        new_lines['record_id'] = row.record_id
+        new_lines['redcap_repeat_instance'] = row.redcap_repeat_instance
+        new_lines['neuroscore'] = row.neuroscore
+        new_lines['exam'] = row.exam
+
+        cols = ['record_id',
+                'redcap_repeat_instance',
+                'neuroscore',
+                'exam']
+        cols = cols + [col for col in new_lines if col not in cols]
+        new_lines = new_lines[cols]
+
+    # adjust missing_lines
+    if missing_lines:
+        missing_lines = pd.DataFrame(missing_lines)
+
+        missing_lines['record_id'] = row.record_id
+        missing_lines['redcap_repeat_instance'] = row.redcap_repeat_instance
+        missing_lines['neuroscore'] = row.neuroscore
+        missing_lines['exam'] = row.exam
+   
+        cols = ['record_id',
+                'redcap_repeat_instance',
+                'neuroscore',
+                'exam']
+        cols = cols + [col for col in missing_lines if col not in cols]
+        missing_lines = missing_lines[cols]
+
+    return results, new_lines, missing_lines
+
+def parse_file(lut, neuroscore, rows, catch_errors=False, source=None, 
+               **parser_options):
+    """
+    Parse all spec rows pointing to the same neuroscore file.
+
+    The workbook is loaded and its lines indexed once, then parse_data is run
+    for each requested timepoint.
+
+    Parameters
+    ----------
+
+    lut : lut
+        The lookup table for parsing.
+    neuroscore : str
+        The neuroscore file shared by rows.
+    rows : list of spec_row
+        The spec rows for neuroscore.
+    catch_errors : bool
+        If True, a row that fails is returned as a row_failure instead of
+        raising.
+    source : bytes
+        If given, the workbook bytes already read from neuroscore.
+    parser_options
+        Extra keyword arguments for neuroscore_parser. The stages of a
+        profiler given here are attributed to neuroscore.
+
+    Returns
+    -------
+
+    parsed : list of tuple
+        (results, new_lines, missing_lines) as returned by format_parsed_data,
+        or a row_failure, one for each row in rows
+    """
+
+    profiler = parser_options.get('profiler')
+    if profiler is None:
+        return _parse_file(lut, neuroscore, rows, catch_errors, source, 
+                           **parser_options)
+
+    with profiler.file(neuroscore):
+        return _parse_file(lut, neuroscore, rows, catch_errors, source, 
+                           **parser_options)
+
+def _parse_file(lut, neuroscore, rows, catch_errors, source, **parser_options):
+    profiler = parser_options.get('profiler')
+
+    try:
+        if source is not None:
+            neuroscore = io.BytesIO(source)
+        epilepsy_parser = neuroscore_parser(neuroscore, verbose=False, 
+                                            **parser_options)
+    except Exception:
+        if not catch_errors:
+            raise
+        return [row_failure(traceback.format_exc())] * len(rows)
+
+    parsed = []
+    for row in rows:
+        try:
+            plan = epilepsy_parser.parse_plan(lut, row.exam_num)
+            with instrument.stage(profiler, 'format'):
+                parsed.append(format_parsed_data(row, *plan))
+        except Exception:
+            if not catch_errors:
+                raise
+            parsed.append(row_failure(traceback.format_exc()))
+
+    return parsed
+
+def group_rows(rows):
+    """
+    Groups spec rows by neuroscore file.
+
+    Returns
+    -------
+
+    groups : list of tuple
+        (neuroscore, indices, rows) ordered by the first spec row using each
+        neuroscore file
+    """
+
+    groups = {}
+    for i, row in enumerate(rows):
+        indices, group = groups.setdefault(row.neuroscore, ([], []))
+        indices.append(i)
+        group.append(row)
+
+    return [(neuroscore, indices, group)
+            for neuroscore, (indices, group) in groups.items()]
+
+def _init_worker(lut, parser_options):
+    """Stores the shared lut and parser options in a pool worker"""
+
+    global _WORKER_LUT, _WORKER_PARSER_OPTIONS
+    _WORKER_LUT = lut
+    _WORKER_PARSER_OPTIONS = parser_options
+
+    # a forked worker inherits the parent profiler and its records
+    if parser_options.get('profiler') is not None:
+        _WORKER_PARSER_OPTIONS = dict(parser_options, 
+                                      profiler=instrument.profiler())
+
+def _parse_file_worker(neuroscore, rows, catch_errors, source=None):
+    """
+    Parses a neuroscore file in a pool worker using the shared lut.
+
+    Returns the parsed rows and the records drained from the worker
+    profiler, None without a profiler.
+    """
+
+    parsed = parse_file(_WORKER_LUT, neuroscore, rows, catch_errors, source,
+                        **_WORKER_PARSER_OPTIONS)
+
+    profiler = _WORKER_PARSER_OPTIONS.get('profiler')
+    return parsed, None if profiler is None else profiler.drain()
+
+def _merge_worker_result(result, profiler):
+    """Returns the parsed rows of a worker result, merging its profile"""
+
+    parsed, records = result
+    if records is not None:
+        profiler.merge(records)
+
+    return parsed
+
+def iter_parsed_rows(lut, rows, jobs=1, catch_errors=False, **parser_options):
+    """
+    Parse spec rows, yielding the parsed rows in spec order.
 
-    spec = pd.read_csv(args.spec, sep='\t')
+    Parameters
+    ----------
+
+    lut : lut
+        The lookup table for parsing.
+    rows : list of spec_row
+        The spec rows to parse.
+    jobs : int
+        The number of worker processes. Rows are parsed serially if 1.
+    catch_errors : bool
+        If True, rows that fail are yielded as row_failure.
+    parser_options
+        Extra keyword arguments for neuroscore_parser.
+
+    Yields
+    ------
+
+    parsed : tuple
+        (results, new_lines, missing_lines) as returned by format_parsed_data,
+        or a row_failure
+
+    Description
+    -----------
+
+    Rows are grouped by neuroscore file so each workbook is parsed once. The
+    parsed rows are held back until every earlier spec row is done.
+    """
+
+    groups = group_rows(rows)
+    neuroscores = [neuroscore for neuroscore, _, _ in groups]
+    file_rows = [group for _, _, group in groups]
+
+    if jobs == 1:
+        parsed_groups = (parse_file(lut, neuroscore, group, catch_errors,
+                                    **parser_options)
+                         for neuroscore, group in zip(neuroscores, file_rows))
+        yield from _order_parsed_groups(groups, parsed_groups)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_init_worker,
+                                 initargs=(lut, parser_options)) as executor:
+            results = executor.map(_parse_file_worker, 
+                                   neuroscores, file_rows,
+                                   [catch_errors] * len(groups))
+            parsed_groups = (
+                _merge_worker_result(x, parser_options.get('profiler')) 
+                for x in results)
+            yield from _order_parsed_groups(groups, parsed_groups)
+
+def _order_parsed_groups(groups, parsed_groups):
+    """Yields the parsed rows of parsed_groups in spec order"""
+
+    pending = {}
+    next_index = 0
+    for (_, indices, _), parsed in zip(groups, parsed_groups):
+        pending.update(zip(indices, parsed))
+        while next_index in pending:
+            yield pending.pop(next_index)
+            next_index += 1
+
+def read_file(fname):
+    """Returns the bytes in fname"""
+
+    with open(fname, 'rb') as f:
+        return f.read()
+
+async def _prefetch_parse_groups(lut, groups, jobs, prefetch, max_bytes, 
+                                 catch_errors, reader, parser_options):
+    """
+    Yields the parsed rows of each group in groups order.
+
+    Up to prefetch workbooks are read ahead by threads, while up to jobs
+    read workbooks are parsed by a pool of jobs processes. A workbook takes
+    a prefetch slot from the start of its read until its bytes are handed
+    to a worker, so reading ahead never limits the parses in flight. A
+    workbook is only read once the bytes held in memory, read, waiting or
+    being parsed, fit in max_bytes, except that one workbook is always
+    allowed.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    held_bytes = 0
+    held_files = 0
+    ahead_files = 0
+    released = asyncio.Event()
+    parse_slots = asyncio.Semaphore(jobs)
+
+    async def load_and_parse(neuroscore, rows, size):
+        nonlocal held_bytes, held_files, ahead_files
+        ahead = True
+        try:
+            try:
+                source = await loop.run_in_executor(io_pool, reader, neuroscore)
+            except Exception:
+                if not catch_errors:
+                    raise
+                return [row_failure(traceback.format_exc())] * len(rows)
+
+            async with parse_slots:
+                ahead = False
+                ahead_files -= 1
+                released.set()
+
+                result = await loop.run_in_executor(cpu_pool, 
+                                                    _parse_file_worker,
+                                                    neuroscore, rows, 
+                                                    catch_errors, source)
+            return _merge_worker_result(result, parser_options.get('profiler'))
+        finally:
+            if ahead:
+                ahead_files -= 1
+            held_bytes -= size
+            held_files -= 1
+            released.set()
+
+    async def file_size(neuroscore):
+        try:
+            return await loop.run_in_executor(io_pool, os.path.getsize, 
+                                              neuroscore)
+        except OSError:
+            # the read reports the error
+            return 0
+
+    io_pool = ThreadPoolExecutor(max_workers=prefetch)
+    cpu_pool = ProcessPoolExecutor(max_workers=jobs,
+                                   initializer=_init_worker,
+                                   initargs=(lut, parser_options))
+    tasks = []
+    try:
+        next_group = 0
+        for neuroscore, _, rows in groups:
+            size = await file_size(neuroscore)
+            while (ahead_files >= prefetch or 
+                   held_files and held_bytes + size > max_bytes):
+                # hand back finished groups while waiting for memory
+                while next_group < len(tasks) and tasks[next_group].done():
+                    yield tasks[next_group].result()
+                    next_group += 1
+                released.clear()
+                await released.wait()
+
+            held_bytes += size
+            held_files += 1
+            ahead_files += 1
+            tasks.append(asyncio.ensure_future(
+                load_and_parse(neuroscore, rows, size)))
+
+            while next_group < len(tasks) and tasks[next_group].done():
+                yield tasks[next_group].result()
+                next_group += 1
+
+        for task in tasks[next_group:]:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        io_pool.shutdown(wait=False, cancel_futures=True)
+        cpu_pool.shutdown(wait=True, cancel_futures=True)
+
+def iter_prefetched_rows(lut, rows, jobs=1, prefetch=4, max_bytes=256 * 1024 ** 2,
+                         catch_errors=False, reader=read_file, **parser_options):
+    """
+    Parse spec rows with prefetched workbooks, yielding them in spec order.
+
+    Parameters
+    ----------
+
+    lut : lut
+        The lookup table for parsing.
+    rows : list of spec_row
+        The spec rows to parse.
+    jobs : int
+        The number of worker processes parsing workbooks.
+    prefetch : int
+        The most workbooks being read or waiting for a worker.
+    max_bytes : int
+        The most workbook bytes held in memory, read or being parsed.
+    catch_errors : bool
+        If True, rows that fail are yielded as row_failure.
+    reader : callable
+        Returns the bytes of a workbook path, read_file by default.
+    parser_options
+        Extra keyword arguments for neuroscore_parser.
+
+    Yields
+    ------
+
+    parsed : tuple
+        (results, new_lines, missing_lines) as returned by format_parsed_data,
+        or a row_failure
+
+    Description
+    -----------
+
+    An asyncio loop reads the workbooks on a thread pool and hands the bytes
+    to the worker processes, which parse them from memory. Reading the next
+    workbooks overlaps with parsing the current ones, which pays off when
+    the workbooks live on a slow network share. prefetch and jobs are
+    separate caps: a workbook stops counting against prefetch once a
+    worker takes it, so up to jobs workbooks are parsed at once whatever
+    prefetch is. Rows are grouped by neuroscore file as in
+    iter_parsed_rows.
+    """
+
+    groups = group_rows(rows)
+
+    loop = asyncio.new_event_loop()
+    parsed_groups = _prefetch_parse_groups(lut, groups, jobs, prefetch, 
+                                           max_bytes, catch_errors, reader,
+                                           parser_options)
+
+    def iter_groups():
+        while True:
+            try:
+                yield loop.run_until_complete(parsed_groups.__anext__())
+            except StopAsyncIteration:
+                break
+
+    try:
+        yield from _order_parsed_groups(groups, iter_groups())
+    finally:
+        loop.run_until_complete(parsed_groups.aclose())
+        loop.close()
+
+def read_spec(spec_file):
+    """
+    Reads the tsv spec file and returns a list of spec_row.
+
+    exam_num is the EXAM_NUMBERS timepoint of the exam, None if the exam is
+    not A, B or C.
+    """
+
+    spec = pd.read_csv(spec_file, sep='\t')
     spec.exam = spec.exam.str.lower()
-    spec['exam_num'] = spec.exam.map({'a': 1, 'b': 2})
-    N = spec.shape[0]
-
-    all_results = []
-    all_new_lines = []
-    all_missing_lines = []
-    for i, row in enumerate(spec.itertuples(), start=1):
-        print(f'Working on row {i} / {N}')
-
-        epilepsy_parser = wb_parser(row.neuroscore, verbose=False)
-        results, new_lines, missing_lines = epilepsy_parser.parse_data(
-            epilepsy_lut, row.exam_num) 
-
-        # adjust results
-        results = pd.DataFrame(results)
-
-        results['record_id'] = row.record_id
-        results['redcap_repeat_instrument'] = 'neuropsych_testing'
-        results['redcap_repeat_instance'] = row.redcap_repeat_instance
-
-        cols = ['record_id', 
-                'redcap_repeat_instrument', 
-                'redcap_repeat_instance']
-        cols = cols + [col for col in results if col not in cols]
-        results = results[cols]
-
-        # adjust new lines
-        if new_lines:
-            new_lines = pd.DataFrame(new_lines)
-            N_new_lines = new_lines.shape[0]
-            print(f'Found {N_new_lines} new lines.')
-
-            new_lines['record_id'] = row.record_id
-            new_lines['redcap_repeat_instance'] = row.redcap_repeat_instance
-            new_lines['neuroscore'] = row.neuroscore
-            new_lines['exam'] = row.exam
-
-            cols = ['record_id',
-                    'redcap_repeat_instance',
-                    'neuroscore',
-                    'exam']
-            cols = cols + [col for col in new_lines if col not in cols]
-            new_lines = new_lines[cols]
-
-            all_new_lines.append(new_lines)
-
-        # adjust missing_lines
-        if missing_lines:
-            missing_lines = pd.DataFrame(missing_lines)
-            N_missing_lines = missing_lines.shape[0]
-            print(f'Found {N_missing_lines} missing lines.')
-
-            missing_lines['record_id'] = row.record_id
-            missing_lines['redcap_repeat_instance'] = row.redcap_repeat_instance
-            missing_lines['neuroscore'] = row.neuroscore
-            missing_lines['exam'] = row.exam
-       
-            cols = ['record_id',
-                    'redcap_repeat_instance',
-                    'neuroscore',
-                    'exam']
-            cols = cols + [col for col in missing_lines if col not in cols]
-            missing_lines = missing_lines[cols]
-
-            all_missing_lines.append(missing_lines)
-
-        all_results.append(results)
-
-    # handle output
-    spec_file = Path(args.spec)
+    spec['exam_num'] = pd.Series([EXAM_NUMBERS.get(x) for x in spec.exam],
+                                 index=spec.index, dtype=object)
+
+    return [spec_row(*x) for x in 
+            spec[list(spec_row._fields)].itertuples(index=False, name=None)]
+
+def get_manifest_version(lut):
+    """Returns the manifest version for rows parsed with lut"""
+
+    variables = '\n'.join(lut.get_column_plan().variables)
+    return f'{MANIFEST_VERSION}:{hashlib.sha256(variables.encode()).hexdigest()}'
+
+class spec_manifest():
+
+    def __init__(self, fname, version=MANIFEST_VERSION):
+        """
+        Initializes spec_manifest.
+
+        Parameters
+        ----------
+
+        fname : str
+            path to the manifest file
+        version : str
+            the version of the parsed rows, see get_manifest_version; rows
+            recorded with another version are parsed again
+
+        Description
+        -----------
+
+        The manifest is an append only file of pickled entries, one for each
+        parsed spec row. An entry holds the spec row, the neuroscore
+        fingerprint (mtime, size and sha256) and either the parsed row or the
+        error. The last entry for a (record_id, redcap_repeat_instance) wins,
+        and a partially written entry at the end of the file is ignored.
+        Each neuroscore file is hashed at most once per run, however many
+        spec rows use it.
+        """
+
+        self.fname = Path(fname)
+        self.version = version
+        self.entries = {}
+        self.fingerprints = {}
+
+        if self.fname.exists():
+            with open(self.fname, 'rb') as f:
+                while True:
+                    try:
+                        entry = pickle.load(f)
+                    except EOFError:
+                        break
+                    except Exception:
+                        # an entry cut short by a crash
+                        break
+                    self.entries[self._key(entry['row'])] = entry
+
+        # compact to the latest entries
+        tmp = self.fname.with_name(self.fname.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            for entry in self.entries.values():
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.fname)
+
+    @staticmethod
+    def _key(row):
+        return (row.record_id, row.redcap_repeat_instance)
+
+    def is_done(self, row):
+        """True if row was parsed and its neuroscore file is unchanged"""
+
+        entry = self.entries.get(self._key(row))
+        if (entry is None or 
+            entry.get('version') != self.version or
+            entry['parsed'] is None or 
+            entry['row'].neuroscore != row.neuroscore or
+            entry['row'].exam != row.exam):
+            return False
+
+        try:
+            stat = os.stat(row.neuroscore)
+        except OSError:
+            return False
+
+        if (stat.st_mtime_ns, stat.st_size) == (entry['mtime_ns'], entry['size']):
+            return True
+
+        return (stat.st_size == entry['size'] and 
+                self.fingerprint(row.neuroscore)[2] == entry['sha256'])
+
+    def fingerprint(self, neuroscore):
+        """
+        Returns the (mtime_ns, size, sha256) of neuroscore.
+
+        The sha256 is reused while the mtime and size are unchanged, so a
+        file shared by many spec rows is only hashed once. OSError is raised
+        if neuroscore cannot be read.
+        """
+
+        stat = os.stat(neuroscore)
+        fingerprint = self.fingerprints.get(neuroscore)
+        if (fingerprint is None or 
+            fingerprint[:2] != (stat.st_mtime_ns, stat.st_size)):
+            fingerprint = (stat.st_mtime_ns, stat.st_size, 
+                           hash_file(neuroscore))
+            self.fingerprints[neuroscore] = fingerprint
+
+        return fingerprint
+
+    def parsed(self, row):
+        """Returns the parsed row recorded for row"""
+
+        return self.entries[self._key(row)]['parsed']
+
+    def record(self, row, parsed):
+        """Records parsed, the parsed row or a row_failure, for row"""
+
+        try:
+            mtime_ns, size, sha256 = self.fingerprint(row.neuroscore)
+        except OSError:
+            mtime_ns = size = sha256 = None
+
+        failed = isinstance(parsed, row_failure)
+        entry = {
+            'row': row,
+            'version': self.version,
+            'mtime_ns': mtime_ns,
+            'size': size,
+            'sha256': sha256,
+            'parsed': None if failed else parsed,
+            'error': parsed.error if failed else None,
+        }
+        self.entries[self._key(row)] = entry
+
+        with open(self.fname, 'ab') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+NEW_LINES_COLUMNS = [
+    'record_id',
+    'redcap_repeat_instance',
+    'neuroscore',
+    'exam',
+    'test',
+    'test_no',
+    'identifier',
+    'row',
+]
+
+MISSING_LINES_COLUMNS = NEW_LINES_COLUMNS + ['col', 'name', 'value']
+
+NEW_LINE_KEY_COLUMNS = ['test', 'test_no', 'identifier']
+
+def get_output_files(spec_file):
+    """Returns the redcap, new lines and missing lines files for a spec"""
+
+    spec_file = Path(spec_file)
     out_dir = spec_file.parent
     stem = spec_file.stem
-    results_file = out_dir.joinpath(f'{stem}_redcap.csv')
-    new_lines_file = out_dir.joinpath(f'{stem}_new_lines.csv')
-    missing_lines_file = out_dir.joinpath(f'{stem}_missing_lines.csv')
-
-    all_results = pd.concat(all_results).reset_index(drop=True)
-    all_results.to_csv(results_file, float_format='%.6g', index=False)
-
-    if all_new_lines:
-        all_new_lines = pd.concat(all_new_lines).reset_index(drop=True)
-        all_new_lines.to_csv(
-            new_lines_file, float_format='%.6g', index=False)
-
-    if all_missing_lines:
-        all_missing_lines = pd.concat(all_missing_lines).reset_index(drop=True)
-        all_missing_lines.to_csv(
-            missing_lines_file, float_format='%.6g', index=False)
+
+    return (out_dir.joinpath(f'{stem}_redcap.csv'),
+            out_dir.joinpath(f'{stem}_new_lines.csv'),
+            out_dir.joinpath(f'{stem}_missing_lines.csv'))
+
+def get_summary_file(spec_file):
+    """Returns the new lines summary file for a spec"""
+
+    spec_file = Path(spec_file)
+    return spec_file.parent.joinpath(f'{spec_file.stem}_new_lines_summary.csv')
+
+class new_line_summary():
+
+    COLUMNS = NEW_LINE_KEY_COLUMNS + ['n_files', 'example_files']
+
+    def __init__(self, n_examples=3):
+        """
+        Summarizes the new lines found across a batch of neuroscore files.
+
+        Parameters
+        ----------
+
+        n_examples : int
+            the number of example files listed for each new line
+
+        Description
+        -----------
+
+        The new lines of each parsed row are counted as they are added, in
+        a dict keyed by (test, test_no, identifier), so only the counts and
+        the example files are held, never the new lines themselves. New
+        lines depend only on the neuroscore file, not the exam, so spec
+        rows sharing a file report the same new lines and each file is
+        counted once.
+        """
+
+        self.n_examples = n_examples
+        self.counts = {}
+        self.files = set()
+
+    def add(self, new_lines):
+        """Counts new_lines, the new lines DataFrame of one parsed row"""
+
+        for neuroscore, rows in new_lines.groupby('neuroscore', sort=False):
+            if neuroscore in self.files:
+                continue
+            self.files.add(neuroscore)
+
+            keys = rows[NEW_LINE_KEY_COLUMNS].drop_duplicates()
+            for key in keys.itertuples(index=False, name=None):
+                count = self.counts.get(key)
+                if count is None:
+                    count = self.counts[key] = [0, []]
+                count[0] += 1
+                if len(count[1]) < self.n_examples:
+                    count[1].append(neuroscore)
+
+    def to_frame(self):
+        """
+        Returns the summary.
+
+        Returns
+        -------
+
+        summary : DataFrame
+            one row for each (test, test_no, identifier) with
+                n_files - the number of neuroscore files containing the line
+                example_files - up to n_examples of those files separated
+                                by ';'
+            sorted by n_files, most common first, then by first appearance
+        """
+
+        summary = pd.DataFrame(
+            [key + (n_files, ';'.join(examples))
+             for key, (n_files, examples) in self.counts.items()],
+            columns=self.COLUMNS)
+
+        return (summary.sort_values('n_files', ascending=False, kind='stable')
+                .reset_index(drop=True))
+
+def get_redcap_columns(lut):
+    """Returns every redcap column that parsing with lut can produce"""
+
+    return REDCAP_ID_COLUMNS + lut.get_column_plan().variables
+
+def format_value(value):
+    """Formats a redcap value for csv as pandas does with float_format='%.6g'"""
+
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    elif isinstance(value, float):
+        return '%.6g' % value
+    elif isinstance(value, datetime):
+        if value.time() == datetime.min.time():
+            return value.strftime('%Y-%m-%d')
+        return str(value)
+    
+    return str(value)
+
+class concat_writer():
+
+    def __init__(self, spec_file, lut, n_rows):
+        """
+        Collects the parsed rows and writes the outputs for spec_file at close.
+
+        The redcap rows are placed in a table preallocated for n_rows rows
+        and every column of the lut column plan. The redcap columns written
+        are the ones filled by any row, in the order they are first filled.
+        """
+
+        self.files = get_output_files(spec_file)
+        self.summary_file = get_summary_file(spec_file)
+        self.variables = lut.get_column_plan().variables
+
+        self.n_rows = 0
+        self.ids = np.empty((n_rows, 2), dtype=object)
+        self.table = np.full((n_rows, len(self.variables)), np.nan, 
+                             dtype=object)
+        self.column_order = []
+        self.is_filled = np.zeros(len(self.variables), dtype=bool)
+
+        self.all_new_lines = []
+        self.all_missing_lines = []
+
+    def write(self, parsed):
+        """Adds parsed, a (results, new_lines, missing_lines) tuple"""
+
+        results, new_lines, missing_lines = parsed
+
+        i = self.n_rows
+        self.ids[i] = (results.record_id, results.redcap_repeat_instance)
+        self.table[i] = results.values
+        self.n_rows += 1
+
+        new_columns = results.order[~self.is_filled[results.order]]
+        self.column_order.extend(new_columns)
+        self.is_filled[new_columns] = True
+
+        self.all_new_lines.append(new_lines)
+        self.all_missing_lines.append(missing_lines)
+
+    def close(self):
+        """Writes the redcap, new lines and missing lines csv files"""
+
+        if not self.n_rows:
+            return
+
+        results_file, new_lines_file, missing_lines_file = self.files
+
+        columns = np.array(self.column_order, dtype=np.int64)
+        all_results = pd.DataFrame(
+            self.table[:self.n_rows, columns], 
+            columns=[self.variables[x] for x in columns])
+        all_results.insert(0, 'record_id', self.ids[:self.n_rows, 0])
+        all_results.insert(1, 'redcap_repeat_instrument', 
+                           REDCAP_REPEAT_INSTRUMENT)
+        all_results.insert(2, 'redcap_repeat_instance', 
+                           self.ids[:self.n_rows, 1])
+        all_results.infer_objects().to_csv(
+            results_file, float_format='%.6g', index=False)
+
+        all_new_lines = self.all_new_lines
+        all_missing_lines = self.all_missing_lines
+
+        if all_new_lines:
+            summary = new_line_summary()
+            for new_lines in all_new_lines:
+                summary.add(new_lines)
+            summary.to_frame().to_csv(self.summary_file, index=False)
+
+            all_new_lines = pd.concat(all_new_lines).reset_index(drop=True)
+            all_new_lines.to_csv(
+                new_lines_file, float_format='%.6g', index=False)
+
+        if all_missing_lines:
+            all_missing_lines = pd.concat(all_missing_lines).reset_index(drop=True)
+            all_missing_lines.to_csv(
+                missing_lines_file, float_format='%.6g', index=False)
+
+class stream_writer():
+
+    def __init__(self, spec_file, lut):
+        """
+        Appends each parsed row to the outputs for spec_file as it is written.
+
+        The redcap columns are fixed up front to every variable in lut and
+        the new lines summary only counts each distinct new line, so memory
+        stays flat no matter how many rows are in the spec.
+        """
+
+        results_file, new_lines_file, missing_lines_file = get_output_files(
+            spec_file)
+        self.summary_file = get_summary_file(spec_file)
+        self.summary = new_line_summary()
+
+        self.results_file = open(results_file, 'w', newline='')
+        self.results = csv.writer(self.results_file, lineterminator='\n')
+        self.results.writerow(get_redcap_columns(lut))
+
+        self.outputs = [
+            (open(new_lines_file, 'w', newline=''), NEW_LINES_COLUMNS),
+            (open(missing_lines_file, 'w', newline=''), MISSING_LINES_COLUMNS),
+        ]
+
+        for f, cols in self.outputs:
+            pd.DataFrame(columns=cols).to_csv(f, index=False)
+
+    def write(self, parsed):
+        """Appends parsed, a (results, new_lines, missing_lines) tuple"""
+
+        results, new_lines, missing_lines = parsed
+
+        self.results.writerow(
+            [format_value(results.record_id), 
+             REDCAP_REPEAT_INSTRUMENT,
+             format_value(results.redcap_repeat_instance)] + 
+            [format_value(x) for x in results.values])
+        self.results_file.flush()
+
+        for (f, cols), df in zip(self.outputs, (new_lines, missing_lines)):
+            df.reindex(columns=cols).to_csv(
+                f, header=False, float_format='%.6g', index=False)
+            f.flush()
+
+        self.summary.add(new_lines)
+
+    def close(self):
+        """Closes the csv files and writes the new lines summary"""
+
+        self.results_file.close()
+        for f, _ in self.outputs:
+            f.close()
+
+        self.summary.to_frame().to_csv(self.summary_file, index=False)
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.prefetch < 0:
+        parser.error('--prefetch must be at least 0')
+
+    if args.verbose:
+        level = logging.DEBUG
+    elif args.quiet:
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    log.configure(level, json_lines=args.log_json)
+
+    if args.profile_report:
+        profiler = instrument.profiler()
+    else:
+        profiler = None
+
+    with pkg_resources.path('mcw_readers.data', 
+                            'epilepsy_lut.xlsx') as epilepsy_excel:
+        epilepsy_lut = lut.load_compiled('epilepsy', str(epilepsy_excel),
+                                         profiler=profiler)
+
+    rows = read_spec(args.spec)
+
+    if args.no_cache:
+        cache = None
+    else:
+        cache = content_cache(args.cache_dir, args.cache_size * 1024 ** 2)
+
+    if args.resume:
+        spec_file = Path(args.spec)
+        manifest = spec_manifest(
+            spec_file.parent.joinpath(f'{spec_file.stem}_manifest.pkl'),
+            get_manifest_version(epilepsy_lut))
+        done = [manifest.is_done(row) for row in rows]
+        logger.info('Resuming: %d / %d rows already parsed', sum(done), 
+                    len(rows), extra={'done': sum(done), 'rows': len(rows)})
+    else:
+        manifest = None
+        done = [False] * len(rows)
+
+    todo = [row for row, is_done in zip(rows, done) 
+            if not is_done and row.exam_num is not None]
+    N = len(rows) - sum(done)
+
+    if args.stream:
+        writer = stream_writer(args.spec, epilepsy_lut)
+    else:
+        writer = concat_writer(args.spec, epilepsy_lut, len(rows))
+
+    failed = 0
+    unknown_exams = 0
+    N_new_lines = 0
+    N_missing_lines = 0
+    if args.prefetch:
+        parsed_rows = iter_prefetched_rows(epilepsy_lut, todo, args.jobs,
+                                           args.prefetch, 
+                                           args.prefetch_size * 1024 ** 2,
+                                           catch_errors=args.resume,
+                                           engine=args.engine, cache=cache,
+                                           profiler=profiler)
+    else:
+        parsed_rows = iter_parsed_rows(epilepsy_lut, todo, args.jobs, 
+                                       catch_errors=args.resume,
+                                       engine=args.engine, cache=cache,
+                                       profiler=profiler)
+    parsed_rows = zip(todo, parsed_rows)
+    log_rows = logger.isEnabledFor(logging.DEBUG)
+    i = 0
+    for row, is_done in zip(rows, done):
+        if is_done:
+            writer.write(manifest.parsed(row))
+            continue
+
+        i += 1
+        if row.exam_num is None:
+            unknown_exams += 1
+            logger.warning('Failed record_id %s redcap_repeat_instance %s: '
+                           'unknown exam %r, expected A, B or C',
+                           row.record_id, row.redcap_repeat_instance, row.exam,
+                           extra={'record_id': row.record_id,
+                                  'redcap_repeat_instance': 
+                                      row.redcap_repeat_instance,
+                                  'neuroscore': row.neuroscore,
+                                  'exam': row.exam})
+            continue
+
+        row, parsed = next(parsed_rows)
+        if log_rows:
+            logger.debug('Working on row %d / %d', i, N, 
+                         extra={'row': i, 'rows': N, 
+                                'record_id': row.record_id,
+                                'redcap_repeat_instance': 
+                                    row.redcap_repeat_instance,
+                                'neuroscore': row.neuroscore})
+
+        if manifest is not None:
+            manifest.record(row, parsed)
+
+        if isinstance(parsed, row_failure):
+            failed += 1
+            if profiler is not None:
+                with profiler.file(row.neuroscore):
+                    profiler.count('failed_rows')
+            logger.warning('Failed record_id %s redcap_repeat_instance %s:\n%s',
+                           row.record_id, row.redcap_repeat_instance, 
+                           parsed.error,
+                           extra={'record_id': row.record_id,
+                                  'redcap_repeat_instance': 
+                                      row.redcap_repeat_instance,
+                                  'neuroscore': row.neuroscore})
+            continue
+
+        results, new_lines, missing_lines = parsed
+
+        N_new_lines += new_lines.shape[0]
+        N_missing_lines += missing_lines.shape[0]
+        if log_rows:
+            logger.debug('Found %d new lines and %d missing lines.', 
+                         new_lines.shape[0], missing_lines.shape[0],
+                         extra={'new_lines': new_lines.shape[0],
+                                'missing_lines': missing_lines.shape[0]})
+
+        if profiler is None:
+            writer.write(parsed)
+        else:
+            with profiler.file(row.neuroscore), profiler.stage('write'):
+                writer.write(parsed)
+
+    with instrument.stage(profiler, 'close'):
+        writer.close()
+
+    logger.info('Parsed %d rows: found %d new lines and %d missing lines.',
+                N - failed - unknown_exams, N_new_lines, N_missing_lines,
+                extra={'rows': N - failed - unknown_exams, 
+                       'new_lines': N_new_lines,
+                       'missing_lines': N_missing_lines})
+
+    if profiler is not None:
+        profiler.write_report(args.profile_report)
+        logger.info('Wrote the profile report to %s', args.profile_report)
+
+    if failed:
+        logger.warning('%d rows failed; rerun with --resume to retry them.',
+                       failed, extra={'failed': failed})
+    if unknown_exams:
+        logger.warning('%d rows have an unknown exam; fix them in the spec.',
+                       unknown_exams, extra={'unknown_exams': unknown_exams})
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,87 @@
+import pandas as pd
+
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from mcw_readers import log
+from mcw_readers.cache import content_cache, DEFAULT_CACHE_DIR
+from mcw_readers.parsers.neuroreader import parse_neuroreader_batch
+
+logger = log.get_cli_logger('parse_neuroreader')
+
+def get_parser():
+    """get cli parse"""
+
+    parser_desc = 'parse a batch of neuroreader pdf files'
+    epilog = """
+Each source is a directory (searched for *.pdf), a glob pattern or a
+neuroreader pdf file. The output csv has one row per parsed pdf file: the
+pdf_file column followed by the parsed variables, renamed by the mapper file
+if one is given. Files that cannot be parsed are listed with their error in
+<out>_failed.csv.
+"""
+
+    parser = ArgumentParser(description=parser_desc,
+                            formatter_class=RawDescriptionHelpFormatter,
+                            epilog=epilog)
+    parser.add_argument('sources', nargs='+',
+                        help='directories, glob patterns or pdf files')
+    parser.add_argument('--out', action='store', required=True,
+                        help='the output csv')
+    parser.add_argument('--mapper', action='store',
+                        help='a csv with the columns default and redcap '
+                             'renaming the parsed variables')
+    parser.add_argument('--jobs', action='store', type=int, default=1,
+                        help='the number of processes parsing pdf files '
+                             '(default: 1)')
+    parser.add_argument('--cache-dir', action='store', 
+                        default=str(DEFAULT_CACHE_DIR),
+                        help='the directory caching parsed pdf files by '
+                             'their contents (default: %(default)s)')
+    parser.add_argument('--cache-size', action='store', type=int, 
+                        default=1024,
+                        help='the cache size cap in MB; the least recently '
+                             'used pdf files are evicted past it '
+                             '(default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the parse cache')
+    parser.add_argument('--check-mtime', action='store_true',
+                        help='look up pdf files in the cache by their mtime '
+                             'and size, only reading the changed ones')
+    parser.add_argument('--log-json', action='store',
+                        help='append every log record to this file as JSON '
+                             'lines')
+
+    return parser
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    log.configure(json_lines=args.log_json)
+
+    if args.no_cache:
+        cache = None
+    else:
+        cache = content_cache(args.cache_dir, args.cache_size * 1024 ** 2)
+
+    results, failed = parse_neuroreader_batch(args.sources, args.mapper,
+                                              args.jobs, cache=cache,
+                                              check_mtime=args.check_mtime)
+
+    results.to_csv(args.out, index=False)
+    logger.info('Parsed %d files.', len(results),
+                extra={'parsed': len(results)})
+
+    if failed:
+        failed_file = args.out[:-4] if args.out.endswith('.csv') else args.out
+        failed_file = f'{failed_file}_failed.csv'
+        pd.DataFrame(failed, columns=['pdf_file', 'error']).to_csv(
+            failed_file, index=False)
+        logger.warning('%d files failed; see %s', len(failed), failed_file,
+                       extra={'failed': len(failed),
+                              'failed_file': failed_file})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+
+from contextlib import contextmanager, nullcontext
+from collections import namedtuple
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak rss is not reported
+    resource = None
+
+stage_record = namedtuple('stage_record', 'file stage seconds')
+profile_event = namedtuple('profile_event', 'kind file name value')
+
+BATCH_FILE = ''
+
+def peak_rss():
+    """Returns the peak resident set size of this process in bytes, or None"""
+
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def stage(profiler, name):
+    """Returns profiler.stage(name), or a no-op context if profiler is None"""
+
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
+
+class profiler():
+
+    def __init__(self, hooks=()):
+        """
+        Initializes profiler.
+
+        Parameters
+        ----------
+
+        hooks : list of callable
+            called with a profile_event as each stage finishes or counter is
+            incremented
+
+        Attributes
+        ----------
+            stages : list of stage_record
+                the wall time of every finished stage
+            counters : dict ((file, name) : int)
+                the counters of each file
+            worker_peak_rss : int
+                the largest peak rss merged from worker processes, in bytes
+
+        Description
+        -----------
+
+        Instrumentation is opt in: neuroscore_parser, peds_parser, lut and the
+        cli record stages and counters only when they are given a profiler,
+        and cost a single None check otherwise. Stages and counters belong
+        to the file set with profiler.file, or to BATCH_FILE for work that
+        is not tied to one file.
+
+        A profiler sent to a worker process starts empty and without hooks.
+        The worker hands back its records with drain and the parent adds
+        them with merge, which also calls the parent hooks.
+        """
+
+        self.hooks = list(hooks)
+        self.current_file = BATCH_FILE
+        self.stages = []
+        self.counters = {}
+        self.worker_peak_rss = None
+
+    def __reduce__(self):
+        # sent to a worker process as a new empty profiler
+        return (profiler, ())
+
+    def add_hook(self, hook):
+        """Calls hook with a profile_event for every stage and counter"""
+
+        self.hooks.append(hook)
+
+    def _emit(self, event):
+        for hook in self.hooks:
+            hook(event)
+
+    @contextmanager
+    def file(self, fname):
+        """Attributes the stages and counters inside the block to fname"""
+
+        previous = self.current_file
+        self.current_file = str(fname)
+        try:
+            yield
+        finally:
+            self.current_file = previous
+
+    @contextmanager
+    def stage(self, name):
+        """Records the wall time of the block as stage name"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = stage_record(self.current_file, name,
+                                  time.perf_counter() - start)
+            self.stages.append(record)
+            self._emit(profile_event('stage', *record))
+
+    def count(self, name, n=1):
+        """Adds n to the counter name of the current file"""
+
+        key = (self.current_file, name)
+        self.counters[key] = self.counters.get(key, 0) + n
+        self._emit(profile_event('count', self.current_file, name, n))
+
+    def drain(self):
+        """Returns and clears the records, to be merged into another profiler"""
+
+        records = (self.stages, self.counters, peak_rss())
+        self.stages = []
+        self.counters = {}
+
+        return records
+
+    def merge(self, records):
+        """Adds the records returned by drain in another process"""
+
+        stages, counters, rss = records
+
+        for record in stages:
+            self.stages.append(record)
+            self._emit(profile_event('stage', *record))
+
+        for (fname, name), n in counters.items():
+            key = (fname, name)
+            self.counters[key] = self.counters.get(key, 0) + n
+            self._emit(profile_event('count', fname, name, n))
+
+        if rss is not None:
+            self.worker_peak_rss = max(self.worker_peak_rss or 0, rss)
+
+    def report(self):
+        """
+        Returns the profile as a dict.
+
+        Returns
+        -------
+
+        report : dict
+            peak_rss_mb        -> peak rss of this process
+            worker_peak_rss_mb -> largest peak rss of the worker processes
+            stages             -> for each stage the total, mean and max
+                                  seconds and the number of times it ran
+            counters           -> the total of each counter
+            files              -> for each file, BATCH_FILE for the batch,
+                                  the seconds in each stage and its counters
+        """
+
+        def to_mb(x):
+            return None if x is None else x / 1024 ** 2
+
+        stages = {}
+        files = {}
+        for fname, name, seconds in self.stages:
+            summary = stages.setdefault(name, {'n': 0, 'total': 0.0,
+                                               'max': 0.0})
+            summary['n'] += 1
+            summary['total'] += seconds
+            summary['max'] = max(summary['max'], seconds)
+
+            file_stages = files.setdefault(fname, {'stages': {},
+                                                   'counters': {}})['stages']
+            file_stages[name] = file_stages.get(name, 0.0) + seconds
+
+        for summary in stages.values():
+            summary['mean'] = summary['total'] / summary['n']
+
+        counters = {}
+        for (fname, name), n in self.counters.items():
+            counters[name] = counters.get(name, 0) + n
+            files.setdefault(fname, {'stages': {},
+                                     'counters': {}})['counters'][name] = n
+
+        return {
+            'peak_rss_mb': to_mb(peak_rss()),
+            'worker_peak_rss_mb': to_mb(self.worker_peak_rss),
+            'stages': stages,
+            'counters': counters,
+            'files': files,
+        }
+
+    def write_report(self, fname):
+        """
+        Writes the report to fname.
+
+        A .csv fname gets one row per file with a <stage>_seconds column for
+        each stage and a column for each counter; the peak rss columns are
+        filled on the BATCH_FILE row. Any other fname gets the report as
+        JSON.
+        """
+
+        report = self.report()
+
+        if os.path.splitext(str(fname))[1].lower() != '.csv':
+            with open(fname, 'w') as f:
+                json.dump(report, f, indent=2)
+            return
+
+        rows = []
+        counters = list(report['counters'])
+        for fname_, values in report['files'].items():
+            row = {'file': fname_}
+            row.update({f'{name}_seconds': seconds
+                        for name, seconds in values['stages'].items()})
+            row.update(values['counters'])
+            if fname_ == BATCH_FILE:
+                row['peak_rss_mb'] = report['peak_rss_mb']
+                row['worker_peak_rss_mb'] = report['worker_peak_rss_mb']
+            rows.append(row)
+
+        df = pd.DataFrame(rows, columns=None if rows else ['file'])
+        # counters are missing on files without them, keep them integers
+        df[counters] = df[counters].astype('Int64')
+        df.to_csv(fname, index=False)
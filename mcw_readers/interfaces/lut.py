@@ -1,8 +1,25 @@
-import openpyxl
+import os
+import pickle
 
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
-def initialize_lut(excel, dept):
+from mcw_readers import instrument
+from mcw_readers.cache import atomic_write, hash_file
+from mcw_readers.utils import find_files
+from mcw_readers.interfaces.trie import identifier_trie
+
+# bump when the compiled lut contents change
+COMPILED_VERSION = '2'
+COMPILED_SUFFIX = '.lut.pkl'
+
+DEPTS = {'peds', 'epilepsy', 'dementia', 'aphasia'}
+
+CORPUS_PATTERNS = ['*.xlsm', '*.xlsx']
+
+def initialize_lut(excel, dept, verbose=False):
     """
     Initialize a blank lookup table for neuroscore file for a specific department.
 
@@ -17,143 +34,366 @@ def initialize_lut(excel, dept):
                 epilepsy
                 dementia
                 aphasia
+        verbose
+            Log each parsed line at DEBUG level.
 
     **Outputs**
 
         output
-            A dataframe with the following columns:
+            A dict with the following keys:
                 test - the test name the row belongs
                 test_no - the current test number
                 identifier - the unique identifier for the row
-    """
-    output = {'test': [], 'test_no': [], 'identifier': []}
-    test_counter = {}
-
-    if dept in {'peds'}:
-        TEST_COL = 2
-        RAW_COL = 3
-    elif dept in {'epilepsy', 'dementia', 'aphasia'}:
-        TEST_COL = 1
-        RAW_COL = 2
-    else:
-        raise Exception(f'Unkown dept: {dept}')
 
-    wb = openpyxl.load_workbook(excel, data_only=True)
-    sh = wb['Template']
-
-    begin_line = 1
-    while ((not sh[begin_line] or 
-        not sh[begin_line][RAW_COL].value or
-        sh[begin_line][RAW_COL].value.strip() != "Raw") and 
-        begin_line < sh.max_row):
+    The lines are found with neuroscore_parser.parse_lines, so the lut
+    identifiers always match the ones used when parsing.
+    """
 
-        begin_line = begin_line + 1
+    if dept not in DEPTS:
+        raise Exception(f'Unkown dept: {dept}')
 
-    while ((not sh[begin_line] or 
-        not sh[begin_line][TEST_COL].value) and
-        begin_line < sh.max_row):
+    output = {'test': [], 'test_no': [], 'identifier': []}
+    for test, test_no, identifier in _get_line_keys(excel, verbose):
+        output['test'].append(test)
+        output['test_no'].append(test_no)
+        output['identifier'].append(identifier)
 
-        begin_line = begin_line + 1
+    return output
 
-    print(f'begin_line : {begin_line}')
-            
-    if begin_line < sh.max_row:
+def _get_line_keys(excel, verbose=False):
+    """Returns the (test, test_no, identifier) of every line in excel"""
 
-        current_test = sh[begin_line][TEST_COL].value
-        if current_test in test_counter:
-            test_counter[current_test] += 1
-        else:
-            test_counter[current_test] = 1
+    # imported here since wb_parsers imports lut
+    from mcw_readers.interfaces.wb_parsers import neuroscore_parser
 
-        unique_stack = [sh[begin_line][TEST_COL].value]
-        p_indent = sh[begin_line][TEST_COL].alignment.indent
-        indent_mapper = {p_indent: 0}
-        p_indent_key = p_indent
+    parser = neuroscore_parser(excel, verbose=verbose)
+    trie = parser.trie
 
-        output['identifier'].append(' | '.join(unique_stack))
-        output['test'].append(current_test)
-        output['test_no'].append(test_counter[current_test])
+    return [(trie.test(node), test_no, trie.identifier(node))
+            for node, test_no, _ in parser.lines]
 
-        for current_line in range(begin_line + 1, sh.max_row + 1):
+def _get_corpus_line_keys(excel):
+    """Returns the line keys of excel, or the error if it cannot be parsed"""
 
-            if (sh[current_line] and 
-                sh[current_line][TEST_COL].value and 
-                sh[current_line][TEST_COL].value.strip() and
-                not sh[current_line][TEST_COL].value.strip().startswith('*')):
+    try:
+        return _get_line_keys(excel), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
 
-                c_text = sh[current_line][TEST_COL].value
+def find_corpus_files(sources):
+    """
+    Returns the neuroscore files in sources.
 
-                c_indent = sh[current_line][TEST_COL].alignment.indent
-                if c_text.startswith(' '):
-                    c_indent = c_indent + 1
+    Each source is a directory, searched for CORPUS_PATTERNS, a glob pattern
+    or a file, see utils.find_files.
+    """
 
-                if c_indent not in indent_mapper:
-                    indent_mapper[c_indent] = indent_mapper[p_indent_key] + 1
-                    p_indent_key = c_indent
-                c_indent = indent_mapper[c_indent]
+    return find_files(sources, CORPUS_PATTERNS)
 
-                print(f"Parsing line : {current_line} : {c_text} : {c_indent}")
+def initialize_corpus_lut(sources, dept, jobs=1):
+    """
+    Initialize a blank lookup table from a corpus of neuroscore files.
+
+    Parameters
+    ----------
+
+    sources : str or list of str
+        directories, glob patterns or files, see find_corpus_files
+    dept : str
+        the department of the neuroscore files
+    jobs : int
+        the number of processes extracting lines
+
+    Returns
+    -------
+
+    output : dict
+        test, test_no and identifier as returned by initialize_lut, plus
+        n_files - the number of files containing each line
+    failed : list of tuple
+        (file, error) for each file that could not be parsed
+
+    Description
+    -----------
+
+    The lines of each file are extracted in parallel and merged into a
+    union in file order. A line missing from the union is placed right
+    after the line preceding it in the file it was found in, so tests
+    and their subtests stay together and the order does not depend on
+    which worker finished first.
+    """
 
-                c_text = c_text.strip()
+    if dept not in DEPTS:
+        raise Exception(f'Unkown dept: {dept}')
 
-                if c_indent == p_indent:
-                    unique_stack.pop()
-                    unique_stack.append(c_text)
+    files = find_corpus_files(sources)
 
-                    if c_indent == 0:
-                        current_test = c_text
-                        if current_test in test_counter:
-                            test_counter[current_test] += 1
-                        else:
-                            test_counter[current_test] = 1
-                        
-                elif c_indent > p_indent:
-                    unique_stack.append(c_text)
+    if jobs == 1:
+        all_keys = map(_get_corpus_line_keys, files)
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        all_keys = executor.map(_get_corpus_line_keys, files, 
+                                chunksize=max(1, len(files) // (jobs * 4)))
+
+    head = None
+    next_keys = {head: None}
+    counts = {}
+    failed = []
+    try:
+        for excel, (keys, error) in zip(files, all_keys):
+            if error is not None:
+                failed.append((excel, error))
+                continue
+
+            previous = head
+            for key in dict.fromkeys(keys):
+                if key not in next_keys:
+                    next_keys[key] = next_keys[previous]
+                    next_keys[previous] = key
+                    counts[key] = 0
+                counts[key] += 1
+                previous = key
+    finally:
+        if jobs != 1:
+            executor.shutdown()
+
+    output = {'test': [], 'test_no': [], 'identifier': [], 'n_files': []}
+    key = next_keys[head]
+    while key is not None:
+        test, test_no, identifier = key
+        output['test'].append(test)
+        output['test_no'].append(test_no)
+        output['identifier'].append(identifier)
+        output['n_files'].append(counts[key])
+        key = next_keys[key]
+
+    return output, failed
+
+class column_plan():
+
+    def __init__(self, node_lut):
+        """
+        Initializes column_plan.
+
+        Parameters
+        ----------
+
+        node_lut : dict
+            a lut keyed by (trie node, test_no), as in lut.node_lut
+
+        Attributes
+        ----------
+            variables : list of str
+                the redcap variables in lut order, each listed once
+            sources : dict ((node, test_no) : tuple)
+                (data_cols, columns, missing_data_cols) for each lut key,
+                where data_cols are the indexes into the lut row of the
+                assigned variables, columns are their indexes into
+                variables, and missing_data_cols are the indexes without a
+                variable
+
+        Description
+        -----------
+
+        The plan is built once from the lut, so a parser only has to look up
+        each sheet line to know which cells fill which redcap columns.
+        """
+
+        index = {}
+        self.sources = {}
+        for key, rc_variables in node_lut.items():
+            data_cols = []
+            columns = []
+            missing_data_cols = []
+            for n, variable in enumerate(rc_variables):
+                if variable:
+                    data_cols.append(n)
+                    columns.append(index.setdefault(variable, len(index)))
                 else:
-                    if c_indent == 0:
-                        unique_stack.clear()
+                    missing_data_cols.append(n)
 
-                        current_test = c_text
-                        if current_test in test_counter:
-                            test_counter[current_test] += 1
-                        else:
-                            test_counter[current_test] = 1
+            self.sources[key] = (tuple(data_cols), tuple(columns), 
+                                 tuple(missing_data_cols))
 
-                        indent_mapper = {c_indent: 0}
-                        p_indent_key = c_indent
-                    else:
-                        unique_stack.pop()
-                        unique_stack.pop()
+        self.variables = list(index)
 
-                    unique_stack.append(c_text)
+    def new_row(self):
+        """Returns an empty row of the plan, all values are nan"""
 
-                output['identifier'].append(' | '.join(unique_stack))
-                output['test'].append(current_test)
-                output['test_no'].append(test_counter[current_test])
-
-                p_indent = c_indent
-
-    return output
+        return np.full(len(self.variables), np.nan, dtype=object)
 
 class lut():
 
-    def __init__(self, dept, excel, sheet_name=0):
+    def __init__(self, dept, excel, sheet_name=0, profiler=None):
 
         self.excel = excel
 
-        if excel.endswith('csv'):
-            self.df = pd.read_csv(excel)
-        else:
-            self.df = pd.read_excel(self.excel, sheet_name = sheet_name)
-
-        self.split_identifiers = [x.split(' | ') 
-                                  for x in self.df['identifier']]
-
-        if dept not in {'peds', 'epilepsy', 'dementia', 'aphasia'}:
-            raise Exception(f'Unknown dept: {dept}')
-        self.dept = dept
-
-        self.lut = self.convert_df_to_lut()
+        with instrument.stage(profiler, 'lut_read'):
+            if excel.endswith('csv'):
+                self.df = pd.read_csv(excel)
+            else:
+                self.df = pd.read_excel(self.excel, sheet_name = sheet_name)
+
+        with instrument.stage(profiler, 'lut_build'):
+            self.trie = identifier_trie()
+            self.nodes = [self.trie.insert(x) for x in self.df['identifier']]
+            self.split_identifiers = [list(self.trie.path(x)) 
+                                      for x in self.nodes]
+
+            if dept not in DEPTS:
+                raise Exception(f'Unknown dept: {dept}')
+            self.dept = dept
+
+            self.lut = self.convert_df_to_lut()
+            self.node_lut = self.convert_lut_to_nodes()
+
+    @staticmethod
+    def compiled_path(excel, sheet_name=0):
+        """Returns the default compiled artifact path for excel"""
+
+        stem = os.path.splitext(excel)[0]
+        if sheet_name != 0:
+            stem = f'{stem}.{sheet_name}'
+
+        return stem + COMPILED_SUFFIX
+
+    def compile(self, artifact=None, sheet_name=0):
+        """
+        Writes the lut to a compiled artifact.
+
+        Parameters
+        ----------
+
+        artifact : str
+            the artifact path, defaults to compiled_path(self.excel, sheet_name)
+        sheet_name : str or int
+            the sheet the lut was read from
+
+        Returns
+        -------
+
+        artifact : str
+            the artifact path
+
+        Description
+        -----------
+
+        The artifact is a pickle of the lut attributes and a header holding
+        the sha256 of the source spreadsheet, so load_compiled can tell when
+        it is stale. It is written with atomic_write, so readers never see
+        a partial artifact.
+        """
+
+        if artifact is None:
+            artifact = self.compiled_path(self.excel, sheet_name)
+
+        compiled = {
+            'version': COMPILED_VERSION,
+            'pandas': pd.__version__,
+            'dept': self.dept,
+            'sheet_name': sheet_name,
+            'sha256': hash_file(self.excel),
+            'df': self.df,
+            'split_identifiers': self.split_identifiers,
+            'lut': self.lut,
+            'trie': self.trie,
+            'nodes': self.nodes,
+            'node_lut': self.node_lut,
+        }
+
+        atomic_write(artifact, pickle.dumps(compiled, 
+                                            protocol=pickle.HIGHEST_PROTOCOL))
+
+        return artifact
+
+    @classmethod
+    def load_compiled(cls, dept, excel, sheet_name=0, artifact=None,
+                      profiler=None):
+        """
+        Loads a lut from its compiled artifact, compiling it if needed.
+
+        Parameters
+        ----------
+
+        dept : str
+            the department of the lut
+        excel : str
+            the source lut spreadsheet or csv
+        sheet_name : str or int
+            the sheet to read from excel
+        artifact : str
+            the artifact path, defaults to compiled_path(excel, sheet_name)
+        profiler : profiler
+            if given, reading the artifact is timed and rebuilds are counted
+
+        Returns
+        -------
+
+        lut : lut
+            the lookup table
+
+        Description
+        -----------
+
+        The artifact is used as is while it is newer than excel. If excel is
+        newer, its sha256 is compared with the one stored in the artifact,
+        and the artifact is rebuilt only if the contents changed. An artifact
+        from another COMPILED_VERSION, pandas version, dept or sheet, or one
+        that cannot be read, is also rebuilt. If the artifact cannot be
+        written, the lut is still returned.
+        """
+
+        if artifact is None:
+            artifact = cls.compiled_path(excel, sheet_name)
+
+        compiled = None
+        try:
+            with instrument.stage(profiler, 'lut_load_compiled'):
+                with open(artifact, 'rb') as f:
+                    compiled = pickle.load(f)
+        except Exception:
+            # missing and corrupt artifacts are both rebuilt
+            pass
+
+        if (compiled is not None and
+            (compiled.get('version') != COMPILED_VERSION or
+             compiled.get('pandas') != pd.__version__ or
+             compiled.get('dept') != dept or
+             compiled.get('sheet_name') != sheet_name)):
+            compiled = None
+
+        if (compiled is not None and 
+            os.path.getmtime(excel) > os.path.getmtime(artifact)):
+            if compiled['sha256'] == hash_file(excel):
+                try:
+                    os.utime(artifact)
+                except OSError:
+                    pass
+            else:
+                compiled = None
+
+        if compiled is None:
+            if profiler is not None:
+                profiler.count('lut_rebuilds')
+            new_lut = cls(dept, excel, sheet_name=sheet_name, 
+                          profiler=profiler)
+            try:
+                new_lut.compile(artifact, sheet_name)
+            except OSError:
+                pass
+            return new_lut
+
+        new_lut = cls.__new__(cls)
+        new_lut.excel = excel
+        new_lut.dept = dept
+        new_lut.df = compiled['df']
+        new_lut.split_identifiers = compiled['split_identifiers']
+        new_lut.lut = compiled['lut']
+        new_lut.trie = compiled['trie']
+        new_lut.nodes = compiled['nodes']
+        new_lut.node_lut = compiled['node_lut']
+
+        return new_lut
 
     def convert_df_to_lut(self):
         """Converts a df lut to a dict lut"""
@@ -185,9 +425,24 @@ class lut():
 
         return results
 
+    def convert_lut_to_nodes(self):
+        """Returns lut keyed by (trie node, test_no) instead of identifier"""
+
+        return {(self.trie.insert(identifier), test_no): values
+                for (identifier, test_no), values in self.lut.items()}
+
+    def get_column_plan(self):
+        """Returns the column_plan of the lut, built on first use"""
+
+        plan = getattr(self, '_column_plan', None)
+        if plan is None:
+            plan = column_plan(self.node_lut)
+            self._column_plan = plan
+
+        return plan
+
     def get_headers_at_indent_level(self, level):
         """Returns all headers at indent level `level`"""
 
-        return ['' if len(x) < (level + 1) else x[level] 
-                for x in self.split_identifiers]
+        return [self.trie.level(x, level) for x in self.nodes]
 
@@ -0,0 +1,148 @@
+import re
+
+# score types for 'ss' cells, the values index the redcap variables for a row
+SS_INVALID = 0
+SS_STANDARD = 1
+SS_SCALED = 2
+SS_T = 3
+
+# the normalized kind of an 'ss' cell
+SS_KEEP = 'keep'            # unmatched string, kept without a redcap variable
+SS_CLASSIFY = 'classify'    # number to classify with the percentile
+SS_T_SCORE = 't_score'      # t score given by the cell format or a "T" prefix
+SS_NONE = 'none'            # any other data type, every variable is empty
+
+T_NUMBER_FORMAT = '"T"\\ 0;"T"\\ \\-0;"T"\\ 0;"T"\\ @'
+
+# 'ss' strings: "T 45", "T>45", "<5", "> 5"
+SS_PATTERN = re.compile(r'T[ ]*>?(?P<t_score>\d+)|[<>][ ]?(?P<bound>\d+)')
+
+# t formatted 'ss' strings drop every sign and space, "T 45" is shown as "45"
+T_STRIP_TABLE = str.maketrans('', '', '<> ')
+
+# 'equivalent' strings: "<5:0", "5-6", "5:3", "5:3-6:0"
+EQUIVALENT_PATTERN = re.compile(
+    r'(?P<sign>[<>].*)'
+    r'|(?P<range>\d+-\d+)'
+    r'|(?P<years>\d+):(?P<months>\d+)'
+    r'(?:-(?P<high_years>\d+):(?P<high_months>\d+))?',
+    re.DOTALL)
+
+def _ss_number(value):
+    return SS_CLASSIFY, value
+
+def _ss_t_number(value):
+    return SS_T_SCORE, value
+
+def _ss_t_string(value):
+    return SS_T_SCORE, float(value.strip().translate(T_STRIP_TABLE))
+
+def _ss_string(value):
+    m = SS_PATTERN.fullmatch(value)
+    if m is None:
+        return SS_KEEP, value
+
+    t_score, bound = m.group('t_score', 'bound')
+    if t_score is not None:
+        return SS_T_SCORE, float(t_score)
+    return SS_CLASSIFY, float(bound)
+
+def _ss_other(value):
+    return SS_NONE, None
+
+def _equivalent_number(value):
+    return None, float(value), None
+
+def _equivalent_string(value):
+    m = EQUIVALENT_PATTERN.fullmatch(value)
+    if m is None:
+        return None
+
+    if m.lastgroup == 'sign' or m.lastgroup == 'range':
+        return value, None, None
+
+    years, months, high_years, high_months = m.group(
+        'years', 'months', 'high_years', 'high_months')
+    age = float(years) * 12 + float(months)
+    if high_years is None:
+        return None, age, None
+    return None, age, float(high_years) * 12 + float(high_months)
+
+def _equivalent_other(value):
+    return None
+
+# (data_type, number_format) -> normalizer, a number_format of None matches
+# any format without its own entry
+SS_DISPATCH = {
+    ('n', T_NUMBER_FORMAT): _ss_t_number,
+    ('n', None): _ss_number,
+    ('s', T_NUMBER_FORMAT): _ss_t_string,
+    ('s', None): _ss_string,
+}
+
+EQUIVALENT_DISPATCH = {
+    ('n', None): _equivalent_number,
+    ('s', None): _equivalent_string,
+}
+
+def _dispatch(table, cell, default):
+    normalize = table.get((cell.data_type, cell.number_format))
+    if normalize is None:
+        normalize = table.get((cell.data_type, None), default)
+
+    return normalize(cell.value)
+
+def normalize_ss_cell(cell):
+    """
+    Normalizes a non-empty 'ss' cell.
+
+    Parameters
+    ----------
+
+    cell : Cell
+        the cell from an openpyxl sheet or a sheet_snapshot
+
+    Returns
+    -------
+
+    kind : str
+        SS_T_SCORE if the value is a t score, SS_CLASSIFY if the value must be
+        classified with the row percentile, SS_KEEP if the value is a string
+        kept as is and SS_NONE for any other data type
+    value : str or float
+        the postprocessed cell value
+
+    Description
+    -----------
+
+    The normalizer is looked up by (data_type, number_format), so a string is
+    matched once against a single precompiled pattern.
+    """
+
+    return _dispatch(SS_DISPATCH, cell, _ss_other)
+
+def normalize_equivalent_cell(cell):
+    """
+    Normalizes a non-empty 'equivalent' cell.
+
+    Parameters
+    ----------
+
+    cell : Cell
+        the cell from an openpyxl sheet or a sheet_snapshot
+
+    Returns
+    -------
+
+    values : tuple or None
+        the (sign, age_equivalent, high_equivalent) values, age equivalents
+        are in months, or None if the value has no redcap variable
+
+    Description
+    -----------
+
+    The normalizer is looked up by data_type, so a string is matched once
+    against a single precompiled pattern.
+    """
+
+    return _dispatch(EQUIVALENT_DISPATCH, cell, _equivalent_other)
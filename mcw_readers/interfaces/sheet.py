@@ -0,0 +1,335 @@
+from collections import namedtuple
+
+import openpyxl
+
+import numpy as np
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple
+
+# private, the stream engine falls back to a full load without it
+try:
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:
+    WorkSheetParser = None
+
+class snapshot_cell(namedtuple('snapshot_cell',
+                               'row column value data_type number_format indent')):
+    """A read only cell taken from a sheet_snapshot (row and column are 1-based)"""
+
+    __slots__ = ()
+
+    @property
+    def column_letter(self):
+        return get_column_letter(self.column)
+
+sheet_index = namedtuple('sheet_index', 'anchor labels prefixed')
+
+# the openpyxl cell data types, stored in a snapshot by their index
+DATA_TYPES = ['n', 's', 'f', 'b', 'e', 'd', 'str', 'inlineStr']
+DATA_TYPE_CODES = {x: i for i, x in enumerate(DATA_TYPES)}
+STRING_CODE = DATA_TYPE_CODES['s']
+
+sheet_label = namedtuple('sheet_label', 'row col text value_col value')
+
+class sheet_snapshot():
+
+    def __init__(self, title, cells, hidden_rows):
+        """
+        Initializes sheet_snapshot.
+
+        Parameters
+        ----------
+
+        title : str
+            the sheet title
+        cells : list of tuple
+            (row, column, value, data_type, number_format, indent) for the
+            cells in the sheet, row and column are 1-based; cells without a
+            value are only kept inside the bounds of the cells with one
+        hidden_rows : iterable of int
+            the hidden rows in the sheet (1-based)
+
+        Attributes
+        ----------
+            title : str
+                the sheet title
+            max_row : int
+                the last row containing a value (1-based)
+            max_column : int
+                the last column containing a value (1-based)
+            values : ndarray (max_column, max_row + 1)
+                the cell values
+            data_types : ndarray (max_column, max_row + 1)
+                the index of each cell data type in DATA_TYPES
+            number_format_codes : ndarray (max_column, max_row + 1)
+                the index of each cell number format in number_formats
+            number_formats : list of str
+                the distinct number formats in the sheet
+            indents : ndarray (max_column, max_row + 1)
+                the cell alignment indents
+            hidden : ndarray (max_row + 1,)
+                the row hidden flags
+
+        Description
+        -----------
+
+        The arrays are column oriented and indexed [col, row] with a 0-based
+        col and a 1-based row, so sh[row][col] in openpyxl becomes
+        snapshot.value(row, col). Row 0 is never filled. Cells outside the
+        snapshot behave like empty openpyxl cells, so the formatting of empty
+        cells past the last value, common in templates, is not stored.
+        """
+
+        self.title = title
+        self.max_row = max((x[0] for x in cells if x[2] is not None), 
+                           default=0)
+        self.max_column = max((x[1] for x in cells if x[2] is not None), 
+                              default=0)
+
+        shape = (self.max_column, self.max_row + 1)
+        self.values = np.full(shape, None, dtype=object)
+        self.data_types = np.zeros(shape, dtype=np.uint8)
+        self.number_format_codes = np.zeros(shape, dtype=np.int32)
+        self.number_formats = ['General']
+        self.indents = np.zeros(shape, dtype=np.float64)
+        self.hidden = np.zeros(self.max_row + 1, dtype=bool)
+
+        format_codes = {'General': 0}
+        for row, column, value, data_type, number_format, indent in cells:
+            if row > self.max_row or column > self.max_column:
+                continue
+
+            if number_format not in format_codes:
+                format_codes[number_format] = len(self.number_formats)
+                self.number_formats.append(number_format)
+
+            self.values[column - 1, row] = value
+            self.data_types[column - 1, row] = DATA_TYPE_CODES[data_type]
+            self.number_format_codes[column - 1, row] = format_codes[number_format]
+            self.indents[column - 1, row] = indent
+
+        for row in hidden_rows:
+            if row <= self.max_row:
+                self.hidden[row] = True
+
+    def _contains(self, row, col):
+        return 0 <= col < self.max_column and 1 <= row <= self.max_row
+
+    def value(self, row, col):
+        """Returns the value of the cell at row (1-based), col (0-based)"""
+
+        if self._contains(row, col):
+            return self.values[col, row]
+        return None
+
+    def value_at(self, coordinate):
+        """Returns the value of the cell at an excel coordinate like 'C4'"""
+
+        row, column = coordinate_to_tuple(coordinate)
+        return self.value(row, column - 1)
+
+    def data_type(self, row, col):
+        """Returns the data type of the cell at row (1-based), col (0-based)"""
+
+        if self._contains(row, col):
+            return DATA_TYPES[self.data_types[col, row]]
+        return 'n'
+
+    def number_format(self, row, col):
+        """Returns the number format of the cell at row (1-based), col (0-based)"""
+
+        if self._contains(row, col):
+            return self.number_formats[self.number_format_codes[col, row]]
+        return 'General'
+
+    def indent(self, row, col):
+        """Returns the indent of the cell at row (1-based), col (0-based)"""
+
+        if self._contains(row, col):
+            return self.indents[col, row]
+        return 0.0
+
+    def is_hidden(self, row):
+        """Returns True if row (1-based) is hidden"""
+
+        return 1 <= row <= self.max_row and bool(self.hidden[row])
+
+    def cell(self, row, col):
+        """Returns the snapshot_cell at row (1-based), col (0-based)"""
+
+        return snapshot_cell(row,
+                             col + 1,
+                             self.value(row, col),
+                             self.data_type(row, col),
+                             self.number_format(row, col),
+                             self.indent(row, col))
+
+def index_sheet(snapshot, anchor, prefixes):
+    """
+    Indexes the anchor, labels and prefixed strings of a sheet in one pass.
+
+    Parameters
+    ----------
+
+    snapshot : sheet_snapshot
+        the sheet to index
+    anchor : str
+        the string cell value to locate
+    prefixes : tuple of str
+        the string cell prefixes to locate
+
+    Returns
+    -------
+
+    index : sheet_index
+        anchor -> (row, col) of the first cell equal to anchor, or None
+        labels -> list of sheet_label for each string cell ending in ':'
+        prefixed -> (row, col, value) of the first cell starting with one of
+                    prefixes, or None
+
+    Description
+    -----------
+
+    The non-empty cells are visited once row by row from the top of the
+    sheet. Each label is paired with the next non-empty cell to its right in
+    the same row (value_col and value are None if there is none). A cell
+    taken as a label value is not itself a label, as when reading a header
+    left to right. Rows are 1-based and cols are 0-based.
+    """
+
+    anchor_at = None
+    prefixed = None
+    labels = []
+    pending = None
+
+    for row, col in np.argwhere((snapshot.values != None).T):
+        row = int(row)
+        col = int(col)
+        value = snapshot.values[col, row]
+        is_string = snapshot.data_types[col, row] == STRING_CODE
+
+        if pending is not None and pending[0] != row:
+            labels.append(sheet_label(*pending, None, None))
+            pending = None
+
+        if is_string:
+            if anchor_at is None and value == anchor:
+                anchor_at = (row, col)
+            if prefixed is None and value.startswith(prefixes):
+                prefixed = (row, col, value)
+
+        if pending is not None and value:
+            labels.append(sheet_label(*pending, col, value))
+            pending = None
+        elif is_string and value.endswith(':'):
+            pending = (row, col, value)
+
+    if pending is not None:
+        labels.append(sheet_label(*pending, None, None))
+
+    return sheet_index(anchor_at, labels, prefixed)
+
+def snapshot_worksheet(ws):
+    """Returns a sheet_snapshot of an openpyxl worksheet"""
+
+    cells = [(cell.row,
+              cell.column,
+              cell.value,
+              cell.data_type,
+              cell.number_format,
+              cell.alignment.indent)
+             for row in ws.iter_rows() for cell in row
+             if cell.value is not None or cell.has_style]
+    hidden_rows = [row for row, rd in ws.row_dimensions.items() if rd.hidden]
+
+    return sheet_snapshot(ws.title, cells, hidden_rows)
+
+def stream_sheet(wb_fname, sheet_name='Template'):
+    """
+    Streams a single sheet from a workbook into a sheet_snapshot.
+
+    Parameters
+    ----------
+
+    wb_fname : str or BytesIO
+        path to excel workbook, or a BytesIO holding its bytes
+    sheet_name : str
+        the sheet to stream
+
+    Returns
+    -------
+
+    snapshot : sheet_snapshot
+        the snapshot of the streamed sheet
+
+    Description
+    -----------
+
+    The workbook is opened in read only mode, so the other sheets are never
+    parsed. The sheet xml is walked once, capturing the cell values, data
+    types, number formats, indents and the row hidden flags. Skipping the
+    other sheets is where the time is saved; on a workbook with a single
+    sheet, a full load is about as fast.
+
+    This drives the private openpyxl sheet parser, which is only tested
+    with the openpyxl versions pinned in setup.py. If the parser cannot be
+    imported or used, the workbook is loaded in full and snapshot with
+    snapshot_worksheet instead, which gives the same snapshot more slowly.
+    """
+
+    if WorkSheetParser is not None:
+        try:
+            return _stream_sheet(wb_fname, sheet_name)
+        except (AttributeError, TypeError):
+            # the private api changed
+            if hasattr(wb_fname, 'seek'):
+                wb_fname.seek(0)
+
+    wb = openpyxl.load_workbook(wb_fname, data_only=True)
+    try:
+        return snapshot_worksheet(wb[sheet_name])
+    finally:
+        wb.close()
+
+def _stream_sheet(wb_fname, sheet_name):
+    wb = openpyxl.load_workbook(wb_fname, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name]
+
+        number_formats = []
+        indents = []
+        for style in wb._cell_styles:
+            if style.numFmtId < BUILTIN_FORMATS_MAX_SIZE:
+                number_formats.append(
+                    BUILTIN_FORMATS.get(style.numFmtId, 'General'))
+            else:
+                number_formats.append(wb._number_formats[
+                    style.numFmtId - BUILTIN_FORMATS_MAX_SIZE])
+            indents.append(wb._alignments[style.alignmentId].indent)
+
+        cells = []
+        with ws._get_source() as src:
+            parser = WorkSheetParser(src,
+                                     ws._shared_strings,
+                                     data_only=True,
+                                     epoch=wb.epoch,
+                                     date_formats=wb._date_formats,
+                                     timedelta_formats=wb._timedelta_formats)
+
+            for row, row_cells in parser.parse():
+                cells.extend((row,
+                              x['column'],
+                              x['value'],
+                              x['data_type'],
+                              number_formats[x['style_id']],
+                              indents[x['style_id']])
+                             for x in row_cells)
+
+        hidden_rows = [int(row) for row, attrs in parser.row_dimensions.items()
+                       if attrs.get('hidden') in {'1', 'true'}]
+    finally:
+        wb.close()
+
+    return sheet_snapshot(sheet_name, cells, hidden_rows)
@@ -0,0 +1,152 @@
+import sys
+
+SEPARATOR = ' | '
+
+class identifier_trie():
+
+    ROOT = 0
+
+    def __init__(self):
+        """
+        Initializes identifier_trie.
+
+        Attributes
+        ----------
+            labels : list of str
+                the interned label of each node, None for the root
+            parents : list of int
+                the parent of each node, -1 for the root
+            depths : list of int
+                the depth of each node, 0 for the root
+
+        Description
+        -----------
+
+        An identifier like 'TEST | Subtest | Item' is a path of labels from
+        the root. Each distinct path is stored once as an integer node id,
+        so a line of a neuroscore sheet or a lut row can be held and looked
+        up as a small (node, test_no) key instead of the joined identifier.
+        A parent always has a smaller id than its children. The joined
+        identifiers are only built when they are asked for.
+        """
+
+        self.labels = [None]
+        self.parents = [-1]
+        self.depths = [0]
+        self._children = {}
+        self._identifiers = {}
+        self._paths = {self.ROOT: ()}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getstate__(self):
+        # the joined identifiers and paths are rebuilt on demand
+        return {'labels': self.labels,
+                'parents': self.parents,
+                'depths': self.depths}
+
+    def __setstate__(self, state):
+        self.labels = [None] + [sys.intern(x) for x in state['labels'][1:]]
+        self.parents = state['parents']
+        self.depths = state['depths']
+        self._children = {(parent, label): node for node, (parent, label)
+                          in enumerate(zip(self.parents, self.labels))
+                          if node != self.ROOT}
+        self._identifiers = {}
+        self._paths = {self.ROOT: ()}
+
+    def child(self, parent, label):
+        """Returns the node for label under parent, adding it if needed"""
+
+        key = (parent, label)
+        node = self._children.get(key)
+        if node is None:
+            node = len(self.labels)
+            self.labels.append(sys.intern(label))
+            self.parents.append(parent)
+            self.depths.append(self.depths[parent] + 1)
+            self._children[key] = node
+
+        return node
+
+    def extend(self, parent, text):
+        """Returns the node for text under parent, text may hold SEPARATOR"""
+
+        for label in text.split(SEPARATOR):
+            parent = self.child(parent, label)
+
+        return parent
+
+    def insert(self, identifier):
+        """Returns the node for a joined identifier, adding it if needed"""
+
+        return self.extend(self.ROOT, identifier)
+
+    def get(self, parent, label):
+        """Returns the node for label under parent, -1 if there is none"""
+
+        return self._children.get((parent, label), -1)
+
+    def path(self, node):
+        """Returns the labels from the root to node as a tuple"""
+
+        path = self._paths.get(node)
+        if path is None:
+            path = self.path(self.parents[node]) + (self.labels[node],)
+            self._paths[node] = path
+
+        return path
+
+    def identifier(self, node):
+        """Returns the joined identifier of node"""
+
+        identifier = self._identifiers.get(node)
+        if identifier is None:
+            identifier = SEPARATOR.join(self.path(node))
+            self._identifiers[node] = identifier
+
+        return identifier
+
+    def test(self, node):
+        """Returns the top level label of node"""
+
+        return self.path(node)[0]
+
+    def level(self, node, level):
+        """Returns the label of node at depth level + 1, '' if node is shallower"""
+
+        path = self.path(node)
+        return path[level] if level < len(path) else ''
+
+    def translate(self, other):
+        """
+        Maps the nodes of other onto this trie.
+
+        Parameters
+        ----------
+
+        other : identifier_trie
+            the trie to map
+
+        Returns
+        -------
+
+        nodes : list of int
+            the node in this trie with the same path as each node in other,
+            -1 if this trie has no such node
+
+        Description
+        -----------
+
+        Parents come before their children, so the map is filled in one pass
+        over other with a single (parent, label) lookup per node.
+        """
+
+        children = self._children
+        nodes = [self.ROOT]
+        for parent, label in zip(other.parents[1:], other.labels[1:]):
+            parent = nodes[parent]
+            nodes.append(children.get((parent, label), -1) if parent >= 0 else -1)
+
+        return nodes
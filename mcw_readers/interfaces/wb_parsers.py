@@ -1,4 +1,4 @@
-import re
+import logging
 
 from datetime import datetime
 from collections import namedtuple
@@ -14,10 +14,25 @@ except ImportError:
     import importlib_resources as pkg_resources
 
 from mcw_readers.interfaces.lut import lut
+from mcw_readers.interfaces.trie import identifier_trie
+from mcw_readers.interfaces.normalize import (
+    SS_INVALID, SS_STANDARD, SS_SCALED, SS_T, SS_KEEP, SS_CLASSIFY, SS_T_SCORE,
+    normalize_ss_cell, normalize_equivalent_cell)
+from mcw_readers.interfaces.sheet import (
+    index_sheet, snapshot_worksheet, stream_sheet)
 from mcw_readers import data
-from mcw_readers.utils import DF_PSYCHOMETRIC, DICT_PSYCHOMETRIC, close_any
+from mcw_readers import utils
+from mcw_readers import instrument
+from mcw_readers.utils import close_any
 
-line = namedtuple('line', 'identifier test_no row')
+line = namedtuple('line', 'node test_no row')
+
+plan_row = namedtuple('plan_row', 'values order')
+
+# bump when the cached sheet snapshot or line parsing changes
+PARSER_VERSION = '4'
+
+logger = logging.getLogger(__name__)
 
 class PedsParserError(Exception):
     """Exception raised if there is an error while parsing a peds neuroscore file"""
@@ -55,9 +70,9 @@ def peds_determine_variable_value(value, rc_variables, percentile):
     """
 
     if ~np.isnan(percentile):
-        standard_scores = DICT_PSYCHOMETRIC['standard_score'][percentile]
-        scaled_scores = DICT_PSYCHOMETRIC['scaled_score'][percentile]
-        t_scores = DICT_PSYCHOMETRIC['t_score'][percentile]
+        standard_scores = utils.DICT_PSYCHOMETRIC['standard_score'][percentile]
+        scaled_scores = utils.DICT_PSYCHOMETRIC['scaled_score'][percentile]
+        t_scores = utils.DICT_PSYCHOMETRIC['t_score'][percentile]
         
         if (value in standard_scores or
             (percentile == 1 and (value < 67 and value >= 32))):
@@ -110,7 +125,141 @@ def peds_determine_variable_value(value, rc_variables, percentile):
             raise PedsParserError()
 
     return variable_values
-    
+
+def _ss_variable_values(rc_variables, score_type, value):
+    """Returns the 'ss' variable values for a classified value"""
+
+    return [(rc_variables[n], value if n == score_type else None)
+            for n in (SS_STANDARD, SS_SCALED, SS_T)]
+
+def peds_classify_ss_values(values, percentiles):
+    """
+    Classifies 'ss' values as standard, scaled or t scores.
+
+    This is the batched form of peds_determine_variable_value.
+
+    Parameters
+    ----------
+
+    values : array-like of float
+        the cell values
+    percentiles : array-like of float
+        the percentile value for the row of each cell, nan if there is none
+
+    Returns
+    -------
+
+    score_types : ndarray of int
+        SS_STANDARD, SS_SCALED, SS_T or SS_INVALID for each value, where
+        SS_INVALID is a value peds_determine_variable_value rejects; the
+        score type indexes the redcap variables of the row as in
+        peds_determine_variable_value
+
+    Description
+    -----------
+
+    Each percentile is looked up in the sorted percentile ranks of the
+    psychometric conversion table, then the values are tested against the
+    utils.BOUNDS_PSYCHOMETRIC score intervals for that percentile all at
+    once. A KeyError is raised for a percentile missing from the table, as
+    with peds_determine_variable_value.
+    """
+
+    values = np.asarray(values, dtype=float)
+    percentiles = np.asarray(percentiles, dtype=float)
+    bounds = utils.BOUNDS_PSYCHOMETRIC
+
+    has_percentile = ~np.isnan(percentiles)
+    ranks = bounds['percentile_rank']
+    idx = np.clip(np.searchsorted(ranks, percentiles), 0, len(ranks) - 1)
+
+    unknown = has_percentile & (ranks[idx] != percentiles)
+    if unknown.any():
+        raise KeyError(percentiles[unknown][0])
+
+    is_one = percentiles == 1
+    is_standard = (((values >= bounds['standard_score_min'][idx]) &
+                    (values <= bounds['standard_score_max'][idx]) &
+                    (values == np.floor(values))) |
+                   (is_one & (values < 67) & (values >= 32)))
+    is_scaled = (((values > bounds['scaled_score_min'][idx] - 3) &
+                  (values < bounds['scaled_score_max'][idx] + 3)) |
+                 (is_one & (values < 4) & (values > 0)))
+    is_t = (((values > bounds['t_score_min'][idx] - 3) &
+             (values < bounds['t_score_max'][idx] + 3)) |
+            (is_one & (values < 28) & (values > 0)))
+
+    with_percentile = np.select([is_standard, is_scaled, is_t],
+                                [SS_STANDARD, SS_SCALED, SS_T],
+                                SS_INVALID)
+    without_percentile = np.select([values >= 80,
+                                    (values >= 0) & (values < 21),
+                                    (values > 21) & (values < 50)],
+                                   [SS_STANDARD, SS_SCALED, SS_T],
+                                   SS_INVALID)
+
+    return np.where(has_percentile, with_percentile, without_percentile)
+
+def peds_get_ss_variables(cells, rc_variables, percentiles):
+    """
+    Returns the redcap variables and postprocessed values for 'ss' cells
+
+    This is the batched form of peds_get_ss_variable. The cells are
+    normalized one by one, then every number left to classify with its
+    percentile goes through a single peds_classify_ss_values call.
+
+    Parameters
+    ----------
+
+    cells : list of Cell
+        the cells from an openpyxl sheet or a sheet_snapshot
+    rc_variables : list of list of str
+        the list of redcap variables for the row of each cell
+    percentiles : list of float
+        the percentile value for the row of each cell
+
+    Returns
+    -------
+
+    all_variable_values : list of list of tuple
+        the (rc_variable, postprocessed_value) pairs for each cell, as
+        returned by peds_get_ss_variable; PedsParserError is raised if any
+        value cannot be classified
+    """
+
+    all_variable_values = [None] * len(cells)
+    to_classify = []
+
+    for i, (cell, variables) in enumerate(zip(cells, rc_variables)):
+        value = cell.value
+        if value is None or value in neuroscore_parser.NAN_VALUES:
+            all_variable_values[i] = [(None, value)]
+            continue
+
+        kind, postprocessed_value = normalize_ss_cell(cell)
+        if kind == SS_CLASSIFY:
+            to_classify.append((i, postprocessed_value))
+        elif kind == SS_T_SCORE:
+            all_variable_values[i] = _ss_variable_values(
+                variables, SS_T, postprocessed_value)
+        elif kind == SS_KEEP:
+            all_variable_values[i] = [(None, postprocessed_value)]
+        else:
+            all_variable_values[i] = _ss_variable_values(
+                variables, SS_INVALID, None)
+
+    if to_classify:
+        score_types = peds_classify_ss_values(
+            [value for _, value in to_classify],
+            [percentiles[i] for i, _ in to_classify])
+
+        for (i, value), score_type in zip(to_classify, score_types):
+            if score_type == SS_INVALID:
+                raise PedsParserError()
+            all_variable_values[i] = _ss_variable_values(
+                rc_variables[i], score_type, value)
+
+    return all_variable_values
 
 def peds_get_ss_variable(cell, rc_variables, percentile):
     """
@@ -120,7 +269,7 @@ def peds_get_ss_variable(cell, rc_variables, percentile):
     ----------
     
     cell : Cell
-        the cell from an openpyxl sheet
+        the cell from an openpyxl sheet or a sheet_snapshot
     rc_variables : list of str
         the list of redcap variables for the row of cell
     percentile : float
@@ -149,49 +298,23 @@ def peds_get_ss_variable(cell, rc_variables, percentile):
     value = cell.value
     
     if value is not None and value not in neuroscore_parser.NAN_VALUES: 
-        print(cell.row, cell.column_letter, value, cell.data_type)
-
-        if cell.data_type == 'n':
-            if cell.number_format == '"T"\\ 0;"T"\\ \\-0;"T"\\ 0;"T"\\ @':
-                variable_values = [
-                    (rc_variables[1], None),
-                    (rc_variables[2], None),
-                    (rc_variables[3], value),
-                ]
-            else:    
-                variable_values = peds_determine_variable_value(value, rc_variables, percentile)
-    
-        elif cell.data_type == 's':
-            if cell.number_format == '"T"\\ 0;"T"\\ \\-0;"T"\\ 0;"T"\\ @':
-                postprocessed_value = float(re.sub('[<>]?[ ]*', '', value.strip()))
-
-                variable_values = [
-                    (rc_variables[1], None),
-                    (rc_variables[2], None),
-                    (rc_variables[3], postprocessed_value),
-                ]
-            elif re.fullmatch('T[ ]*[>]?\d+', value):
-                postprocessed_value = float(re.sub('T[ ]*[>]?', '', value))
-    
-                variable_values = [
-                    (rc_variables[1], None),
-                    (rc_variables[2], None),
-                    (rc_variables[3], postprocessed_value),
-                ]
-
-            elif re.fullmatch('[<>][ ]?\d+', value):
-                value = float(re.sub('[<>][ ]?', '', value))
-                variable_values = peds_determine_variable_value(value, rc_variables, percentile)
-
-            else:
-                variable_values = [(None, value)]
-    
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('ss cell %s%s: %r (%s)', cell.column_letter, cell.row,
+                         value, cell.data_type, 
+                         extra={'row': cell.row, 'col': cell.column_letter,
+                                'value': value, 'data_type': cell.data_type})
+
+        kind, postprocessed_value = normalize_ss_cell(cell)
+        if kind == SS_CLASSIFY:
+            variable_values = peds_determine_variable_value(
+                postprocessed_value, rc_variables, percentile)
+        elif kind == SS_T_SCORE:
+            variable_values = _ss_variable_values(
+                rc_variables, SS_T, postprocessed_value)
+        elif kind == SS_KEEP:
+            variable_values = [(None, postprocessed_value)]
         else:
-            variable_values = [
-                (rc_variables[1], None),
-                (rc_variables[2], None),
-                (rc_variables[3], None),
-            ]
+            variable_values = _ss_variable_values(rc_variables, SS_INVALID, None)
     
     else:
         variable_values = [(None, value)]
@@ -238,97 +361,156 @@ class neuroscore_parser():
         'Choose One',
     }
 
-    def __init__(self, wb_fname, sheet_name='Template', verbose=True):
+    ENGINES = {'openpyxl', 'stream'}
+
+    DATA_ANCHOR = 'Raw'
+    EXAM_PREFIXES = ('DOS A:', 'EXAM A:', 'Exam A:')
+
+    def __init__(self, wb_fname, sheet_name='Template', verbose=True,
+                 engine='openpyxl', cache=None, profiler=None):
         """
         Initializes neuroscore_parser.
 
         Parameters
         ----------
 
-        wb_fname: str
-            path to excel workbook
-        verbose : str
-            be verboose about doing things
+        wb_fname: str or BytesIO
+            path to excel workbook, or a BytesIO holding its bytes
+        verbose : bool
+            log each parsed line at DEBUG level
+        engine : str
+            how the workbook is loaded
+                openpyxl - load the full workbook with openpyxl
+                stream   - stream only sheet_name in one read only pass,
+                           faster only when the other sheets are large
+        cache : content_cache
+            if given, the snapshot and lines are cached by the workbook
+            contents, so unchanged workbooks are not loaded again
+        profiler : profiler
+            if given, the loading and parsing stages are timed and the
+            lines, cells and new and missing lines are counted
 
         Attributes
         ----------
             fname : str
                 path to exel workbook
-            wb : Workbook
-                Workbook object for fname
-            sh : Sheet
-                Sheet object for "Template" in wb
+            snapshot : sheet_snapshot
+                snapshot of the "Template" sheet in fname; the workbook is
+                not kept after loading
+            index : sheet_index
+                the 'Raw' anchor, header labels and exam date anchor found
+                in one pass over snapshot
             first_data_row : int
-                first line in sh containing data (1-based)
+                first line in snapshot containing data (1-based)
+            trie : identifier_trie
+                the identifier hierarchy of the lines, line.node is a node
+                in trie
             lines : list of line
-                unique data entry lines in sh
+                unique data entry lines in snapshot
             unhidden_lines : list of line
-                line objects in lines that are unhidden in sh
+                line objects in lines that are unhidden in snapshot
         """
 
-        self.fname = wb_fname
-        self.wb = openpyxl.load_workbook(self.fname, data_only=True)
-        self.sh = self.wb[sheet_name]
-
-        self.first_data_row, self.first_data_col = self.find_first_data()
-        if self.first_data_row > self.sh.max_row:
-            raise Exception('first_data_row > sh.max_row')
+        if engine not in self.ENGINES:
+            raise Exception(f'Unknown engine: {engine}')
 
-        rd = self.sh.row_dimensions
-        self.lines = self.parse_lines(verbose)
-        self.unhidden_lines = [x for x in self.lines
-                               if not rd[x.row].hidden]
+        self.fname = wb_fname
+        self.profiler = profiler
+
+        if cache is not None:
+            with instrument.stage(profiler, 'cache_get'):
+                key = cache.key(
+                    self.fname, 
+                    f'neuroscore_parser:{PARSER_VERSION}:{sheet_name}')
+                cached = cache.get(key)
+            if cached is not None:
+                (self.snapshot, self.index, self.first_data_row, 
+                 self.first_data_col, self.trie, self.lines, 
+                 self.unhidden_lines) = cached
+                if profiler is not None:
+                    profiler.count('cache_hits')
+                return
+
+        with instrument.stage(profiler, 'load'):
+            if engine == 'openpyxl':
+                wb = openpyxl.load_workbook(self.fname, data_only=True)
+                self.snapshot = snapshot_worksheet(wb[sheet_name])
+            else:
+                self.snapshot = stream_sheet(self.fname, sheet_name)
+
+        with instrument.stage(profiler, 'index_sheet'):
+            self.index = index_sheet(self.snapshot, self.DATA_ANCHOR, 
+                                     self.EXAM_PREFIXES)
+
+        with instrument.stage(profiler, 'find_first_data'):
+            self.first_data_row, self.first_data_col = self.find_first_data()
+        if self.first_data_row > self.snapshot.max_row:
+            raise Exception('first_data_row > snapshot.max_row')
+
+        with instrument.stage(profiler, 'parse_lines'):
+            self.trie = identifier_trie()
+            self.lines = self.parse_lines(verbose)
+            self.unhidden_lines = [x for x in self.lines
+                                   if not self.snapshot.is_hidden(x.row)]
+        if profiler is not None:
+            profiler.count('lines', len(self.lines))
+
+        if cache is not None:
+            cache.put(key, (self.snapshot, self.index, self.first_data_row,
+                            self.first_data_col, self.trie, self.lines,
+                            self.unhidden_lines))
 
     def find_first_data(self):
         """Returns the row, column for the first data entry"""
 
-        for row, row_cells in enumerate(self.sh.iter_rows(), start=1):
-            for col, cell in enumerate(row_cells):
-                if cell.data_type == 's' and cell.value == 'Raw':
-                    first_row = row + 1
-                    first_col = col - 1
-                    break
-            else:
-                continue
-            break
+        raw = self.index.anchor
+        if raw is None:
+            raise Exception('Could not find Raw in snapshot')
 
-        while self.sh[first_row][first_col].data_type == 'n':
+        first_row = raw[0] + 1
+        first_col = raw[1] - 1
+
+        while (first_row <= self.snapshot.max_row and
+               self.snapshot.data_type(first_row, first_col) == 'n'):
             first_row = first_row + 1
 
         return (first_row, first_col)
 
     def parse_lines(self, verbose=True):
-        """Returns unique data entry line identifiers in wb"""
+        """Returns unique data entry lines in wb, the lines are added to trie"""
         col = self.first_data_col
+        trie = self.trie
 
         output = []
         test_counter = {}
 
         # process first line here
-        current_test = self.sh[self.first_data_row][col].value
+        snapshot = self.snapshot
+
+        current_test = snapshot.value(self.first_data_row, col)
         test_counter[current_test] = 1
 
-        unique_stack = [self.sh[self.first_data_row][col].value]
-        p_indent = self.sh[self.first_data_row][col].alignment.indent
+        # node_stack[-1] is the node of the current line
+        node_stack = [trie.extend(trie.ROOT, current_test)]
+        p_indent = snapshot.indent(self.first_data_row, col)
         indent_mapper = {p_indent: 0}
         p_indent_key = p_indent
 
-        output.append(line(" | ".join(unique_stack), 
+        output.append(line(node_stack[-1], 
                            test_counter[current_test],
                            self.first_data_row))
 
-        start_row = self.first_data_row + 1
-        for current_line, row in enumerate(
-            self.sh.iter_rows(min_row=start_row), start=start_row
-        ):
-            if (row and
-                row[col].value and
-                row[col].value.strip() and
-                not row[col].value.strip().startswith('*')):
+        # checked once, so disabled logging costs nothing per line
+        log_lines = verbose and logger.isEnabledFor(logging.DEBUG)
 
-                c_text = row[col].value
+        start_row = self.first_data_row + 1
+        for current_line in range(start_row, snapshot.max_row + 1):
+            c_text = snapshot.value(current_line, col)
+            if (c_text and
+                c_text.strip() and
+                not c_text.strip().startswith('*')):
 
-                c_indent = row[col].alignment.indent
+                c_indent = snapshot.indent(current_line, col)
                 if c_text.startswith(' '):
                     c_indent = c_indent + 1
 
@@ -337,14 +519,18 @@ class neuroscore_parser():
                     p_indent_key = c_indent
                 c_indent = indent_mapper[c_indent]
 
-                if verbose:
-                    print(f"Parsing line : {current_line} : {c_text} : {c_indent}")
+                if log_lines:
+                    logger.debug('Parsing line : %d : %s : %d', current_line,
+                                 c_text, c_indent,
+                                 extra={'row': current_line, 'text': c_text,
+                                        'indent': c_indent})
 
                 c_text = c_text.strip()
 
                 if c_indent == p_indent:
-                    unique_stack.pop()
-                    unique_stack.append(c_text)
+                    node_stack.pop()
+                    node_stack.append(trie.extend(
+                        node_stack[-1] if node_stack else trie.ROOT, c_text))
 
                     if c_indent == 0:
                         current_test = c_text
@@ -354,10 +540,10 @@ class neuroscore_parser():
                             test_counter[current_test] = 1
                         
                 elif c_indent > p_indent:
-                    unique_stack.append(c_text)
+                    node_stack.append(trie.extend(node_stack[-1], c_text))
                 else:
                     if c_indent == 0:
-                        unique_stack.clear()
+                        node_stack.clear()
 
                         current_test = c_text
                         if current_test in test_counter:
@@ -368,12 +554,13 @@ class neuroscore_parser():
                         indent_mapper = {c_indent: 0}
                         p_indent_key = c_indent
                     else:
-                        unique_stack.pop()
-                        unique_stack.pop()
+                        node_stack.pop()
+                        node_stack.pop()
 
-                    unique_stack.append(c_text)
+                    node_stack.append(trie.extend(
+                        node_stack[-1] if node_stack else trie.ROOT, c_text))
 
-                output.append(line(' | '.join(unique_stack), 
+                output.append(line(node_stack[-1], 
                                    test_counter[current_test],
                                    current_line))
 
@@ -381,23 +568,29 @@ class neuroscore_parser():
 
         return output
 
+    def lut_nodes(self, lut):
+        """Returns the lut trie node for each node in trie, -1 if not in lut"""
+
+        return lut.trie.translate(self.trie)
+
     def find_new_lines(self, lut):
-        """Return new lines in sh not found in lut"""
+        """Return new lines in snapshot not found in lut"""
 
-        new_lines = [line for identifier, test_no, row in self.lines
-                     if identifier not in lut.lut]
+        lut_nodes = self.lut_nodes(lut)
+        new_lines = [x for x in self.lines
+                     if (lut_nodes[x.node], x.test_no) not in lut.node_lut]
 
         return new_lines
 
     def find_administered_tests(self):
-        """Returns the administered test found in sh"""
+        """Returns the administered test found in snapshot"""
 
-        return [identifier for identifier, _, _ in self.unhidden_lines
-                if identifier.find(' | ') == -1]
+        return [self.trie.identifier(node) for node, _, _ in self.unhidden_lines
+                if self.trie.depths[node] == 1]
 
     def parse_data(self, lut, tp):
         """
-        Parse the data in sh using lut for timepoint tp
+        Parse the data in snapshot using lut for timepoint tp
 
         Parameters
         ----------
@@ -431,11 +624,67 @@ class neuroscore_parser():
             value      -> neuroscore value
         """
 
+        row, new_lines, missing_lines = self.parse_plan(lut, tp)
+        variables = lut.get_column_plan().variables
+        results = {variables[col]: [row.values[col]] for col in row.order}
+
+        return results, new_lines, missing_lines
+
+    def parse_plan(self, lut, tp):
+        """
+        Parse the data in snapshot into a row of the lut column plan
+
+        Parameters
+        ----------
+
+        lut : lut
+            The lookup table for parsing.
+        tp : int
+            The timepoint number
+
+        Returns
+        -------
+
+        row : plan_row
+            values -> ndarray with a value for each variable in the lut
+                      column_plan, nan if the sheet does not fill it
+            order  -> ndarray of the filled plan columns in the order they
+                      are first filled walking down the sheet
+        new_lines : dict
+            as returned by parse_data
+        missing_lines : dict
+            as returned by parse_data
+
+        Description
+        -----------
+
+        The sheet lines are looked up in the plan to collect the (row, col)
+        source of every plan column, then the cells are gathered from the
+        snapshot and placed in a preallocated row with two array
+        operations. A column filled by several lines keeps the last value,
+        as with parse_data.
+        """
+
+        with instrument.stage(self.profiler, 'parse_data'):
+            parsed = self._parse_plan(lut, tp)
+
+        if self.profiler is not None:
+            _, new_lines, missing_lines = parsed
+            self.profiler.count('new_lines', len(new_lines['row']))
+            self.profiler.count('missing_lines', len(missing_lines['row']))
+
+        return parsed
+
+    def _parse_plan(self, lut, tp):
+        if pd.isna(tp) or tp < 1:
+            raise Exception(f'Invalid timepoint: {tp}')
+
         data_cols = ['raw', 'ss', 'percentile', 'notes']
         tp_offset = 4 * (tp - 1)
         col_offset = 2 + tp_offset
-            
-        results = {}
+
+        plan = lut.get_column_plan()
+        
         new_lines = {
             'test': [],
             'test_no': [],
@@ -452,37 +701,77 @@ class neuroscore_parser():
             'value': [],
         }
 
-        for identifier, test_no, row in self.unhidden_lines:
-            key = (identifier, test_no)
-            if key in lut.lut:
-                rc_variables = lut.lut[key]
-
-                for n, variable in enumerate(rc_variables):
-                    try:
-                        value = self.sh[row][n + col_offset].value
-                        if value in self.NAN_VALUES:
-                            value = np.nan
-                    except:
-                        value = np.nan
-
-                    if variable:
-                        results[variable] = [value]
-                    elif not pd.isna(value):
-                        missing_lines['test'].append(identifier.split(' | ')[0])
-                        missing_lines['test_no'].append(test_no)
-                        missing_lines['identifier'].append(identifier)
-                        missing_lines['row'].append(row)
-                        missing_lines['col'].append(n + col_offset)
-                        missing_lines['name'].append(data_cols[n])
-                        missing_lines['value'].append(value)
-                        
+        source_rows = []
+        source_cols = []
+        columns = []
+        missing_sources = []
+
+        lut_nodes = self.lut_nodes(lut)
+        for node, test_no, row in self.unhidden_lines:
+            key = (lut_nodes[node], test_no)
+            if key in plan.sources:
+                line_data_cols, line_columns, line_missing = plan.sources[key]
+
+                source_rows.extend([row] * len(line_data_cols))
+                source_cols.extend(n + col_offset for n in line_data_cols)
+                columns.extend(line_columns)
+                missing_sources.extend((node, test_no, row, n) 
+                                       for n in line_missing)
             else:
-                new_lines['test'].append(identifier.split(' | ')[0])
+                new_lines['test'].append(self.trie.test(node))
                 new_lines['test_no'].append(test_no)
-                new_lines['identifier'].append(identifier)
+                new_lines['identifier'].append(self.trie.identifier(node))
                 new_lines['row'].append(row)
+
+        values = self._gather_values(source_rows, source_cols)
+        columns = np.array(columns, dtype=np.int64)
+
+        # fancy assignment order is unspecified for repeated columns, so
+        # only the last source of each column is assigned
+        _, first = np.unique(columns, return_index=True)
+        _, last = np.unique(columns[::-1], return_index=True)
+        last = len(columns) - 1 - last
+
+        row = plan.new_row()
+        row[columns[last]] = values[last]
+
+        missing_values = self._gather_values(
+            [row_ for _, _, row_, _ in missing_sources],
+            [n + col_offset for _, _, _, n in missing_sources])
+        for (node, test_no, row_, n), value in zip(missing_sources, 
+                                                   missing_values):
+            if not pd.isna(value):
+                missing_lines['test'].append(self.trie.test(node))
+                missing_lines['test_no'].append(test_no)
+                missing_lines['identifier'].append(self.trie.identifier(node))
+                missing_lines['row'].append(row_)
+                missing_lines['col'].append(n + col_offset)
+                missing_lines['name'].append(data_cols[n])
+                missing_lines['value'].append(value)
                     
-        return results, new_lines, missing_lines
+        return (plan_row(row, columns[np.sort(first)]), 
+                new_lines, missing_lines)
+
+    def _gather_values(self, rows, cols):
+        """Returns the snapshot values at rows, cols with NAN_VALUES as nan"""
+
+        if self.profiler is not None:
+            self.profiler.count('cells', len(rows))
+
+        snapshot = self.snapshot
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+
+        inside = ((rows >= 1) & (rows <= snapshot.max_row) & 
+                  (cols >= 0) & (cols < snapshot.max_column))
+        values = np.full(len(rows), None, dtype=object)
+        values[inside] = snapshot.values[cols[inside], rows[inside]]
+
+        is_nan = np.fromiter((x in self.NAN_VALUES for x in values),
+                             dtype=bool, count=len(values))
+        values[is_nan] = np.nan
+
+        return values
 
     def parse_header(self, tp, study):
         """Parse header information for timepoint tp and study study"""
@@ -490,23 +779,24 @@ class neuroscore_parser():
         results = {}
 
         if self.dept in {'peds'}:
-            results['Provider'] = self.sh['C4'].value
-            results['Psychometrist'] = self.sh['C5'].value
+            results['Provider'] = self.snapshot.value_at('C4')
+            results['Psychometrist'] = self.snapshot.value_at('C5')
 
-            results['Sex'] = self.sh['G4'].value
-            results['DOE'] = self.sh['G5'].value
-            results['DOB'] = self.sh['G6'].value
-            results['Yrs'] = self.sh['G7'].value
-            results['Mo']  = self.sh['G8'].value
-            results['D']   = self.sh['G9'].value
-            results['Handedness'] =  self.sh['G10'].value
+            results['Sex'] = self.snapshot.value_at('G4')
+            results['DOE'] = self.snapshot.value_at('G5')
+            results['DOB'] = self.snapshot.value_at('G6')
+            results['Yrs'] = self.snapshot.value_at('G7')
+            results['Mo']  = self.snapshot.value_at('G8')
+            results['D']   = self.snapshot.value_at('G9')
+            results['Handedness'] =  self.snapshot.value_at('G10')
 
         elif self.dept in {'epilepsy', 'dementia', 'aphasia'}:
             date_col = 4 + (tp - 1) * 4
             age_col = 2 + (tp -1) * 4
 
-            results['testdat'] = self.sh[9][date_col].value.strftime('%Y-%m-%d')
-            results['age'] = [int(self.sh[11][age_col].value
+            results['testdat'] = (self.snapshot.value(9, date_col)
+                                  .strftime('%Y-%m-%d'))
+            results['age'] = [int(self.snapshot.value(11, age_col)
                                   .split(',')[0]
                                   .split(': ')[1])]
         else:
@@ -519,31 +809,24 @@ class mci_parser(neuroscore_parser):
     def parse_date(self, tp):
         """Retrieve the date for a timepoint"""
 
-        for row in range(1, self.sh.max_row + 1):
-            for col, cell in enumerate(self.sh[row]):
-                if (cell.data_type == 's' and 
-                    (cell.value.startswith('DOS A:') or 
-                     cell.value.startswith('EXAM A:') or
-                     cell.value.startswith('Exam A:'))):
+        snapshot = self.snapshot
 
-                    first_row = row
-                    first_col = col
-                    break
-            else:
-                continue
-            break
+        if self.index.prefixed is None:
+            return None
+
+        first_row, first_col, value = self.index.prefixed
 
-        if cell.value.startswith('DOS A:'):
+        if value.startswith('DOS A:'):
             row = first_row + tp - 1
-            txt = self.sh[row][first_col].value.split(':')[1].strip()
+            txt = snapshot.value(row, first_col).split(':')[1].strip()
 
             exam_date = datetime.strptime(txt, '%B %d, %Y').strftime('%Y-%m-%d')
-        elif cell.value.startswith('EXAM A:'):
+        elif value.startswith('EXAM A:'):
             col = (first_col + 2) + ((tp - 1) * 4)
-            exam_date = self.sh[first_row][col].value.strftime('%Y-%m-%d')
-        elif cell.value.startswith('Exam A'):
+            exam_date = snapshot.value(first_row, col).strftime('%Y-%m-%d')
+        elif value.startswith('Exam A'):
             col = first_col + ((tp - 1) * 4)
-            txt = self.sh[first_row][col].value.strip().split()
+            txt = snapshot.value(first_row, col).strip().split()
             exam_date = datetime.strptime(txt[-1], '%d-%b-%Y').strftime('%Y-%m-%d')
         else:
             exam_date = None
@@ -554,7 +837,7 @@ class peds_parser(neuroscore_parser):
 
     def parse_data(self, lut):
         """
-        Parse the data in sh using lut
+        Parse the data in snapshot using lut
 
         Parameters
         ----------
@@ -583,6 +866,17 @@ class peds_parser(neuroscore_parser):
             value      -> neuroscore value
         """
 
+        with instrument.stage(self.profiler, 'parse_data'):
+            parsed = self._parse_data(lut)
+
+        if self.profiler is not None:
+            _, _, new_lines, missing_lines = parsed
+            self.profiler.count('new_lines', len(new_lines['row']))
+            self.profiler.count('missing_lines', len(missing_lines['row']))
+
+        return parsed
+
+    def _parse_data(self, lut):
         data_cols = ['raw', 'ss', '%tile', 'equivalent', 'form', 'notes']
         get_variables = [
             (0, self._get_raw_variable),
@@ -616,14 +910,17 @@ class peds_parser(neuroscore_parser):
             'value': [],
         }
 
-        for identifier, test_no, row in self.unhidden_lines:
-            key = (identifier, test_no)
-            if key in lut.lut:
-                rc_variables = lut.lut[key]
+        lut_nodes = self.lut_nodes(lut)
+        for node, test_no, row in self.unhidden_lines:
+            key = (lut_nodes[node], test_no)
+            if key in lut.node_lut:
+                rc_variables = lut.node_lut[key]
+                if self.profiler is not None:
+                    self.profiler.count('cells', len(get_variables))
 
                 for n, get_variable in get_variables:
 
-                    cell = self.sh[row][n + self.first_data_col + 1]
+                    cell = self.snapshot.cell(row, n + self.first_data_col + 1)
                     variable_values = get_variable(cell, rc_variables)
 
                     for variable, value in variable_values:
@@ -632,13 +929,13 @@ class peds_parser(neuroscore_parser):
                         if variable and not is_nan_value:
                             results[variable] = [value]
 
-                            debug_results['identifier'].append(identifier)
+                            debug_results['identifier'].append(self.trie.identifier(node))
                             debug_results['variable'].append(variable)
                             debug_results['value'].append(value)
                         elif not pd.isna(value) and not is_nan_value:
-                            missing_lines['test'].append(identifier.split(' | ')[0])
+                            missing_lines['test'].append(self.trie.test(node))
                             missing_lines['test_no'].append(test_no)
-                            missing_lines['identifier'].append(identifier)
+                            missing_lines['identifier'].append(self.trie.identifier(node))
                             missing_lines['row'].append(row)
                             missing_lines['col'].append(cell.column)
                             missing_lines['col_letter'].append(cell.column_letter)
@@ -646,9 +943,9 @@ class peds_parser(neuroscore_parser):
                             missing_lines['value'].append(value)
 
             else:
-                new_lines['test'].append(identifier.split(' | ')[0])
+                new_lines['test'].append(self.trie.test(node))
                 new_lines['test_no'].append(test_no)
-                new_lines['identifier'].append(identifier)
+                new_lines['identifier'].append(self.trie.identifier(node))
                 new_lines['row'].append(row)
 
         return results, debug_results, new_lines, missing_lines
@@ -666,7 +963,7 @@ class peds_parser(neuroscore_parser):
         ----------
 
         cell : Cell
-            the cell from an openpyxl sheet
+            the cell from the sheet snapshot
         rc_variables : list of str
             the list of redcap variables for the row of cell
 
@@ -707,7 +1004,7 @@ class peds_parser(neuroscore_parser):
         ----------
 
         cell : Cell
-            the cell from an openpyxl sheet
+            the cell from the sheet snapshot
         rc_variables : list of str
             the list of redcap variables for the row of cell
 
@@ -735,49 +1032,9 @@ class peds_parser(neuroscore_parser):
         value = cell.value
 
         if value is not None:
-            if cell.data_type == 's':
-                if re.match('[<>]', value):
-                    variable_values = [
-                        (rc_variables[3], value),
-                        (rc_variables[4], None),
-                        (rc_variables[5], None)
-                    ]
-                elif re.fullmatch('\d+-\d+', value):
-                    variable_values = [
-                        (rc_variables[3], value),
-                        (rc_variables[4], None),
-                        (rc_variables[5], None),
-                    ]
-                elif re.fullmatch('\d+:\d+', value):
-                    m = re.fullmatch('(\d+):(\d+)', value)
-                    n1 = float(m.group(1))
-                    n2 = float(m.group(2))
-                    variable_values = [
-                            (rc_variables[3], None),
-                            (rc_variables[4], n1 * 12 + n2),
-                            (rc_variables[5], None),
-                    ]
-                elif re.fullmatch('\d+:\d+-\d+:\d+', value):
-                    m = re.fullmatch('(\d+):(\d+)-(\d+):(\d+)', value)
-                    n1 = float(m.group(1))
-                    n2 = float(m.group(2))
-                    n3 = float(m.group(3))
-                    n4 = float(m.group(4))
-                    variable_values = [
-                            (rc_variables[3], None),
-                            (rc_variables[4], n1 * 12 + n2),
-                            (rc_variables[5], n3 * 12 + n4),
-                    ]
-                else:
-                    variable_values = [(None, value)]
-
-            elif cell.data_type == 'n':
-                variable_values = [
-                    (rc_variables[3], None),
-                    (rc_variables[4], float(value)),
-                    (rc_variables[5], None),
-                ]
-
+            values = normalize_equivalent_cell(cell)
+            if values is not None:
+                variable_values = list(zip(rc_variables[3:6], values))
             else:
                 variable_values = [(None, value)]
 
@@ -820,21 +1077,15 @@ class peds_parser(neuroscore_parser):
             'd': 'days',
         }
 
-        for row in range(1, self.first_data_row):
-            col = 0
-            ncols = len(self.sh[row])
-            while col < ncols:
-                if self.sh[row][col].data_type == 's' and self.sh[row][col].value.endswith(':'):
-                    key = self.sh[row][col].value[:-1].lower().strip()
-                    if key in key_mapper:
-                        key = key_mapper[key]
-                    col += 1
-                    while col < ncols and not self.sh[row][col].value:
-                        col += 1
-                    if col < ncols and self.sh[row][col].value:
-                        header[key] = [self.sh[row][col].value]
-
-                col += 1
+        for label in self.index.labels:
+            if label.row >= self.first_data_row:
+                break
+
+            key = label.text[:-1].lower().strip()
+            if key in key_mapper:
+                key = key_mapper[key]
+            if label.value_col is not None:
+                header[key] = [label.value]
 
         return header
 
@@ -0,0 +1,101 @@
+import sys
+import json
+import logging
+
+LOGGER_NAME = 'mcw_readers'
+
+# the attributes of every LogRecord, anything else was passed with extra
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord(
+    '', logging.INFO, '', 0, '', (), None))) | {'message', 'asctime'}
+
+def get_cli_logger(name):
+    """
+    Returns the logger of the console script name.
+
+    The name is given explicitly because a script run with python -m has
+    __name__ set to '__main__', which is outside the mcw_readers logger.
+    """
+
+    return logging.getLogger(f'{LOGGER_NAME}.cli.{name}')
+
+class json_lines_formatter(logging.Formatter):
+
+    def format(self, record):
+        """
+        Formats record as one JSON object.
+
+        The object has the time, level, logger, the message template as
+        event and the formatted message, plus every field passed to the log
+        call with extra. Values JSON cannot hold are written with str.
+        """
+
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.msg if isinstance(record.msg, str) else None,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+def add_json_lines_sink(fname, level=logging.DEBUG):
+    """
+    Appends the mcw_readers log records at level or above to fname.
+
+    Each record is written as one JSON line by json_lines_formatter. The
+    mcw_readers logger level is lowered to level if needed, which enables
+    those records for every other handler too. Returns the handler, so it
+    can be removed.
+    """
+
+    handler = logging.FileHandler(fname, encoding='utf-8')
+    handler.setLevel(level)
+    handler.setFormatter(json_lines_formatter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.addHandler(handler)
+    if logger.getEffectiveLevel() > level:
+        logger.setLevel(level)
+
+    return handler
+
+def configure(level=logging.INFO, stream=sys.stdout, json_lines=None):
+    """
+    Configures the mcw_readers logger for a console script.
+
+    Parameters
+    ----------
+
+    level : int
+        the lowest level written to stream
+    stream : file
+        where the plain messages are written
+    json_lines : str
+        if given, every record at DEBUG or above is also written to this
+        file as JSON lines
+
+    Description
+    -----------
+
+    Messages are formatted lazily, so a record below every handler level
+    is dropped by the logger before its arguments are formatted. Loops
+    logging per line or per cell check isEnabledFor once, so they cost
+    nothing when the level is disabled.
+    """
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    handler = logging.StreamHandler(stream)
+    handler.setLevel(level)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+    if json_lines is not None:
+        add_json_lines_sink(json_lines)
@@ -1,12 +1,25 @@
+import io
 import os
 import re
+import logging
 
 import pandas as pd
 import PyPDF4 as pdf
 
 from datetime import datetime
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 
-MITV_LOC = 22
+from mcw_readers.cache import stat_index
+from mcw_readers.utils import find_files
+
+logger = logging.getLogger(__name__)
+
+PDF_PATTERNS = ['*.pdf', '*.PDF']
+
+# bump when the parse_text results change
+NR_PARSER_VERSION = '1'
+NR_STAT_INDEX = 'neuroreader_stat.index'
 
 NR_HEADER_MAPPER = {
     'Image ID': 'image_id',
@@ -76,34 +89,77 @@ NR_TABLE_MAPPER = {
     'Left Lateral Ventricle': 'left_lateral_ventricle'
 }
 
-def get_field_locs(working_data, fields):
-    """
-    Finds fields index locations.
+NR_TABLE_SUFFIXES = [
+    '_vol_ml',
+    '_vol_to_tiv_ratio',
+    '_nr_index',
+    '_zscore',
+    '_percentile',
+]
+
+# every default variable name parse_text returns, middle_name is only
+# returned for patient names with three parts
+NR_VARIABLES = (
+    list(NR_HEADER_MAPPER.values()) +
+    list(NR_RESULTS_MAPPER.values()) +
+    [x + y for x in NR_TABLE_MAPPER.values() for y in NR_TABLE_SUFFIXES] +
+    ['version', 'mtiv', 'first_name', 'last_name', 'middle_name', 
+     'analysis_date']
+)
+
+# the mapper of each field, results are ordered header, results then table
+NR_FIELD_GROUPS = {
+    **{x: 0 for x in NR_HEADER_MAPPER},
+    **{x: 1 for x in NR_RESULTS_MAPPER},
+    **{x: 2 for x in NR_TABLE_MAPPER},
+}
+NR_FIELDS = set(NR_FIELD_GROUPS)
 
-    Parameters
-    ----------
+MTIV_FIELD = 'mTIV'
+MTIV_MARKER = '(mTIV)'
+MTIV_PATTERN = re.compile(
+    r'The measured total intracranial volume \(mTIV\) = (\d+) ml.')
 
-    working_data: list-like
-        the working data
-    fields: list-like
-        the field names
+class pdf_pages(Mapping):
 
-    Outputs
-    -------
+    def __init__(self, pdf_fr):
+        """
+        Initializes pdf_pages.
 
-    field_locs: dict
-        field-index pairs
-    """
+        Parameters
+        ----------
 
-    field_locs = {x:i for i,x in enumerate(working_data) if x in fields}
+        pdf_fr: PdfFileReader
+            the reader of the pdf file
 
-    not_found = set(fields) - set(field_locs)
-    if not_found:
-        raise Exception(f'Missing fields {not_found}')
+        Description
+        -----------
+
+        A read only dict of page number -> list of text extracted by PyPDF4
+        and split by \n. A page is extracted the first time it is looked up
+        and kept, so pages that are never looked up cost nothing.
+        """
+
+        self.pdf_fr = pdf_fr
+        self._pages = {}
 
-    return field_locs
+    def __getitem__(self, i):
+        tokens = self._pages.get(i)
+        if tokens is None:
+            if not isinstance(i, int) or not 0 <= i < len(self):
+                raise KeyError(i)
+            tokens = self.pdf_fr.getPage(i).extractText().strip().split('\n')
+            self._pages[i] = tokens
 
-def tokenize_pdf(pdf_file):
+        return tokens
+
+    def __len__(self):
+        return self.pdf_fr.getNumPages()
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+def tokenize_pdf(pdf_file, read_info=False):
     """
     Tokenizes a pdf file.
 
@@ -112,27 +168,92 @@ def tokenize_pdf(pdf_file):
 
     pdf_file: str
         path to pdf file
+    read_info: bool
+        read the pdf document information
     
     Outputs
     -------
 
-    pdf_data: dict
+    pdf_data: pdf_pages
         keys - page number
         values - list of text extracted by PyPDF4 and split by \n
     info: dict
-        the pdf information generated by PyPDF4
+        the pdf information generated by PyPDF4, None unless read_info
+
+    Description
+    -----------
+
+    The file is read once into memory and the pages are only extracted as
+    they are looked up in pdf_data, so parse_text never extracts the
+    appendix pages it does not need.
     """
 
-    pdf_data = {}
     with open(pdf_file, 'rb') as f:
-        pdf_fr = pdf.PdfFileReader(f)
-        n = pdf_fr.getNumPages()
+        pdf_fr = pdf.PdfFileReader(io.BytesIO(f.read()))
+
+    info = pdf_fr.getDocumentInfo() if read_info else None
+
+    return pdf_pages(pdf_fr), info
+
+def locate_fields(pdf_data):
+    """
+    Locates every field and the mTIV in one pass over the tokens.
+
+    Parameters
+    ----------
 
-        for i in range(n):
-            pdf_data[i] = pdf_fr.getPage(i).extractText().strip().split('\n')
-        info = pdf_fr.getDocumentInfo()
+    pdf_data: dict
+        keys - page number
+        values - list of text extracted by PyPDF4 and split by \n
+
+    Outputs
+    -------
+
+    working_data: list
+        the tokens of the pages searched
+    field_locs: dict
+        field-index pairs for every field in NR_FIELDS, the index of the
+        last occurrence in working_data; header, results then table fields,
+        each in the order they first occur
+    mtiv: str
+        the measured total intracranial volume in ml
+
+    Description
+    -----------
+
+    The pages are searched in order and each token is looked up once in
+    NR_FIELDS and checked for the mTIV sentence, wherever it is. The
+    search stops after the page where the last field was found, using at
+    least the first two pages. Every missing field is reported together.
+    """
+
+    working_data = []
+    field_locs = {}
+    mtiv = None
+    for i in range(len(pdf_data)):
+        tokens = pdf_data[i]
+        for loc, token in enumerate(tokens, len(working_data)):
+            if token in NR_FIELDS:
+                field_locs[token] = loc
+            elif mtiv is None and MTIV_MARKER in token:
+                m = MTIV_PATTERN.search(token)
+                if m is not None:
+                    mtiv = m.group(1)
+        working_data.extend(tokens)
+
+        if i >= 1 and mtiv is not None and len(field_locs) == len(NR_FIELDS):
+            break
+
+    not_found = NR_FIELDS - set(field_locs)
+    if mtiv is None:
+        not_found.add(MTIV_FIELD)
+    if not_found:
+        raise Exception(f'Missing fields {not_found}')
+
+    field_locs = {x: field_locs[x] 
+                  for x in sorted(field_locs, key=NR_FIELD_GROUPS.get)}
 
-    return pdf_data, info
+    return working_data, field_locs, mtiv
 
 def parse_text(pdf_data):
     """
@@ -154,11 +275,7 @@ def parse_text(pdf_data):
     """
 
     results = {}
-    working_data = pdf_data[0] + pdf_data[1]
-
-    field_locs = get_field_locs(working_data, NR_HEADER_MAPPER)
-    field_locs.update(get_field_locs(working_data, NR_RESULTS_MAPPER))
-    field_locs.update(get_field_locs(working_data, NR_TABLE_MAPPER))
+    working_data, field_locs, mtiv = locate_fields(pdf_data)
 
     for field, loc in field_locs.items():
         if field in NR_HEADER_MAPPER:
@@ -167,16 +284,11 @@ def parse_text(pdf_data):
             results[NR_RESULTS_MAPPER[field]] = working_data[loc + 4]
         else:
             study_field = NR_TABLE_MAPPER[field]
-            results[study_field + '_vol_ml'] = working_data[loc + 1]
-            results[study_field + '_vol_to_tiv_ratio'] = working_data[loc + 2]
-            results[study_field + '_nr_index'] = working_data[loc + 3]
-            results[study_field + '_zscore'] = working_data[loc + 4]
-            results[study_field + '_percentile'] = working_data[loc + 5]
+            for i, suffix in enumerate(NR_TABLE_SUFFIXES, start=1):
+                results[study_field + suffix] = working_data[loc + i]
 
     results['version'] = pdf_data[0][-1]
-
-    ptn = 'The measured total intracranial volume \(mTIV\) = (\d+) ml.'
-    results['mtiv'] = re.search(ptn, pdf_data[0][MITV_LOC]).group(1)
+    results['mtiv'] = mtiv
 
     # split patient name
     patient_names = results['patient_name'].split()
@@ -248,16 +360,94 @@ def read_mapper_file(file_mapper):
     mapper: dict
         key - default key value
         value - new key value
+
+    Description
+    -----------
+
+    The mapper is validated when it is read: it needs the columns default
+    and redcap, every default must be in NR_VARIABLES and neither column
+    may repeat a name.
     """
 
-    df = pd.read_csv(file_mapper)
-    mapper = {}
-    for row in df.itertuples():
-        mapper[row['default']] = row['redcap']
+    df = pd.read_csv(file_mapper, dtype=str)
 
-    return mapper
+    missing_columns = {'default', 'redcap'} - set(df.columns)
+    if missing_columns:
+        raise Exception(f'{file_mapper} is missing the columns '
+                        f'{sorted(missing_columns)}')
 
-def parse_neuroreader(pdf_file, mapper_file=None):
+    unknown = set(df['default']) - set(NR_VARIABLES)
+    if unknown:
+        raise Exception(f'Unknown default variables in {file_mapper}: '
+                        f'{sorted(unknown, key=str)}')
+
+    for column in ['default', 'redcap']:
+        repeated = df.loc[df[column].duplicated(), column]
+        if not repeated.empty:
+            raise Exception(f'Repeated {column} variables in {file_mapper}: '
+                            f'{sorted(set(repeated), key=str)}')
+
+    return dict(zip(df['default'], df['redcap']))
+
+def apply_mapper(results, mapper, keep=()):
+    """
+    Renames and selects the variables of results with mapper.
+
+    Parameters
+    ----------
+
+    results: DataFrame
+        one row per parsed pdf file, the columns are default variable names
+    mapper: dict
+        key - default variable name
+        value - new variable name
+    keep: list
+        columns of results kept first, unrenamed
+
+    Output
+    ------
+
+    results: DataFrame
+        the keep columns followed by the mapper values in mapper order
+
+    Description
+    -----------
+
+    The mapper is applied to all rows in one reindex and rename. A variable
+    in mapper that a pdf file did not return, such as middle_name, is
+    missing for that row.
+    """
+
+    return (results
+        .reindex(columns=[*keep, *mapper])
+        .rename(columns=mapper))
+
+def get_cache_key(cache, pdf_file, index=None):
+    """
+    Returns the cache key of pdf_file.
+
+    The key is the sha256 of pdf_file and NR_PARSER_VERSION. If index, a
+    stat_index, is given pdf_file is only hashed when its mtime or size
+    changed.
+    """
+
+    digest = index.hash_file(pdf_file) if index is not None else None
+
+    return cache.key(pdf_file, f'neuroreader:{NR_PARSER_VERSION}', digest)
+
+def _parse_cached(pdf_file, cache=None):
+    if cache is None:
+        return parse_text(tokenize_pdf(pdf_file)[0])
+
+    key = get_cache_key(cache, pdf_file)
+    parsed = cache.get(key)
+    if parsed is None:
+        parsed = parse_text(tokenize_pdf(pdf_file)[0])
+        cache.put(key, parsed)
+
+    return parsed
+
+def parse_neuroreader(pdf_file, mapper_file=None, cache=None):
     """
     Parser neuroreader files.
 
@@ -268,26 +458,146 @@ def parse_neuroreader(pdf_file, mapper_file=None):
         path to pdf file
     mapper_file: str
         path to the mapper file which should be a csv file
+    cache: content_cache
+        if given, the parse_text results are cached by the pdf file contents
+        and PyPDF4 is skipped for a pdf file already parsed
 
     Output
     ------
 
-    results: dict
-        key - variable name
-        value - variable value
+    results: DataFrame
+        one row of variables, renamed and selected by the mapper file if
+        one is given
     """
 
-    pdf_data, info = tokenize_pdf(pdf_file)
-    parsed = parse_text(pdf_data)
+    parsed = _parse_cached(pdf_file, cache)
+    results = pd.DataFrame(parsed, index=[0])
+
+    if mapper_file is not None:
+        results = apply_mapper(results, read_mapper_file(mapper_file))
+
+    return results
+
+def find_neuroreader_files(sources):
+    """
+    Returns the neuroreader pdf files in sources.
+
+    Each source is a directory, searched for PDF_PATTERNS, a glob pattern or
+    a file, see utils.find_files.
+    """
+
+    return find_files(sources, PDF_PATTERNS)
+
+def _parse_neuroreader_file(pdf_file):
+    """Returns the parse_text results of pdf_file, or the error"""
+
+    try:
+        pdf_data, _ = tokenize_pdf(pdf_file)
+        return parse_text(pdf_data), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+def parse_neuroreader_batch(sources, mapper_file=None, jobs=1, cache=None,
+                            check_mtime=False):
+    """
+    Parses a batch of neuroreader files.
+
+    Parameters
+    ----------
+
+    sources: str or list of str
+        directories, glob patterns or pdf files, see find_neuroreader_files
+    mapper_file: str
+        path to the mapper file which should be a csv file
+    jobs: int
+        the number of processes parsing pdf files
+    cache: content_cache
+        if given, the parse_text results are cached by the pdf file contents
+    check_mtime: bool
+        find the cache keys with a stat_index kept in the cache directory,
+        so pdf files with an unchanged mtime and size are not read
+
+    Output
+    ------
+
+    results: DataFrame
+        one row for each parsed pdf file in file order, the pdf_file column
+        followed by the variables as returned by parse_neuroreader
+    failed: list of tuple
+        (pdf_file, error) for each pdf file that could not be parsed
+
+    Description
+    -----------
+
+    Each pdf file is tokenized and parsed in one of jobs worker processes,
+    so the throughput scales with the cores. A pdf file missing fields, or
+    failing otherwise, is reported in failed instead of stopping the batch.
+
+    With a cache, the cached pdf files are looked up in this process before
+    any are parsed, and only the others are sent to the workers. Failures
+    are not cached.
+    """
+
+    files = find_neuroreader_files(sources)
 
     if mapper_file is not None:
         mapper = read_mapper_file(mapper_file)
 
-        results = {}
-        for name, new_name in mapper.items():
-            results[new_name] = parsed[name]
+    keys = {}
+    cached = {}
+    if cache is not None:
+        if check_mtime:
+            index = stat_index(cache.directory.joinpath(NR_STAT_INDEX))
+        else:
+            index = None
+
+        for pdf_file in files:
+            try:
+                keys[pdf_file] = get_cache_key(cache, pdf_file, index)
+            except OSError:
+                # reported when it is parsed
+                continue
+            parsed = cache.get(keys[pdf_file])
+            if parsed is not None:
+                cached[pdf_file] = parsed
+
+        if index is not None:
+            index.save()
+
+        logger.debug('Found %d of %d pdf files in the cache', len(cached),
+                     len(files), 
+                     extra={'cache_hits': len(cached), 'files': len(files)})
+
+    todo = [x for x in files if x not in cached]
+    if jobs == 1:
+        all_parsed = map(_parse_neuroreader_file, todo)
     else:
-        results = parsed
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        all_parsed = executor.map(_parse_neuroreader_file, todo,
+                                  chunksize=max(1, len(todo) // (jobs * 4)))
+    all_parsed = zip(todo, all_parsed)
+
+    rows = []
+    failed = []
+    try:
+        for pdf_file in files:
+            if pdf_file in cached:
+                parsed = cached[pdf_file]
+            else:
+                _, (parsed, error) = next(all_parsed)
+                if error is not None:
+                    failed.append((pdf_file, error))
+                    continue
+                if pdf_file in keys:
+                    cache.put(keys[pdf_file], parsed)
+
+            rows.append({'pdf_file': pdf_file, **parsed})
+    finally:
+        if jobs != 1:
+            executor.shutdown()
+
+    results = pd.DataFrame(rows, columns=None if rows else ['pdf_file'])
+    if mapper_file is not None:
+        results = apply_mapper(results, mapper, keep=['pdf_file'])
 
-    return pd.DataFrame(results, index=[0])
-        
+    return results, failed
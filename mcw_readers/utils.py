@@ -1,4 +1,8 @@
-import pandas as pd
+import os
+import glob
+import json
+
+from pathlib import Path
 
 try:
     import importlib.resources as pkg_resources
@@ -7,13 +11,45 @@ except ImportError:
 
 from mcw_readers import data
 
-def get_psychometric_objects():
-    """converts the psychometric conversion table to a dict"""
+PSYCHOMETRIC_CSV = 'psychometric_conversion_table_filled.csv'
+PSYCHOMETRIC_JSON = 'psychometric_conversion_table_filled.json'
+PSYCHOMETRIC_COLUMNS = [
+    'standard_score',
+    'percentile_rank',
+    'scaled_score',
+    'ets_score',
+    't_score',
+    'z_score',
+    'description',
+]
+
+def compile_psychometric_table():
+    """
+    Compiles the psychometric conversion table csv to json.
+
+    The json holds the table columns as lists, so loading it needs neither
+    pandas nor a csv parse. Rerun this after editing the csv.
+    """
 
-    fname = 'psychometric_conversion_table_filled.csv'
+    import pandas as pd
 
-    with pkg_resources.path(data, fname) as data_file:
+    with pkg_resources.path(data, PSYCHOMETRIC_CSV) as data_file:
         df = pd.read_csv(data_file.as_posix())
+        json_file = data_file.with_name(PSYCHOMETRIC_JSON)
+
+    columns = {col: df[col].tolist() for col in PSYCHOMETRIC_COLUMNS}
+    with open(json_file, 'w') as f:
+        json.dump(columns, f)
+
+def load_psychometric_columns():
+    """Returns the compiled psychometric conversion table columns"""
+
+    with pkg_resources.path(data, PSYCHOMETRIC_JSON) as data_file:
+        with open(data_file) as f:
+            return json.load(f)
+
+def get_psychometric_dict(columns):
+    """converts the psychometric conversion table columns to a dict"""
 
     results = {
         'standard_score': {},
@@ -23,33 +59,127 @@ def get_psychometric_objects():
         'z_score': {},
         'description': {},
     }
-    
-    seen = set()
-    for row in df.itertuples():
-        pr = row.percentile_rank
-    
-        if pr in seen:
-            results['standard_score'][pr].append(row.standard_score)
-            results['scaled_score'][pr].append(row.scaled_score)
-            results['ets_score'][pr].append(row.ets_score)
-            results['t_score'][pr].append(row.t_score)
-            results['z_score'][pr].append(row.z_score)
-            results['description'][pr].append(row.description)
+
+    for i, pr in enumerate(columns['percentile_rank']):
+        for key, values in results.items():
+            values.setdefault(pr, []).append(columns[key][i])
+
+    return results
+
+def get_psychometric_bounds(psychometric, close=3):
+    """
+    Returns per percentile score bounds of the psychometric conversion table.
+
+    Parameters
+    ----------
+
+    psychometric : dict
+        the table as returned by get_psychometric_dict
+    close : float
+        the closeness used with close_any for scaled and t scores
+
+    Returns
+    -------
+
+    bounds : dict
+        percentile_rank -> sorted ndarray of the percentile ranks
+        <score>_min, <score>_max -> ndarray of the min and max score for
+        each percentile rank, for standard_score, scaled_score and t_score
+
+    Description
+    -----------
+
+    The standard scores listed for a percentile rank are contiguous integers,
+    and neighbouring scaled and t scores are less than 2 * close apart. So
+    membership tests against the standard scores and close_any tests against
+    the scaled and t scores reduce to interval tests against the bounds. A
+    ValueError is raised if the table breaks either assumption.
+    """
+
+    import numpy as np
+
+    percentiles = sorted(psychometric['standard_score'])
+    bounds = {'percentile_rank': np.array(percentiles, dtype=float)}
+    for score in ['standard_score', 'scaled_score', 't_score']:
+        mins = []
+        maxs = []
+        for pr in percentiles:
+            values = sorted(set(psychometric[score][pr]))
+            if score == 'standard_score':
+                is_interval = values == list(range(int(values[0]), 
+                                                   int(values[-1]) + 1))
+            else:
+                is_interval = all(b - a < 2 * close 
+                                  for a, b in zip(values, values[1:]))
+            if not is_interval:
+                raise ValueError(f'{score} for percentile rank {pr} do not '
+                                 'form an interval')
+            mins.append(values[0])
+            maxs.append(values[-1])
+
+        bounds[f'{score}_min'] = np.array(mins, dtype=float)
+        bounds[f'{score}_max'] = np.array(maxs, dtype=float)
+
+    return bounds
+
+def get_psychometric_objects():
+    """converts the psychometric conversion table to a dict"""
+
+    import pandas as pd
+
+    columns = load_psychometric_columns()
+
+    return pd.DataFrame(columns), get_psychometric_dict(columns)
+
+def find_files(sources, patterns):
+    """
+    Returns the files in sources.
+
+    Each source is a directory, searched for the glob patterns, a glob
+    pattern or a file. The files are sorted within each source and listed
+    once. Office lock files (~$*) are skipped.
+    """
+
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+
+    files = []
+    for source in sources:
+        source = str(source)
+        if os.path.isdir(source):
+            matches = [str(x) for pattern in patterns 
+                       for x in Path(source).glob(pattern)]
+        elif glob.has_magic(source):
+            matches = glob.glob(source)
         else:
-            results['standard_score'][pr] = [row.standard_score]
-            results['scaled_score'][pr] = [row.scaled_score]
-            results['ets_score'][pr] = [row.ets_score]
-            results['t_score'][pr] = [row.t_score]
-            results['z_score'][pr] = [row.z_score]
-            results['description'][pr] = [row.description]
-    
-        seen.add(pr)
+            matches = [source]
+
+        files.extend(sorted(x for x in matches 
+                            if not os.path.basename(x).startswith('~$')))
 
-    return df, results
+    return list(dict.fromkeys(files))
 
 def close_any(value, test_values, close):
     """determines if any values in test_values are under close from value"""
 
     return any([abs(value - x) < close for x in test_values])
 
-DF_PSYCHOMETRIC, DICT_PSYCHOMETRIC = get_psychometric_objects()
+def __getattr__(name):
+    """
+    Loads DF_PSYCHOMETRIC, DICT_PSYCHOMETRIC and BOUNDS_PSYCHOMETRIC on
+    first access
+    """
+
+    if name == 'DICT_PSYCHOMETRIC':
+        value = get_psychometric_dict(load_psychometric_columns())
+    elif name == 'BOUNDS_PSYCHOMETRIC':
+        value = get_psychometric_bounds(
+            get_psychometric_dict(load_psychometric_columns()))
+    elif name == 'DF_PSYCHOMETRIC':
+        import pandas as pd
+        value = pd.DataFrame(load_psychometric_columns())
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    globals()[name] = value
+    return value
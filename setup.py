@@ -19,21 +19,27 @@ setup(
             'ped_parse_neuroscore=mcw_readers.gui.ped_parse_neuroscore:main',
         ],
         'console_scripts': [
-            'parse_epilepsy_neuroscore=mcw_readers.cli.parse_epilepsy_neuroscore:main'
+            'parse_epilepsy_neuroscore=mcw_readers.cli.parse_epilepsy_neuroscore:main',
+            'initialize_lut=mcw_readers.cli.initialize_lut:main',
+            'parse_neuroreader=mcw_readers.cli.parse_neuroreader:main',
         ]
     },
     install_requires=[
-        'openpyxl',
+        # interfaces/sheet.py streams sheets with the private openpyxl parser
+        'openpyxl>=3.1,<3.2',
         'numpy',
         'pandas',
         'importlib_resources',
         'PySimpleGUI',
         'xlrd',
+        'PyPDF4',
     ],
     package_data={
         '': ['LICENSE', 'README.md'],
         'mcw_readers': ['data/ped_lut.xlsx',
                         'data/epilepsy_lut.xlsx',
+                        'data/psychometric_conversion_table_filled.csv',
+                        'data/psychometric_conversion_table_filled.json',
         ],
     },
     include_package_data=True,
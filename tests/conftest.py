@@ -0,0 +1,81 @@
+import os
+import sys
+import subprocess
+
+import pytest
+import pandas as pd
+
+try:
+    import importlib.resources as pkg_resources
+except ImportError:
+    import importlib_resources as pkg_resources
+
+from mcw_readers.interfaces.lut import lut
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the synthetic workbook and report generators of the benchmarks
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from generate import make_epilepsy_workbook
+
+SPEC_COLUMNS = ['record_id', 'redcap_repeat_instance', 'neuroscore', 'exam']
+
+@pytest.fixture(scope='session')
+def epilepsy_excel():
+    with pkg_resources.path('mcw_readers.data', 'epilepsy_lut.xlsx') as excel:
+        return str(excel)
+
+@pytest.fixture(scope='session')
+def epilepsy_lut(epilepsy_excel):
+    return lut('epilepsy', epilepsy_excel)
+
+@pytest.fixture(scope='session')
+def epilepsy_workbooks(tmp_path_factory):
+    """Returns (path, n_exams) of synthetic epilepsy workbooks"""
+
+    out_dir = tmp_path_factory.mktemp('epilepsy')
+
+    workbooks = []
+    for n, n_exams in enumerate([3, 2, 1, 3]):
+        path = str(out_dir.joinpath(f'epilepsy_{n}.xlsx'))
+        make_epilepsy_workbook(path, seed=n, n_exams=n_exams)
+        workbooks.append((path, n_exams))
+
+    return workbooks
+
+@pytest.fixture
+def run_cli(tmp_path):
+    """
+    Returns a function running parse_epilepsy_neuroscore over spec rows.
+
+    The function takes the spec rows, a name for the run and the extra
+    command line arguments. It returns the output files of the run, keyed
+    by their suffix, and the completed process. Runs with the same name
+    share a directory, so a later run sees the manifest of an earlier one.
+    """
+
+    def run(rows, name='run', *args):
+        out_dir = tmp_path.joinpath(name)
+        out_dir.mkdir(exist_ok=True)
+        spec = out_dir.joinpath('spec.tsv')
+        pd.DataFrame(rows, columns=SPEC_COLUMNS).to_csv(spec, sep='\t', 
+                                                        index=False)
+
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        process = subprocess.run(
+            [sys.executable, '-m', 'mcw_readers.cli.parse_epilepsy_neuroscore',
+             '--spec', str(spec), '--no-cache', *args],
+            capture_output=True, text=True, env=env, cwd=str(out_dir))
+        assert process.returncode == 0, process.stderr
+
+        outputs = {}
+        for suffix in ['redcap', 'new_lines', 'missing_lines', 
+                       'new_lines_summary']:
+            fname = out_dir.joinpath(f'spec_{suffix}.csv')
+            if fname.exists():
+                outputs[suffix] = fname.read_bytes()
+
+        return outputs, process
+
+    return run
@@ -0,0 +1,44 @@
+import os
+import stat
+
+from mcw_readers.cache import atomic_write, content_cache, stat_index
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+def test_atomic_write_mode(tmp_path):
+    umask = os.umask(0o022)
+    try:
+        path = tmp_path.joinpath('file')
+        atomic_write(path, b'data')
+        assert path.read_bytes() == b'data'
+        assert mode(path) == 0o644
+
+        os.umask(0o077)
+        atomic_write(path, b'new')
+        assert path.read_bytes() == b'new'
+        assert mode(path) == 0o600
+    finally:
+        os.umask(umask)
+
+    assert os.listdir(tmp_path) == ['file']
+
+def test_content_cache_put(tmp_path):
+    cache = content_cache(tmp_path, max_bytes=1000)
+    cache.put('a', list(range(10)))
+    cache.put('a', list(range(20)))
+
+    assert cache.get('a') == list(range(20))
+    assert cache.get('b') is None
+    assert cache.size == os.path.getsize(tmp_path.joinpath('a.pkl'))
+
+def test_stat_index_save(tmp_path):
+    source = tmp_path.joinpath('source')
+    source.write_bytes(b'data')
+
+    index = stat_index(tmp_path.joinpath('index', 'stat.index'))
+    digest = index.hash_file(source)
+    index.save()
+
+    assert stat_index(index.fname).entries == index.entries
+    assert stat_index(index.fname).hash_file(source) == digest
@@ -0,0 +1,118 @@
+import os
+import stat
+import pickle
+
+import pytest
+import pandas as pd
+
+from mcw_readers import instrument
+from mcw_readers.interfaces.lut import COMPILED_VERSION, lut
+
+@pytest.fixture
+def lut_csv(tmp_path, epilepsy_excel):
+    """Returns a csv copy of the shipped epilepsy lut"""
+
+    fname = str(tmp_path.joinpath('epilepsy_lut.csv'))
+    pd.read_excel(epilepsy_excel).to_csv(fname, index=False)
+
+    return fname
+
+def load(excel):
+    """Returns the compiled lut of excel and the number of rebuilds"""
+
+    prof = instrument.profiler()
+    new_lut = lut.load_compiled('epilepsy', excel, profiler=prof)
+
+    return new_lut, prof.counters.get((instrument.BATCH_FILE, 'lut_rebuilds'), 0)
+
+def set_mtime(fname, mtime_ns):
+    os.utime(fname, ns=(mtime_ns, mtime_ns))
+
+def rewrite(artifact, **changes):
+    with open(artifact, 'rb') as f:
+        compiled = pickle.load(f)
+    compiled.update(changes)
+    with open(artifact, 'wb') as f:
+        pickle.dump(compiled, f)
+
+def test_load_compiled(lut_csv):
+    artifact = lut.compiled_path(lut_csv)
+    umask = os.umask(0o022)
+    try:
+        built, n = load(lut_csv)
+    finally:
+        os.umask(umask)
+
+    assert n == 1
+    assert stat.S_IMODE(os.stat(artifact).st_mode) == 0o644
+
+    loaded, n = load(lut_csv)
+    assert n == 0
+    assert loaded.df.equals(built.df)
+    assert loaded.lut == built.lut
+    assert (loaded.get_column_plan().variables ==
+            built.get_column_plan().variables)
+
+def test_load_compiled_touched(lut_csv):
+    artifact = lut.compiled_path(lut_csv)
+    load(lut_csv)
+
+    mtime_ns = os.stat(artifact).st_mtime_ns
+    set_mtime(artifact, mtime_ns - 2 * 10 ** 9)
+    set_mtime(lut_csv, mtime_ns - 10 ** 9)
+
+    _, n = load(lut_csv)
+    assert n == 0
+    assert os.stat(artifact).st_mtime_ns > os.stat(lut_csv).st_mtime_ns
+
+    _, n = load(lut_csv)
+    assert n == 0
+
+def test_load_compiled_stale(lut_csv):
+    artifact = lut.compiled_path(lut_csv)
+    load(lut_csv)
+
+    df = pd.read_csv(lut_csv)
+    df.loc[1, 'raw'] = 'changed_raw'
+    df.to_csv(lut_csv, index=False)
+    mtime_ns = os.stat(artifact).st_mtime_ns
+    set_mtime(artifact, mtime_ns - 10 ** 9)
+
+    loaded, n = load(lut_csv)
+    assert n == 1
+    assert loaded.df.loc[1, 'raw'] == 'changed_raw'
+
+    _, n = load(lut_csv)
+    assert n == 0
+
+@pytest.mark.parametrize('changes', [
+    {'version': 'old'},
+    {'pandas': '0.0.0'},
+    {'dept': 'peds'},
+], ids=lambda x: next(iter(x)))
+def test_load_compiled_mismatch(lut_csv, changes):
+    artifact = lut.compiled_path(lut_csv)
+    load(lut_csv)
+    rewrite(artifact, **changes)
+
+    _, n = load(lut_csv)
+    assert n == 1
+
+    with open(artifact, 'rb') as f:
+        compiled = pickle.load(f)
+    assert compiled['version'] == COMPILED_VERSION
+    assert compiled['pandas'] == pd.__version__
+    assert compiled['dept'] == 'epilepsy'
+
+def test_load_compiled_corrupt(lut_csv):
+    artifact = lut.compiled_path(lut_csv)
+    built, _ = load(lut_csv)
+    with open(artifact, 'r+b') as f:
+        f.truncate(100)
+
+    loaded, n = load(lut_csv)
+    assert n == 1
+    assert loaded.lut == built.lut
+
+    _, n = load(lut_csv)
+    assert n == 0
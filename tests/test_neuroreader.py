@@ -0,0 +1,77 @@
+import re
+import random
+
+import pytest
+
+from generate_neuroreader import get_report_pages, write_pdf
+
+from mcw_readers.parsers.neuroreader import (
+    NR_HEADER_MAPPER, NR_RESULTS_MAPPER, NR_TABLE_MAPPER, locate_fields,
+    tokenize_pdf)
+
+# the field locations and mTIV as parse_text found them before locate_fields
+MITV_LOC = 22
+
+def old_get_field_locs(working_data, fields):
+    field_locs = {x:i for i,x in enumerate(working_data) if x in fields}
+
+    not_found = set(fields) - set(field_locs)
+    if not_found:
+        raise Exception(f'Missing fields {not_found}')
+
+    return field_locs
+
+def old_locate_fields(pdf_data):
+    working_data = pdf_data[0] + pdf_data[1]
+
+    field_locs = old_get_field_locs(working_data, NR_HEADER_MAPPER)
+    field_locs.update(old_get_field_locs(working_data, NR_RESULTS_MAPPER))
+    field_locs.update(old_get_field_locs(working_data, NR_TABLE_MAPPER))
+
+    ptn = r'The measured total intracranial volume \(mTIV\) = (\d+) ml.'
+    mtiv = re.search(ptn, pdf_data[0][MITV_LOC]).group(1)
+
+    return working_data, field_locs, mtiv
+
+@pytest.mark.parametrize('seed', range(4))
+def test_locate_fields_matches_old(tmp_path, seed):
+    pages = get_report_pages(random.Random(seed), appendix_tokens=50)
+    pdf_file = str(tmp_path.joinpath('report.pdf'))
+    write_pdf(pdf_file, pages)
+    pdf_data, _ = tokenize_pdf(pdf_file)
+
+    working_data, field_locs, mtiv = locate_fields(pdf_data)
+    old_working_data, old_field_locs, old_mtiv = old_locate_fields(pdf_data)
+
+    assert working_data == old_working_data
+    assert list(field_locs.items()) == list(old_field_locs.items())
+    assert mtiv == old_mtiv
+
+def test_locate_fields_repeated_field():
+    pages = get_report_pages(random.Random(0), appendix_pages=0)
+    pages[1] += ['Age', '99']
+
+    _, field_locs, _ = locate_fields(pages)
+    _, old_field_locs, _ = old_locate_fields(pages)
+
+    assert field_locs == old_field_locs
+
+def test_locate_fields_mtiv_on_page_2():
+    pages = get_report_pages(random.Random(0), appendix_pages=0)
+    sentence = pages[0].pop(MITV_LOC)
+    pages[1].append(sentence)
+
+    _, _, mtiv = locate_fields(pages)
+
+    assert sentence == f'The measured total intracranial volume (mTIV) = {mtiv} ml.'
+
+def test_locate_fields_missing():
+    pages = get_report_pages(random.Random(0), appendix_pages=0)
+    pages[0] = [x for x in pages[0]
+                if x not in {'Gender', 'NR Index'} and '(mTIV)' not in x]
+
+    with pytest.raises(Exception) as e:
+        locate_fields(pages)
+
+    for field in ['Gender', 'NR Index', 'mTIV']:
+        assert repr(field) in str(e.value)
@@ -0,0 +1,260 @@
+import re
+import datetime
+
+import pytest
+import numpy as np
+
+from mcw_readers import utils
+from mcw_readers.interfaces.normalize import (
+    SS_INVALID, SS_STANDARD, SS_SCALED, SS_T, T_NUMBER_FORMAT)
+from mcw_readers.interfaces.sheet import snapshot_cell
+from mcw_readers.interfaces.wb_parsers import (
+    PedsParserError, neuroscore_parser, peds_classify_ss_values, 
+    peds_determine_variable_value, peds_get_ss_variable, 
+    peds_get_ss_variables, peds_parser)
+
+RC_VARIABLES = [f'v_{x}' for x in ['raw', 'ss', 'percentile', 'sign',
+                                   'age_equivalent', 'high_equivalent']]
+
+# the string pattern rules used before the dispatch tables
+def legacy_ss_variable(cell, rc_variables, percentile):
+    value = cell.value
+
+    if value is not None and value not in neuroscore_parser.NAN_VALUES:
+        if cell.data_type == 'n':
+            if cell.number_format == T_NUMBER_FORMAT:
+                variable_values = [
+                    (rc_variables[1], None),
+                    (rc_variables[2], None),
+                    (rc_variables[3], value),
+                ]
+            else:
+                variable_values = peds_determine_variable_value(
+                    value, rc_variables, percentile)
+
+        elif cell.data_type == 's':
+            if cell.number_format == T_NUMBER_FORMAT:
+                postprocessed_value = float(re.sub('[<>]?[ ]*', '', value.strip()))
+
+                variable_values = [
+                    (rc_variables[1], None),
+                    (rc_variables[2], None),
+                    (rc_variables[3], postprocessed_value),
+                ]
+            elif re.fullmatch(r'T[ ]*[>]?\d+', value):
+                postprocessed_value = float(re.sub('T[ ]*[>]?', '', value))
+
+                variable_values = [
+                    (rc_variables[1], None),
+                    (rc_variables[2], None),
+                    (rc_variables[3], postprocessed_value),
+                ]
+
+            elif re.fullmatch(r'[<>][ ]?\d+', value):
+                value = float(re.sub('[<>][ ]?', '', value))
+                variable_values = peds_determine_variable_value(
+                    value, rc_variables, percentile)
+
+            else:
+                variable_values = [(None, value)]
+
+        else:
+            variable_values = [
+                (rc_variables[1], None),
+                (rc_variables[2], None),
+                (rc_variables[3], None),
+            ]
+
+    else:
+        variable_values = [(None, value)]
+
+    return variable_values
+
+def legacy_equivalent_variable(cell, rc_variables):
+    value = cell.value
+
+    if value is not None:
+        if cell.data_type == 's':
+            if re.match('[<>]', value):
+                variable_values = [
+                    (rc_variables[3], value),
+                    (rc_variables[4], None),
+                    (rc_variables[5], None)
+                ]
+            elif re.fullmatch(r'\d+-\d+', value):
+                variable_values = [
+                    (rc_variables[3], value),
+                    (rc_variables[4], None),
+                    (rc_variables[5], None),
+                ]
+            elif re.fullmatch(r'\d+:\d+', value):
+                m = re.fullmatch(r'(\d+):(\d+)', value)
+                n1 = float(m.group(1))
+                n2 = float(m.group(2))
+                variable_values = [
+                        (rc_variables[3], None),
+                        (rc_variables[4], n1 * 12 + n2),
+                        (rc_variables[5], None),
+                ]
+            elif re.fullmatch(r'\d+:\d+-\d+:\d+', value):
+                m = re.fullmatch(r'(\d+):(\d+)-(\d+):(\d+)', value)
+                n1 = float(m.group(1))
+                n2 = float(m.group(2))
+                n3 = float(m.group(3))
+                n4 = float(m.group(4))
+                variable_values = [
+                        (rc_variables[3], None),
+                        (rc_variables[4], n1 * 12 + n2),
+                        (rc_variables[5], n3 * 12 + n4),
+                ]
+            else:
+                variable_values = [(None, value)]
+
+        elif cell.data_type == 'n':
+            variable_values = [
+                (rc_variables[3], None),
+                (rc_variables[4], float(value)),
+                (rc_variables[5], None),
+            ]
+
+        else:
+            variable_values = [(None, value)]
+
+    else:
+        variable_values = [
+            (rc_variables[3], None),
+            (rc_variables[4], None),
+            (rc_variables[5], None),
+        ]
+
+    return variable_values
+
+def make_cell(value, data_type, number_format='General'):
+    return snapshot_cell(8, 5, value, data_type, number_format, 0.0)
+
+def outcome(f, *args):
+    """Returns the result of f, or the type of the exception it raised"""
+
+    try:
+        return f(*args)
+    except PedsParserError as e:
+        return type(e)
+
+SS_CELLS = [
+    (104, 'n'),
+    (100, 'n'),
+    (12, 'n'),
+    (45, 'n'),
+    (45, 'n', T_NUMBER_FORMAT),
+    (60.0, 'n', T_NUMBER_FORMAT),
+    ('T 45', 's'),
+    ('T45', 's'),
+    ('T>60', 's'),
+    ('T  >60', 's'),
+    ('T 4a', 's'),
+    ('<5', 's'),
+    ('> 5', 's'),
+    ('>  5', 's'),
+    ('<104', 's'),
+    ('45 ', 's', T_NUMBER_FORMAT),
+    ('<45', 's', T_NUMBER_FORMAT),
+    ('> 45', 's', T_NUMBER_FORMAT),
+    ('see notes', 's'),
+    ('5', 's'),
+    ('Score', 's'),
+    ('#N/A', 'e'),
+    (True, 'b'),
+    (datetime.datetime(2020, 1, 1), 'd'),
+    (None, 'n'),
+]
+
+EQUIVALENT_CELLS = [
+    (7.5, 'n'),
+    (7, 'n'),
+    (7, 'n', T_NUMBER_FORMAT),
+    ('<5:0', 's'),
+    ('> 17', 's'),
+    ('<', 's'),
+    ('5-6', 's'),
+    ('5 - 6', 's'),
+    ('5:3', 's'),
+    ('5:3-6:0', 's'),
+    ('5:3-6', 's'),
+    ('5:3 ', 's'),
+    ('5:3\n', 's'),
+    ('see notes', 's'),
+    ('', 's'),
+    (True, 'b'),
+    (datetime.datetime(2020, 1, 1), 'd'),
+    (None, 'n'),
+]
+
+@pytest.mark.parametrize('percentile', [1.0, 9.0, 50.0, 84.0, float('nan')])
+@pytest.mark.parametrize('args', SS_CELLS, ids=repr)
+def test_ss_dispatch_matches_legacy(args, percentile):
+    cell = make_cell(*args)
+
+    assert (outcome(peds_get_ss_variable, cell, RC_VARIABLES, percentile) ==
+            outcome(legacy_ss_variable, cell, RC_VARIABLES, percentile))
+
+@pytest.mark.parametrize('args', EQUIVALENT_CELLS, ids=repr)
+def test_equivalent_dispatch_matches_legacy(args):
+    cell = make_cell(*args)
+
+    assert (peds_parser._get_equivalent_variable(None, cell, RC_VARIABLES) ==
+            legacy_equivalent_variable(cell, RC_VARIABLES))
+
+PERCENTILES = sorted(utils.DICT_PSYCHOMETRIC['standard_score']) + [np.nan]
+
+def scalar_score_type(value, percentile):
+    """Returns the score type peds_determine_variable_value picks"""
+
+    try:
+        variable_values = peds_determine_variable_value(value, RC_VARIABLES, 
+                                                        percentile)
+    except PedsParserError:
+        return SS_INVALID
+
+    for score_type in [SS_STANDARD, SS_SCALED, SS_T]:
+        if variable_values[score_type - 1][1] is not None:
+            return score_type
+
+def test_classify_ss_values_matches_scalar():
+    values = np.concatenate([np.arange(-2, 160.5, 0.5), [0.1, 20.9, 21.1, 
+                                                         79.9, 149.9]])
+    for percentile in PERCENTILES:
+        expected = [scalar_score_type(x, percentile) for x in values]
+        actual = peds_classify_ss_values(values, [percentile] * len(values))
+        assert actual.tolist() == expected, percentile
+
+def test_classify_ss_values_mixed_percentiles():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 160, 2000).astype(float)
+    percentiles = rng.choice(PERCENTILES, 2000)
+
+    expected = [scalar_score_type(x, p) for x, p in zip(values, percentiles)]
+    assert peds_classify_ss_values(values, percentiles).tolist() == expected
+
+def test_classify_ss_values_unknown_percentile():
+    with pytest.raises(KeyError):
+        peds_determine_variable_value(100, RC_VARIABLES, 50.5)
+    with pytest.raises(KeyError):
+        peds_classify_ss_values([100, 100], [50.0, 50.5])
+
+@pytest.mark.parametrize('percentile', [1.0, 9.0, 50.0, 84.0, float('nan')])
+def test_get_ss_variables_matches_scalar(percentile):
+    # no percentile accepts a negative score
+    cells = [make_cell(*x) for x in SS_CELLS + [(-5, 'n')]]
+    valid = [x for x in cells 
+             if outcome(peds_get_ss_variable, x, RC_VARIABLES, percentile) 
+                is not PedsParserError]
+    assert len(valid) < len(cells)
+
+    expected = [peds_get_ss_variable(x, RC_VARIABLES, percentile) 
+                for x in valid]
+    assert peds_get_ss_variables(valid, [RC_VARIABLES] * len(valid), 
+                                 [percentile] * len(valid)) == expected
+
+    with pytest.raises(PedsParserError):
+        peds_get_ss_variables(cells, [RC_VARIABLES] * len(cells), 
+                              [percentile] * len(cells))
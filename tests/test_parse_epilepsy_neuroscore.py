@@ -0,0 +1,214 @@
+import io
+import os
+import json
+import time
+import shutil
+
+import pytest
+import pandas as pd
+
+from tests.conftest import SPEC_COLUMNS, make_epilepsy_workbook
+from mcw_readers.cli.parse_epilepsy_neuroscore import (
+    format_value, group_rows, iter_prefetched_rows, parse_file, read_file, 
+    read_spec)
+from mcw_readers.interfaces.wb_parsers import neuroscore_parser
+
+def test_read_spec_exams(tmp_path):
+    spec = tmp_path.joinpath('spec.tsv')
+    spec.write_text('record_id\tredcap_repeat_instance\tneuroscore\texam\n'
+                    '1\t1\ta.xlsx\tA\n'
+                    '1\t2\ta.xlsx\tb\n'
+                    '1\t3\ta.xlsx\tC\n'
+                    '1\t4\ta.xlsx\tD\n'
+                    '1\t5\ta.xlsx\t\n')
+
+    assert [x.exam_num for x in read_spec(spec)] == [1, 2, 3, None, None]
+
+def test_exam_rows(run_cli, epilepsy_workbooks, epilepsy_lut):
+    path, n_exams = epilepsy_workbooks[0]
+    assert n_exams == 3
+    two_exams, _ = epilepsy_workbooks[1]
+
+    rows = [
+        (100, 1, path, 'A'),
+        (100, 2, path, 'B'),
+        (100, 3, path, 'C'),
+        (100, 4, path, 'D'),
+        (101, 1, two_exams, 'c'),
+    ]
+    outputs, process = run_cli(rows)
+
+    assert 'record_id 100 redcap_repeat_instance 4: unknown exam' in process.stdout
+    assert '1 rows have an unknown exam' in process.stdout
+
+    redcap = pd.read_csv(io.BytesIO(outputs['redcap']), dtype=str, 
+                         keep_default_na=False)
+    assert redcap[['record_id', 'redcap_repeat_instance']].values.tolist() == [
+        ['100', '1'], ['100', '2'], ['100', '3'], ['101', '1']]
+
+    parser = neuroscore_parser(path, verbose=False)
+    variables = epilepsy_lut.get_column_plan().variables
+    for i, tp in enumerate([1, 2, 3]):
+        row, _, _ = parser.parse_plan(epilepsy_lut, tp)
+        expected = {variables[x]: row.values[x] for x in row.order
+                    if not pd.isna(row.values[x])}
+        assert expected
+        actual = redcap.iloc[i][list(expected)].tolist()
+        assert actual == [format_value(x) for x in expected.values()]
+
+    # exam C of a workbook with two exams has no scores
+    scores = redcap.iloc[3].drop(['record_id', 'redcap_repeat_instrument',
+                                  'redcap_repeat_instance'])
+    assert (scores == '').all()
+
+def spec_rows(workbooks):
+    """Returns a spec row for every exam of the workbooks"""
+
+    return [(100 + n, tp + 1, path, 'ABC'[tp]) 
+            for n, (path, n_exams) in enumerate(workbooks)
+            for tp in range(n_exams)]
+
+@pytest.mark.parametrize('args', [
+    ['--jobs', '2'],
+    ['--prefetch', '2', '--jobs', '2'],
+    ['--engine', 'stream'],
+    ['--resume'],
+], ids=' '.join)
+def test_matches_serial(run_cli, epilepsy_workbooks, args):
+    rows = spec_rows(epilepsy_workbooks)
+    expected, _ = run_cli(rows, 'serial')
+    actual, _ = run_cli(rows, 'other', *args)
+
+    assert set(expected) == {'redcap', 'new_lines', 'missing_lines', 
+                             'new_lines_summary'}
+    assert actual == expected
+
+def test_stream_matches_serial(run_cli, epilepsy_workbooks):
+    rows = spec_rows(epilepsy_workbooks)
+    expected, _ = run_cli(rows, 'serial')
+    actual, _ = run_cli(rows, 'stream', '--stream')
+
+    for suffix in ['new_lines', 'missing_lines', 'new_lines_summary']:
+        assert actual[suffix] == expected[suffix]
+
+    # the streamed rows have a column for every variable of the lut
+    expected = pd.read_csv(io.BytesIO(expected['redcap']), dtype=str, 
+                           keep_default_na=False)
+    actual = pd.read_csv(io.BytesIO(actual['redcap']), dtype=str, 
+                         keep_default_na=False)
+    extra = actual.columns.difference(expected.columns)
+    assert (actual[extra] == '').all().all()
+    assert actual[expected.columns].equals(expected)
+
+def slow_reader(fname):
+    """Reads fname like a slow network share"""
+
+    time.sleep(0.5)
+    return read_file(fname)
+
+def test_prefetch_overlaps_reads(tmp_path, epilepsy_workbooks, epilepsy_lut):
+    spec = tmp_path.joinpath('spec.tsv')
+    pd.DataFrame(spec_rows(epilepsy_workbooks), columns=SPEC_COLUMNS).to_csv(
+        spec, sep='\t', index=False)
+    rows = list(read_spec(spec))
+
+    start = time.perf_counter()
+    serial = []
+    for neuroscore, _, group in group_rows(rows):
+        serial += parse_file(epilepsy_lut, neuroscore, group, 
+                             source=slow_reader(neuroscore))
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prefetched = list(iter_prefetched_rows(epilepsy_lut, rows, jobs=1, 
+                                           prefetch=4, reader=slow_reader))
+    prefetch_time = time.perf_counter() - start
+
+    assert len(prefetched) == len(serial) == len(rows)
+    assert pd.DataFrame([x[0] for x in prefetched]).equals(
+        pd.DataFrame([x[0] for x in serial]))
+    assert prefetch_time < serial_time
+
+@pytest.fixture
+def resume_workbooks(tmp_path, epilepsy_workbooks):
+    """Returns copies of epilepsy_workbooks that a test may change"""
+
+    out_dir = tmp_path.joinpath('workbooks')
+    out_dir.mkdir()
+
+    workbooks = []
+    for path, n_exams in epilepsy_workbooks:
+        copy = out_dir.joinpath(os.path.basename(path))
+        shutil.copyfile(path, copy)
+        workbooks.append((str(copy), n_exams))
+
+    return workbooks
+
+def run_resume(run_cli, tmp_path, rows, name):
+    """
+    Runs --resume over rows in the resume directory, then a clean serial
+    run named name.
+
+    Returns the outputs of both runs and the (record_id,
+    redcap_repeat_instance) of the rows the resumed run parsed.
+    """
+
+    log_file = tmp_path.joinpath('resume', 'log.jsonl')
+    if log_file.exists():
+        log_file.unlink()
+
+    outputs, _ = run_cli(rows, 'resume', '--resume', '--log-json', 
+                         str(log_file))
+    with open(log_file) as f:
+        parsed = {(x['record_id'], x['redcap_repeat_instance']) 
+                  for x in map(json.loads, f)
+                  if x['event'] == 'Working on row %d / %d'}
+
+    expected, _ = run_cli(rows, name)
+
+    return outputs, expected, parsed
+
+def spec_ids(rows):
+    return {(x[0], x[1]) for x in rows}
+
+def test_resume_partial(run_cli, tmp_path, resume_workbooks):
+    rows = spec_rows(resume_workbooks)
+    run_cli(rows[:4], 'resume', '--resume')
+
+    outputs, expected, parsed = run_resume(run_cli, tmp_path, rows, 'serial')
+    assert outputs == expected
+    assert parsed == spec_ids(rows[4:])
+
+    # every row is in the manifest
+    outputs, expected, parsed = run_resume(run_cli, tmp_path, rows, 'serial')
+    assert outputs == expected
+    assert parsed == set()
+
+def test_resume_changed_workbook(run_cli, tmp_path, resume_workbooks):
+    rows = spec_rows(resume_workbooks)
+    run_cli(rows, 'resume', '--resume')
+
+    path, n_exams = resume_workbooks[1]
+    make_epilepsy_workbook(path, seed=10, n_exams=n_exams)
+
+    outputs, expected, parsed = run_resume(run_cli, tmp_path, rows, 'serial')
+    assert outputs == expected
+    assert parsed == spec_ids(x for x in rows if x[2] == path)
+
+def test_resume_failed_row(run_cli, tmp_path, resume_workbooks):
+    rows = spec_rows(resume_workbooks)
+    path, _ = resume_workbooks[2]
+    with open(path, 'rb') as f:
+        workbook = f.read()
+    with open(path, 'wb') as f:
+        f.write(b'not a workbook')
+
+    _, process = run_cli(rows, 'resume', '--resume')
+    assert '1 rows failed' in process.stdout
+
+    with open(path, 'wb') as f:
+        f.write(workbook)
+
+    outputs, expected, parsed = run_resume(run_cli, tmp_path, rows, 'serial')
+    assert outputs == expected
+    assert parsed == spec_ids(x for x in rows if x[2] == path)